@@ -6,7 +6,9 @@ Handles ASL sign recognition and analysis using OpenRouter API
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
 from typing import Dict, Any, Optional
 from auth import get_current_user
+from principal import Principal
 from config import settings
+from rate_limit import RateLimit
 from openai import OpenAI
 import base64
 from io import BytesIO
@@ -37,13 +39,14 @@ def get_openai_client() -> OpenAI:
         },
     )
 
-@router.post("/analyze")
+# Each call is a paid, multi-second model request, so callers get a token bucket (settings.rate_limits)
+@router.post("/analyze", dependencies=[Depends(RateLimit("asl_analyze"))])
 async def analyze_asl_sign(
     request: Request,
     image: UploadFile = File(..., description="Image file containing ASL sign"),
     letter_range: str = Form(..., description="Letter range: 'A-N' or 'O-Z'"),
     expected_letter: str = Form(..., description="The letter the user should be signing"),
-    current_user: Dict[str, Any] = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Analyze ASL sign from uploaded image
@@ -249,7 +252,7 @@ async def analyze_asl_sign(
             is_correct = False
         
         # Log the analysis for debugging (optional)
-        logger.info(f"ASL analysis completed for user {current_user['id']}, letter_range: {letter_range}, expected: {expected_letter}, analyzed: {analyzed_letter}, correct: {is_correct}")
+        logger.info(f"ASL analysis completed for user {current_user.id}, letter_range: {letter_range}, expected: {expected_letter}, analyzed: {analyzed_letter}, correct: {is_correct}")
         
         return {
             "success": True,
@@ -259,7 +262,7 @@ async def analyze_asl_sign(
             "analyzed_letter": analyzed_letter,
             "is_correct": is_correct,
             "score": score,
-            "user_id": current_user["id"],
+            "user_id": current_user.id,
             "model_used": "gpt-4o-mini"
         }
         
@@ -276,7 +279,7 @@ async def analyze_asl_sign(
 @router.post("/test")
 async def test_endpoint(
     request: Request,
-    current_user: Dict[str, Any] = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Test endpoint to debug form data issues
@@ -287,14 +290,14 @@ async def test_endpoint(
         return {
             "success": True,
             "form_data": dict(form_data),
-            "user_id": current_user["id"]
+            "user_id": current_user.id
         }
     except Exception as e:
         logger.error(f"Test endpoint error: {e}")
         return {"success": False, "error": str(e)}
 
 @router.get("/health")
-async def asl_health_check(current_user: Dict[str, Any] = Depends(get_current_user)):
+async def asl_health_check(current_user: Principal = Depends(get_current_user)):
     """
     Health check for ASL analysis service
     """
@@ -306,7 +309,7 @@ async def asl_health_check(current_user: Dict[str, Any] = Depends(get_current_us
             "status": "healthy",
             "service": "ASL Analysis",
             "api_configured": bool(settings.openai_api_key),
-            "user_id": current_user["id"]
+            "user_id": current_user.id
         }
     except Exception as e:
         logger.error(f"ASL health check failed: {e}")
@@ -3,13 +3,18 @@ Supabase Authentication for FastAPI Backend
 Handles JWT token verification and user authentication
 """
 
-from fastapi import HTTPException, Depends, status
+from fastapi import HTTPException, Depends, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import create_client, Client
-from jose import JWTError, jwt
-from typing import Optional, Dict, Any
-import os
+from typing import Optional, Iterable
+from functools import lru_cache
+import hashlib
 from config import settings
+from token_cache import token_cache, token_digest
+from principal import Principal
+from jwks import ASYMMETRIC_ALGORITHMS, get_jwks
+from jwt_backends import InvalidToken, get_jwt_backend
+from revocation import get_revocation_list
 
 # Initialize Supabase client (lazy initialization)
 def get_supabase_client() -> Client:
@@ -26,69 +31,98 @@ def get_supabase_client() -> Client:
     )
 
 # Security scheme
-security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+@lru_cache(maxsize=4)
+def _digest_key(secret: str) -> bytes:
+    return hashlib.sha256(secret.encode("utf-8")).digest()
+
+def _reject_if_revoked(principal: Principal) -> Principal:
+    if get_revocation_list().is_revoked(principal):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
 
 class SupabaseAuth:
     """Supabase authentication handler"""
     
     @staticmethod
-    def verify_jwt_token(token: str) -> Dict[str, Any]:
+    def verify_jwt_token(token: str) -> Principal:
         """
-        Verify JWT token and return user data
+        Verify JWT token and return the user it was issued to
         
         Args:
             token: JWT token from Authorization header
             
         Returns:
-            Dict containing user information
+            Principal for the token's user
             
         Raises:
             HTTPException: If token is invalid or expired
         """
         try:
-            # Decode JWT token without verification first to get header
-            unverified_header = jwt.get_unverified_header(token)
-            
             # Get the JWT secret from Supabase (this is the JWT secret, not the publishable key)
             jwt_secret = settings.supabase_jwt_secret
             
-            if not jwt_secret:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="JWT secret not configured",
-                )
+            # A token verified on an earlier request skips signature checks until its exp,
+            # but not the revocation check
+            digest = token_digest(token, _digest_key(jwt_secret))
+            cached = token_cache.get(digest)
+            if cached is not None:
+                return _reject_if_revoked(cached)
+            
+            # The JWT library configured in settings.auth_jwt_backend
+            backend = get_jwt_backend()
+            
+            # Decode JWT token without verification first to get header
+            unverified_header = backend.get_unverified_header(token)
+            algorithm = unverified_header.get("alg")
+            
+            if algorithm in ASYMMETRIC_ALGORITHMS:
+                # Asymmetric signing keys: look the key up by kid in the cached JWKS
+                jwks = get_jwks()
+                signing_key = jwks.get(unverified_header.get("kid")) if jwks else None
+                if signing_key is None or signing_key[0] != algorithm:
+                    raise HTTPException(
+                        status_code=status.HTTP_401_UNAUTHORIZED,
+                        detail="Unknown token signing key",
+                        headers={"WWW-Authenticate": "Bearer"},
+                    )
+                verification_key = signing_key[1]
+            else:
+                if not jwt_secret:
+                    raise HTTPException(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        detail="JWT secret not configured",
+                    )
+                verification_key, algorithm = jwt_secret, "HS256"
             
             # Verify and decode the token
-            payload = jwt.decode(
+            payload = backend.decode(
                 token,
-                jwt_secret,
-                algorithms=["HS256"],
+                verification_key,
+                algorithm,
                 audience="authenticated"
             )
             
-            # Extract user information from the payload
-            user_id = payload.get("sub")
-            email = payload.get("email")
-            user_metadata = payload.get("user_metadata", {})
-            app_metadata = payload.get("app_metadata", {})
-            
-            if not user_id:
+            if not payload.get("sub"):
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Invalid token payload",
                     headers={"WWW-Authenticate": "Bearer"},
                 )
             
-            return {
-                "id": user_id,
-                "email": email,
-                "user_metadata": user_metadata,
-                "app_metadata": app_metadata,
-                "created_at": payload.get("iat"),  # Issued at
-                "updated_at": payload.get("exp")   # Expires at
-            }
+            # Immutable, so the cached object is handed to every request that presents this token
+            principal = _reject_if_revoked(Principal(payload))
+            token_cache.put(digest, principal, payload.get("exp"), principal.id)
+            return principal
             
-        except JWTError as e:
+        except HTTPException:
+            raise
+        except InvalidToken as e:
             print(f"JWT verification error: {e}")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -103,50 +137,123 @@ class SupabaseAuth:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+class AuthMiddleware:
+    """
+    Verify the bearer token once per request, at the ASGI layer
+
+    The outcome is stored on request.state (auth_token, user, auth_error)
+    for the async dependencies below, so a route with several auth
+    dependencies never verifies twice and no dependency needs a threadpool
+    hop. Requests without a token, and paths under skip_paths, pass through
+    untouched; rejecting is left to the dependencies, so public routes are
+    unaffected by a bad token. Verification runs inline on the event loop:
+    a cached token costs a few microseconds and a full HS256/RS256 check
+    less than the threadpool hop it replaces.
+    """
+
+    def __init__(self, app, skip_paths: Iterable[str] = ()):
+        self.app = app
+        self.skip_paths = tuple(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.skip_paths):
+            token = bearer_token(scope)
+            if token is not None:
+                state = scope.setdefault("state", {})
+                state["auth_token"] = token
+                try:
+                    state["user"], state["auth_error"] = SupabaseAuth.verify_jwt_token(token), None
+                except HTTPException as e:
+                    state["user"], state["auth_error"] = None, e
+        await self.app(scope, receive, send)
+
+
+def bearer_token(scope) -> Optional[str]:
+    """The token from an "Authorization: Bearer" header, if any"""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            # Split the same way HTTPBearer does, so the dependency sees the same token
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            return token
+    return None
+
+
+def resolve_user(request: Request, token: str) -> Principal:
+    """
+    The verified user for token, reusing AuthMiddleware's result when it saw the same token
+
+    Raises:
+        HTTPException: If authentication fails
+    """
+    state = request.state
+    if getattr(state, "auth_token", None) == token:
+        if state.auth_error is not None:
+            raise state.auth_error
+        return state.user
+    # Skipped path, or an app without the middleware
+    return SupabaseAuth.verify_jwt_token(token)
+
+async def get_current_user(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+) -> Principal:
     """
     Dependency to get current authenticated user
     
     Args:
+        request: The current request (carries AuthMiddleware's result)
         credentials: HTTP Bearer token from request header
         
     Returns:
-        Dict containing user information
+        Principal for the authenticated user
         
     Raises:
         HTTPException: If authentication fails
     """
-    token = credentials.credentials
-    return SupabaseAuth.verify_jwt_token(token)
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authenticated"
+        )
+    return resolve_user(request, credentials.credentials)
 
-def get_current_user_optional(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[Dict[str, Any]]:
+async def get_current_user_optional(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+) -> Optional[Principal]:
     """
     Optional dependency to get current user (doesn't raise exception if no token)
     
     Args:
+        request: The current request (carries AuthMiddleware's result)
         credentials: Optional HTTP Bearer token from request header
         
     Returns:
-        Dict containing user information or None if not authenticated
+        Principal for the user, or None if not authenticated
     """
     if not credentials:
         return None
     
     try:
-        token = credentials.credentials
-        return SupabaseAuth.verify_jwt_token(token)
+        return resolve_user(request, credentials.credentials)
     except HTTPException:
         return None
 
-# User model for type hints
-class User:
-    def __init__(self, user_data: Dict[str, Any]):
-        self.id = user_data["id"]
-        self.email = user_data["email"]
-        self.user_metadata = user_data.get("user_metadata", {})
-        self.app_metadata = user_data.get("app_metadata", {})
-        self.created_at = user_data.get("created_at")
-        self.updated_at = user_data.get("updated_at")
+async def get_current_admin(current_user: Principal = Depends(get_current_user)) -> Principal:
+    """
+    Dependency to get the current user and require the admin role
+    
+    The role is read from app_metadata ({"role": "admin"}), which only the
+    service role can set; user_metadata is editable by the user themselves.
     
-    def __str__(self):
-        return f"User(id={self.id}, email={self.email})"
+    Raises:
+        HTTPException: 403 if the user is not an admin
+    """
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
@@ -0,0 +1,266 @@
+"""
+Authentication overhead benchmark
+
+Drives an in-process ASGI app through httpx and reports per-request latency
+for the same routes authenticated two ways: the original synchronous
+dependencies (one threadpool hop, and one verification, per auth
+dependency) and AuthMiddleware with the async dependencies that read
+request.state. A public route called without a token gives the framework
+baseline, so overhead is the auth route's latency minus the public route's.
+
+It also measures the bytes each request allocates to represent the caller:
+the original per-request user dict plus auth.User wrapper, against the
+shared immutable Principal.
+
+Usage (from the repository root):
+    python benchmarks/auth_bench.py --requests 2000 --output auth_bench.json
+"""
+
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI, HTTPException  # noqa: E402
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer  # noqa: E402
+from jose import jwt  # noqa: E402
+from config import settings  # noqa: E402
+import auth  # noqa: E402
+from principal import Principal  # noqa: E402
+from token_cache import token_cache  # noqa: E402
+
+SECRET = "benchmark-jwt-secret-with-at-least-32-bytes"
+
+# The scheme the original dependency used (auth now uses optional_security only)
+legacy_security = HTTPBearer()
+
+
+def make_token(user_id: str = "5f0c7f4e-8a4e-4c1e-9d0b-3f5c2a1b7e90") -> str:
+    """A token shaped like a Supabase access token"""
+    now = int(time.time())
+    return jwt.encode({
+        "aud": "authenticated",
+        "exp": now + 3600,
+        "iat": now,
+        "iss": "https://project.supabase.co/auth/v1",
+        "sub": user_id,
+        "email": "learner@example.com",
+        "phone": "",
+        "app_metadata": {"provider": "email", "providers": ["email"]},
+        "user_metadata": {"full_name": "Benchmark Learner", "learning_goals": "fingerspelling", "is_admin": True},
+        "role": "authenticated",
+        "aal": "aal1",
+        "amr": [{"method": "password", "timestamp": now}],
+        "session_id": "0d9d5a52-6c8e-4a4f-bb1c-6a3a9b1f2c11",
+    }, SECRET, algorithm="HS256")
+
+
+def legacy_get_current_user(credentials: HTTPAuthorizationCredentials = Depends(legacy_security)) -> Principal:
+    """The original synchronous dependency, kept as the baseline"""
+    return auth.SupabaseAuth.verify_jwt_token(credentials.credentials)
+
+
+def legacy_get_current_user_optional(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(auth.optional_security),
+) -> Optional[Principal]:
+    if not credentials:
+        return None
+    try:
+        return auth.SupabaseAuth.verify_jwt_token(credentials.credentials)
+    except HTTPException:
+        return None
+
+
+class LegacyUser:
+    """The original auth.User wrapper, kept as the baseline"""
+
+    def __init__(self, user_data: Dict[str, Any]):
+        self.id = user_data["id"]
+        self.email = user_data["email"]
+        self.user_metadata = user_data.get("user_metadata", {})
+        self.app_metadata = user_data.get("app_metadata", {})
+        self.created_at = user_data.get("created_at")
+        self.updated_at = user_data.get("updated_at")
+
+
+def legacy_verify(token: str) -> Dict[str, Any]:
+    """The original verification: decode, then build a fresh user dict"""
+    payload = jwt.decode(token, SECRET, algorithms=["HS256"], audience="authenticated")
+    return {
+        "id": payload.get("sub"),
+        "email": payload.get("email"),
+        "user_metadata": payload.get("user_metadata", {}),
+        "app_metadata": payload.get("app_metadata", {}),
+        "created_at": payload.get("iat"),
+        "updated_at": payload.get("exp"),
+    }
+
+
+def measure_allocations(call, iterations: int) -> Dict[str, Any]:
+    """Bytes allocated per call and still held while its request is in flight, and peak bytes per call"""
+    call()
+    tracemalloc.start()
+    held = []
+    before, _ = tracemalloc.get_traced_memory()
+    held.extend(call() for _ in range(iterations))
+    after, _ = tracemalloc.get_traced_memory()
+    peaks = []
+    for _ in range(min(iterations, 100)):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return {
+        "held_bytes_per_request": round((after - before) / iterations - 8, 1),  # minus the list slot
+        "alloc_peak_bytes": int(statistics.median(peaks)),
+    }
+
+
+def allocation_results(token: str, iterations: int) -> List[Dict[str, Any]]:
+    results = []
+    for cached in (False, True):
+        token_cache.max_entries = settings.auth_token_cache_size or 10000 if cached else 0
+        token_cache.clear()
+        legacy_cache = {token: legacy_verify(token)} if cached else {}
+
+        def legacy_request():
+            # What /my-data did: a dict per request (a copy on a cache hit), wrapped in auth.User
+            user = legacy_cache.get(token)
+            user = dict(user) if user is not None else legacy_verify(token)
+            wrapped = LegacyUser(user)
+            wrapped.user_metadata.get("full_name")
+            return wrapped
+
+        def principal_request():
+            principal = auth.SupabaseAuth.verify_jwt_token(token)
+            principal.user_metadata.get("full_name")
+            return principal
+
+        for mode, call in (("legacy", legacy_request), ("principal", principal_request)):
+            result = {"mode": mode, "token_cache": cached, **measure_allocations(call, iterations)}
+            results.append(result)
+            print(f"{mode:<10} cache={'on ' if cached else 'off'} held={result['held_bytes_per_request']}B "
+                  f"peak={result['alloc_peak_bytes']}B", file=sys.stderr)
+    return results
+
+
+def build_app(middleware: bool) -> FastAPI:
+    app = FastAPI()
+    current_user = auth.get_current_user if middleware else legacy_get_current_user
+    optional_user = auth.get_current_user_optional if middleware else legacy_get_current_user_optional
+    if middleware:
+        app.add_middleware(auth.AuthMiddleware, skip_paths=settings.auth_skip_paths)
+
+    @app.get("/public")
+    async def public():
+        return {"ok": True}
+
+    @app.get("/me")
+    async def me(user: Principal = Depends(current_user)):
+        return {"id": user.id}
+
+    @app.get("/me-and-optional")
+    async def me_and_optional(user: Principal = Depends(current_user),
+                              maybe: Optional[Principal] = Depends(optional_user)):
+        return {"id": user.id, "same": maybe is not None and maybe.id == user.id}
+
+    return app
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+async def measure(app: FastAPI, path: str, token: str, requests: int) -> Dict[str, Any]:
+    """
+    Latency of path, interleaved request by request with the public route so
+    both see the same machine noise
+    """
+    verifications = 0
+    verify = auth.SupabaseAuth.verify_jwt_token
+
+    def counting_verify(value: str) -> Dict[str, Any]:
+        nonlocal verifications
+        verifications += 1
+        return verify(value)
+
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies: Dict[str, List[float]] = {"/public": [], path: []}
+    auth.SupabaseAuth.verify_jwt_token = staticmethod(counting_verify)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for _ in range(min(50, requests)):  # warm up
+                (await client.get(path, headers=headers)).raise_for_status()
+            verifications = 0
+            for _ in range(requests):
+                for target in latencies:
+                    started = time.perf_counter()
+                    # The baseline goes without a token, so the middleware does no work for it
+                    (await client.get(target, headers=headers if target == path else None)).raise_for_status()
+                    latencies[target].append((time.perf_counter() - started) * 1e6)
+    finally:
+        auth.SupabaseAuth.verify_jwt_token = staticmethod(verify)
+    samples = latencies[path]
+    return {
+        "p50_us": round(percentile(samples, 50), 1),
+        "p99_us": round(percentile(samples, 99), 1),
+        "mean_us": round(statistics.fmean(samples), 1),
+        "overhead_p50_us": round(percentile(samples, 50) - percentile(latencies["/public"], 50), 1),
+        "verifications_per_request": round(verifications / requests, 2),
+    }
+
+
+async def run(requests: int) -> List[Dict[str, Any]]:
+    settings.supabase_jwt_secret = SECRET
+    token = make_token()
+    results = []
+    for cache_size in (0, settings.auth_token_cache_size or 10000):
+        token_cache.max_entries = cache_size
+        token_cache.clear()
+        for mode in ("legacy", "middleware"):
+            app = build_app(middleware=mode == "middleware")
+            for path in ("/me", "/me-and-optional"):
+                result = await measure(app, path, token, requests)
+                result.update({"mode": mode, "path": path, "token_cache": cache_size > 0})
+                results.append(result)
+                print(f"{mode:<10} cache={'on ' if cache_size else 'off'} {path:<17} p50={result['p50_us']:.1f}us "
+                      f"overhead={result['overhead_p50_us']:.1f}us verifications={result['verifications_per_request']}",
+                      file=sys.stderr)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "auth",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "requests": args.requests,
+        "results": asyncio.run(run(args.requests)),
+        "allocations": allocation_results(make_token(), args.requests),
+    }
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+In-process stand-in for the parts of the Supabase client the leaderboard uses
+Implements the PostgREST table query builder (select/order/range/limit/eq/gt/
+in_/maybe_single) and the leaderboard RPCs from migrations/ over a list of
+rows, and counts the JSON bytes every response would put on the wire
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+
+
+class FakeResponse:
+    def __init__(self, data: Any):
+        self.data = data
+        self.error = None
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeSupabase", table: str):
+        self._client = client
+        self._table = table
+        self._columns: Optional[List[str]] = None
+        self._orders: List[Tuple[str, bool]] = []
+        self._filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self._lower_bounds: List[Tuple[str, Any, Callable[[Dict[str, Any]], bool]]] = []
+        self._id: Optional[Any] = None
+        self._offset = 0
+        self._limit: Optional[int] = None
+        self._single = False
+
+    def select(self, columns: str) -> "FakeQuery":
+        self._columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "FakeQuery":
+        self._orders.append((column, desc))
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        if column == "id":
+            self._id = value  # primary key lookup
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column: str, value: Any) -> "FakeQuery":
+        predicate = lambda row: row.get(column) is not None and row.get(column) > value
+        self._filters.append(predicate)
+        self._lower_bounds.append((column, value, predicate))
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> "FakeQuery":
+        wanted = set(values)
+        self._filters.append(lambda row: row.get(column) in wanted)
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def limit(self, count: int) -> "FakeQuery":
+        self._limit = count
+        return self
+
+    def maybe_single(self) -> "FakeQuery":
+        self._single = True
+        return self
+
+    def execute(self) -> FakeResponse:
+        if self._id is not None:
+            row = self._client.by_id.get(self._id)
+            rows = [row] if row is not None else []
+        else:
+            rows = self._client.sorted_rows(tuple(self._orders))
+        start, early_stop = 0, None
+        # Rows come out sorted by the first order column, so a gt filter on it
+        # is a seek (ascending) or a point where matching stops for good (descending)
+        for column, value, predicate in self._lower_bounds if self._id is None else []:
+            if self._orders[:1] == [(column, False)]:
+                start = bisect_right(self._client.column_values(tuple(self._orders), column), value)
+            elif self._orders[:1] == [(column, True)]:
+                early_stop = predicate
+        result: List[Dict[str, Any]] = []
+        skipped = 0
+        for row in rows[start:] if start else rows:
+            if early_stop is not None and not early_stop(row):
+                break
+            if not all(f(row) for f in self._filters):
+                continue
+            if skipped < self._offset:
+                skipped += 1
+                continue
+            result.append({c: row.get(c) for c in self._columns} if self._columns else dict(row))
+            if self._limit is not None and len(result) >= self._limit:
+                break
+        data: Any = result
+        if self._single:
+            data = result[0] if result else None
+        return self._client.respond(data)
+
+
+class FakeRpc:
+    def __init__(self, client: "FakeSupabase", function: str, params: Dict[str, Any]):
+        self._client = client
+        self._function = function
+        self._params = params
+
+    def execute(self) -> FakeResponse:
+        handler = getattr(self._client, f"_rpc_{self._function}")
+        return self._client.respond(handler(**self._params))
+
+
+class FakeSupabase:
+    """Fake client over a users table held as a list of row dicts"""
+
+    def __init__(self, users: List[Dict[str, Any]]):
+        self.users = users
+        self.bytes_sent = 0
+        self.round_trips = 0
+        self._sorted: Dict[Tuple[Tuple[str, bool], ...], List[Dict[str, Any]]] = {}
+        self._columns: Dict[Any, List[Any]] = {}
+        board = self.sorted_rows((("score", True), ("created_at", False), ("id", False)))
+        self.by_id = {row["id"]: row for row in users}
+        self._board_pos = {row["id"]: i for i, row in enumerate(board)}
+        self._neg_distinct = sorted({-row["score"] for row in users})
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, function: str, params: Dict[str, Any]) -> FakeRpc:
+        return FakeRpc(self, function, params)
+
+    def respond(self, data: Any) -> FakeResponse:
+        self.round_trips += 1
+        self.bytes_sent += len(json.dumps(data, separators=(",", ":")))
+        return FakeResponse(data)
+
+    def column_values(self, orders: Tuple[Tuple[str, bool], ...], column: str) -> List[Any]:
+        """One column of a sorted view, for binary searching it"""
+        key = (orders, column)
+        if key not in self._columns:
+            self._columns[key] = [row.get(column) for row in self.sorted_rows(orders)]
+        return self._columns[key]
+
+    def sorted_rows(self, orders: Tuple[Tuple[str, bool], ...]) -> List[Dict[str, Any]]:
+        if orders not in self._sorted:
+            rows = list(self.users)
+            for column, desc in reversed(orders):
+                rows.sort(key=lambda row: row.get(column), reverse=desc)
+            self._sorted[orders] = rows
+        return self._sorted[orders]
+
+    # Leaderboard RPCs, mirroring the SQL functions in migrations/
+
+    def _board(self) -> List[Dict[str, Any]]:
+        return self.sorted_rows((("score", True), ("created_at", False), ("id", False)))
+
+    def _dense(self, score: int) -> int:
+        return bisect_left(self._neg_distinct, -score) + 1
+
+    def _ranked(self, row: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+        return {**row, "position": self._dense(row["score"]), **extra}
+
+    def _rpc_leaderboard_page(self, p_offset: int, p_limit: int) -> List[Dict[str, Any]]:
+        return [self._ranked(row) for row in self._board()[p_offset:p_offset + p_limit]]
+
+    def _rpc_leaderboard_keyset_page(self, p_score, p_created_at, p_id, p_limit, p_forward=True):
+        board = self._board()
+        key = (-p_score, p_created_at, p_id)
+        keys = lambda i: (-board[i]["score"], board[i]["created_at"], board[i]["id"])
+        lo, hi = 0, len(board)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys(mid) <= key if p_forward else keys(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        rows = board[lo:lo + p_limit] if p_forward else board[max(lo - p_limit, 0):lo]
+        return [self._ranked(row) for row in rows]
+
+    def _rpc_leaderboard_user_rank(self, p_user_id: str) -> List[Dict[str, Any]]:
+        if p_user_id not in self._board_pos:
+            return []
+        row = self._board()[self._board_pos[p_user_id]]
+        ahead = sum(1 for other in self.users if other["score"] > row["score"])
+        return [self._ranked(row, users_ahead=ahead, total_users=len(self.users))]
+
+    def _rpc_leaderboard_around(self, p_user_id: str, p_radius: int) -> List[Dict[str, Any]]:
+        if p_user_id not in self._board_pos:
+            return []
+        at = self._board_pos[p_user_id]
+        return [self._ranked(row) for row in self._board()[max(at - p_radius, 0):at + p_radius + 1]]
+
+    def _rpc_leaderboard_ranks(self, p_user_ids: List[str]) -> List[Dict[str, Any]]:
+        board = self._board()
+        rows = sorted((board[self._board_pos[uid]] for uid in p_user_ids if uid in self._board_pos),
+                      key=lambda row: self._board_pos[row["id"]])
+        group = sorted({row["score"] for row in rows}, reverse=True)
+        return [self._ranked(row, group_position=group.index(row["score"]) + 1) for row in rows]
+
+    def _rpc_leaderboard_rank_for_score(self, p_score: int) -> List[Dict[str, Any]]:
+        ahead = sum(1 for row in self.users if row["score"] > p_score)
+        return [{"position": self._dense(p_score), "users_ahead": ahead, "total_users": len(self.users)}]
+
@@ -0,0 +1,221 @@
+"""
+JWT verification benchmark
+
+Reports verifies per second for every installed JWT backend (see
+jwt_backends.py) on Supabase-shaped access tokens signed HS256 (project
+secret), RS256 and ES256 (asymmetric signing keys served from a JWKS). Each
+backend is timed twice: backend.decode alone, and the full
+SupabaseAuth.verify_jwt_token path with the verified-token cache disabled.
+
+Before timing, every backend is run over the same set of valid and invalid
+tokens and its outcomes compared with python-jose's, so a faster backend
+that changes what is accepted shows up as a contract mismatch.
+
+Usage (from the repository root):
+    python benchmarks/jwt_bench.py --iterations 2000 --output jwt_bench.json
+"""
+
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec, rsa  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from jose import jwk, jwt  # noqa: E402
+from config import settings  # noqa: E402
+import auth  # noqa: E402
+import jwks  # noqa: E402
+from jwt_backends import available_backends  # noqa: E402
+from token_cache import token_cache  # noqa: E402
+
+SECRET = "benchmark-jwt-secret-with-at-least-32-bytes"
+ALGORITHMS = ("HS256", "RS256", "ES256")
+
+
+def supabase_claims(**overrides: Any) -> Dict[str, Any]:
+    """Claims shaped like a Supabase access token"""
+    now = int(time.time())
+    claims = {
+        "aud": "authenticated",
+        "exp": now + 3600,
+        "iat": now,
+        "iss": "https://project.supabase.co/auth/v1",
+        "sub": "5f0c7f4e-8a4e-4c1e-9d0b-3f5c2a1b7e90",
+        "email": "learner@example.com",
+        "phone": "",
+        "app_metadata": {"provider": "email", "providers": ["email"]},
+        "user_metadata": {"full_name": "Benchmark Learner", "learning_goals": "fingerspelling", "is_admin": False},
+        "role": "authenticated",
+        "aal": "aal1",
+        "amr": [{"method": "password", "timestamp": now}],
+        "session_id": "0d9d5a52-6c8e-4a4f-bb1c-6a3a9b1f2c11",
+        "is_anonymous": False,
+    }
+    claims.update(overrides)
+    return {k: v for k, v in claims.items() if v is not None}
+
+
+class SigningKeys:
+    """One signing key per algorithm, and the JWKS document publishing the public halves"""
+
+    def __init__(self):
+        rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        ec_key = ec.generate_private_key(ec.SECP256R1())
+        self.private: Dict[str, Any] = {"HS256": SECRET}
+        entries = []
+        for algorithm, key in (("RS256", rsa_key), ("ES256", ec_key)):
+            self.private[algorithm] = key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            ).decode()
+            public_pem = key.public_key().public_bytes(
+                serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+            ).decode()
+            entry = jwk.construct(public_pem, algorithm).to_dict()
+            entry.update({"kid": f"bench-{algorithm.lower()}", "alg": algorithm, "use": "sig"})
+            entries.append(entry)
+        self.jwks = {"keys": entries}
+
+    def sign(self, algorithm: str, claims: Dict[str, Any]) -> str:
+        headers = {"kid": f"bench-{algorithm.lower()}"} if algorithm != "HS256" else None
+        return jwt.encode(claims, self.private[algorithm], algorithm=algorithm, headers=headers)
+
+
+def contract_tokens(keys: SigningKeys) -> Dict[str, str]:
+    """Tokens covering what the claims contract accepts and rejects"""
+    now = int(time.time())
+    valid = keys.sign("HS256", supabase_claims())
+    header, payload, signature = valid.split(".")
+    tampered = signature[:-4] + ("AAAA" if not signature.endswith("AAAA") else "BBBB")
+    return {
+        **{f"valid_{alg.lower()}": keys.sign(alg, supabase_claims()) for alg in ALGORITHMS},
+        "expired": keys.sign("HS256", supabase_claims(exp=now - 10)),
+        "not_yet_valid": keys.sign("HS256", supabase_claims(nbf=now + 600)),
+        "iat_in_future": keys.sign("HS256", supabase_claims(iat=now + 600)),
+        "iat_not_a_number": keys.sign("HS256", supabase_claims(iat="yesterday")),
+        "wrong_audience": keys.sign("HS256", supabase_claims(aud="anon")),
+        "audience_list": keys.sign("HS256", supabase_claims(aud=["authenticated", "other"])),
+        "no_audience": keys.sign("HS256", supabase_claims(aud=None)),
+        "no_sub": keys.sign("HS256", supabase_claims(sub=None)),
+        "numeric_sub": keys.sign("HS256", supabase_claims(sub=42)),
+        "numeric_jti": keys.sign("HS256", supabase_claims(jti=7)),
+        "no_exp": keys.sign("HS256", supabase_claims(exp=None)),
+        "bad_signature": f"{header}.{payload}.{tampered}",
+        "wrong_secret": jwt.encode(supabase_claims(), SECRET + "-rotated", algorithm="HS256"),
+        "unknown_kid": jwt.encode(supabase_claims(), keys.private["RS256"], algorithm="RS256",
+                                  headers={"kid": "retired"}),
+        "rsa_kid_on_hs256": jwt.encode(supabase_claims(), SECRET, algorithm="HS256", headers={"kid": "bench-rs256"}),
+        "alg_none": f"eyJhbGciOiJub25lIiwidHlwIjoiSldUIn0.{payload}.",  # {"alg":"none","typ":"JWT"}, unsigned
+        "garbage": "not-a-jwt",
+    }
+
+
+def use_backend(name: str, keys: SigningKeys) -> None:
+    """Point settings and the process-wide JWKS at a backend, with no token cache"""
+    settings.auth_jwt_backend = name
+    settings.supabase_jwt_secret = SECRET
+    token_cache.max_entries = 0
+    token_cache.clear()
+    cache = jwks.JWKSCache("http://bench.invalid/jwks.json", refresh_interval=600)
+    cache._keys = jwks.parse_jwks(keys.jwks)  # keys are built by the backend now in settings
+    cache._loaded_at = time.monotonic()
+    jwks._jwks = cache
+
+
+def outcome(token: str) -> Any:
+    try:
+        return auth.SupabaseAuth.verify_jwt_token(token).to_dict()
+    except HTTPException as e:
+        return f"{e.status_code} {e.detail}"
+
+
+def contract_results(names: List[str], keys: SigningKeys) -> Dict[str, Any]:
+    tokens = contract_tokens(keys)
+    outcomes: Dict[str, Dict[str, Any]] = {}
+    for name in names:
+        use_backend(name, keys)
+        outcomes[name] = {case: outcome(token) for case, token in tokens.items()}
+    reference = outcomes["jose"]
+    mismatches = {
+        name: sorted(case for case in tokens if result[case] != reference[case])
+        for name, result in outcomes.items() if name != "jose"
+    }
+    for name, cases in mismatches.items():
+        print(f"{name:<6} contract {'matches python-jose' if not cases else 'MISMATCH: ' + ', '.join(cases)}",
+              file=sys.stderr)
+    return {
+        "cases": {case: (value if isinstance(value, str) else "accepted") for case, value in reference.items()},
+        "mismatches": mismatches,
+    }
+
+
+def rate(call: Callable[[], Any], iterations: int, repeats: int) -> Tuple[float, float]:
+    """(median verifies per second, median microseconds per verify) over repeats"""
+    for _ in range(min(iterations, 100)):  # warm up
+        call()
+    per_call = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        per_call.append((time.perf_counter() - started) / iterations)
+    median = statistics.median(per_call)
+    return round(1 / median, 1), round(median * 1e6, 1)
+
+
+def throughput_results(names: List[str], keys: SigningKeys, iterations: int, repeats: int) -> List[Dict[str, Any]]:
+    backends = available_backends()
+    results = []
+    for name in names:
+        use_backend(name, keys)
+        backend = backends[name]
+        for algorithm in ALGORITHMS:
+            token = keys.sign(algorithm, supabase_claims())
+            key = SECRET if algorithm == "HS256" else jwks.get_jwks().get(f"bench-{algorithm.lower()}")[1]
+            decode = lambda: backend.decode(token, key, algorithm, "authenticated")  # noqa: E731
+            verify = lambda: auth.SupabaseAuth.verify_jwt_token(token)  # noqa: E731
+            for path, call in (("decode", decode), ("verify_jwt_token", verify)):
+                per_second, us = rate(call, iterations, repeats)
+                results.append({"backend": name, "algorithm": algorithm, "path": path,
+                                "verifies_per_second": per_second, "us_per_verify": us})
+                print(f"{name:<6} {algorithm} {path:<16} {per_second:>10.0f}/s {us:>8.1f}us", file=sys.stderr)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000, help="Verifications per timed repeat")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    keys = SigningKeys()
+    names = sorted(available_backends(), key=lambda name: name != "jose")
+    print(f"Backends: {', '.join(names)}", file=sys.stderr)
+    report = {
+        "benchmark": "jwt",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+        "repeats": args.repeats,
+        "backends": names,
+        "contract": contract_results(names, keys),
+        "results": throughput_results(names, keys, args.iterations, args.repeats),
+    }
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Leaderboard benchmark suite
+
+Seeds synthetic users (heavy-tailed scores with many ties), runs each
+leaderboard code path against the in-process Supabase stand-in and prints a
+JSON report with p50/p95/p99 latency, bytes transferred from the database
+and peak allocated bytes per request.
+
+Usage (from the repository root):
+    python benchmarks/leaderboard_bench.py --sizes 10000,100000,1000000 --output bench.json
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_supabase import FakeSupabase  # noqa: E402
+from config import settings  # noqa: E402
+import leaderboard_db  # noqa: E402
+from principal import Principal  # noqa: E402
+import leaderboard_routes  # noqa: E402
+import quantile_sketch  # noqa: E402
+import rank_index  # noqa: E402
+
+
+def generate_users(count: int, seed: int) -> List[Dict[str, Any]]:
+    """Synthetic users: a quarter never scored, the rest follow a Pareto tail"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    users = []
+    for i in range(count):
+        if rng.random() < 0.25:
+            score = 0
+        else:
+            score = min(int(rng.paretovariate(1.2) * 10) - 10, 100000)
+        users.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "username": f"user{i}",
+            "avatar": None,
+            "score": score,
+            "created_at": (start + timedelta(seconds=i * 37 + rng.randint(0, 36))).isoformat(),
+        })
+    return users
+
+
+def legacy_get_leaderboard(supabase: FakeSupabase, page: int, page_size: int) -> Dict[str, Any]:
+    """The original two-query implementation, kept as the baseline"""
+    offset = (page - 1) * page_size
+    rows = (
+        supabase.table("users").select("id, username, avatar, score, created_at")
+        .order("score", desc=True).order("created_at", desc=False).order("id", desc=False)
+        .range(offset, offset + page_size - 1).execute().data or []
+    )
+    if not rows:
+        return {"items": [], "page": page, "page_size": page_size}
+    higher = (
+        supabase.table("users").select("score").gt("score", rows[0].get("score") or 0)
+        .order("score", desc=True).limit(100000).execute().data or []
+    )
+    base_rank = len({r.get("score") for r in higher}) + 1
+    unique_scores_desc = sorted({(r.get("score") or 0) for r in rows}, reverse=True)
+    score_to_offset = {score: idx for idx, score in enumerate(unique_scores_desc)}
+    items = [
+        {**r, "position": base_rank + score_to_offset.get(r.get("score") or 0, 0)}
+        for r in rows
+    ]
+    return {"items": items, "page": page, "page_size": page_size}
+
+
+def legacy_get_my_rank(supabase: FakeSupabase, user_id: str) -> Dict[str, Any]:
+    row = (
+        supabase.table("users").select("id, username, avatar, score, created_at")
+        .eq("id", user_id).maybe_single().execute().data
+    )
+    higher = (
+        supabase.table("users").select("score").gt("score", row.get("score") or 0)
+        .order("score", desc=True).limit(100000).execute().data or []
+    )
+    return {**row, "position": len({r.get("score") for r in higher}) + 1}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def measure(name: str, call: Callable[[], Any], supabase: FakeSupabase, iterations: int, alloc_iterations: int,
+            max_seconds: float) -> Dict[str, Any]:
+    call()  # warm up (loads the rank index on the first index-backed call)
+    bytes_before, trips_before = supabase.bytes_sent, supabase.round_trips
+    latencies: List[float] = []
+    deadline = time.perf_counter() + max_seconds
+    # Slow paths stop at the time budget once they have a minimum sample
+    while len(latencies) < iterations and (len(latencies) < 5 or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    samples = len(latencies)
+    bytes_sent = supabase.bytes_sent - bytes_before
+    round_trips = supabase.round_trips - trips_before
+
+    # Allocation peaks include the stand-in serializing each response, which
+    # takes the place of the real client decoding it
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(alloc_iterations, samples)):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - baseline)
+    tracemalloc.stop()
+
+    return {
+        "path": name,
+        "iterations": samples,
+        "p50_ms": round(percentile(latencies, 50), 4),
+        "p95_ms": round(percentile(latencies, 95), 4),
+        "p99_ms": round(percentile(latencies, 99), 4),
+        "mean_ms": round(statistics.fmean(latencies), 4),
+        "bytes_per_request": bytes_sent // samples,
+        "round_trips_per_request": round(round_trips / samples, 2),
+        "alloc_peak_bytes": int(statistics.median(peaks)) if peaks else None,
+    }
+
+
+def bench_dataset(size: int, seed: int, iterations: int, alloc_iterations: int, max_seconds: float,
+                  legacy: bool) -> List[Dict[str, Any]]:
+    users = generate_users(size, seed)
+    supabase = FakeSupabase(users)
+    for module in (leaderboard_routes, leaderboard_db, rank_index, quantile_sketch):
+        module.get_supabase_admin_client = lambda: supabase
+    rank_index._index = None
+    quantile_sketch._sketch = None
+    settings.leaderboard_index_refresh_seconds = 10 ** 9
+    leaderboard_routes.page_cache.ttl = 0  # measure the ranking paths, not the response cache
+
+    rng = random.Random(seed + 1)
+    sample_user = users[rng.randrange(size)]["id"]
+    principal = Principal({"sub": sample_user, "aud": "authenticated"})
+    group = [uuid.UUID(users[rng.randrange(size)]["id"]) for _ in range(100)]
+    deep_page = max(size // 20 // 2, 1)
+    loop = asyncio.new_event_loop()
+    run = loop.run_until_complete
+
+    def deep_cursor() -> str:
+        return run(leaderboard_routes.get_leaderboard(page=deep_page, page_size=20, cursor=None, window="all", snapshot_id=None, if_none_match=None))["next_cursor"]
+
+    paths: Dict[str, Callable[[], Any]] = {}
+    if legacy:
+        paths["legacy.page_1"] = lambda: legacy_get_leaderboard(supabase, 1, 20)
+        paths["legacy.page_deep"] = lambda: legacy_get_leaderboard(supabase, deep_page, 20)
+        paths["legacy.my_rank"] = lambda: legacy_get_my_rank(supabase, sample_user)
+
+    results = []
+    for backend in ("index", "database"):
+        settings.leaderboard_backend = backend
+        cursor = deep_cursor()
+        current = {
+            **paths,
+            f"{backend}.page_1": lambda: run(leaderboard_routes.get_leaderboard(page=1, page_size=20, cursor=None, window="all", snapshot_id=None, if_none_match=None)),
+            f"{backend}.page_deep": lambda: run(leaderboard_routes.get_leaderboard(page=deep_page, page_size=20, cursor=None, window="all", snapshot_id=None, if_none_match=None)),
+            f"{backend}.cursor_deep": lambda: run(leaderboard_routes.get_leaderboard(page=1, page_size=20, cursor=cursor, window="all", snapshot_id=None, if_none_match=None)),
+            f"{backend}.my_rank": lambda: run(leaderboard_routes.get_my_rank(
+                window="all", approximate=False, current_user=principal)),
+            f"{backend}.my_rank_approx": lambda: run(leaderboard_routes.get_my_rank(
+                window="all", approximate=True, current_user=principal)),
+            f"{backend}.around_me": lambda: run(leaderboard_routes.get_around_me(radius=5, current_user=principal)),
+            f"{backend}.ranks_100": lambda: run(leaderboard_routes.get_ranks(
+                leaderboard_routes.RankLookupRequest(user_ids=group), current_user=principal)),
+        }
+        paths = {}
+        for name, call in current.items():
+            result = measure(name, call, supabase, iterations, alloc_iterations, max_seconds)
+            result["dataset_size"] = size
+            results.append(result)
+            print(f"{size:>9} {name:<22} p50={result['p50_ms']:.3f}ms p99={result['p99_ms']:.3f}ms "
+                  f"bytes={result['bytes_per_request']}", file=sys.stderr)
+    loop.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated user counts")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--alloc-iterations", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="Time budget per code path")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-legacy", action="store_true", help="Skip the original two-query implementation")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results.extend(bench_dataset(size, args.seed, args.iterations, args.alloc_iterations, args.max_seconds,
+                                     not args.skip_legacy))
+
+    report = {
+        "benchmark": "leaderboard",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "iterations": args.iterations,
+        "results": results,
+    }
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
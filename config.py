@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 import os
 
 
@@ -32,6 +32,49 @@ class Settings(BaseSettings):
     # OpenAI API Configuration
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     
+    # Auth Configuration
+    auth_token_cache_size: int = 10000  # Verified tokens whose claims are reused until exp (0 disables)
+    auth_jwks_url: str = ""  # JWKS for RS256/ES256 tokens; defaults to {SUPABASE_URL}/auth/v1/.well-known/jwks.json
+    auth_jwks_refresh_seconds: int = 600  # Background JWKS refresh (sooner if the response's max-age is shorter)
+    auth_jwt_backend: str = "jose"  # "jose" (python-jose) or "pyjwt" (optional PyJWT package); see benchmarks/jwt_bench.py
+    auth_revocation_source: str = "memory"  # "memory" (this process only) or "supabase" (revoked_tokens table in migrations/)
+    auth_revocation_sync_seconds: int = 30  # How often each worker re-reads the shared revocation list
+    auth_revocation_ttl_seconds: int = 3600  # How long a revoked session is denied: the longest access token lifetime (Supabase JWT expiry)
+    auth_skip_paths: List[str] = ["/health", "/api/images"]  # Path prefixes AuthMiddleware never verifies tokens for
+    
+    # Rate Limiting (token bucket per route and user, or per IP without a valid token)
+    rate_limits: Dict[str, str] = {"asl_analyze": "10/minute"}  # RateLimit(name) dependency name -> "<requests>/<second|minute|hour|day>"; the burst is the same N
+    rate_limit_backend: str = "memory"  # "memory" (per worker) or "redis" (shared by all workers; needs the redis package)
+    rate_limit_redis_url: str = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+    rate_limit_max_keys: int = 100000  # Buckets kept per worker by the memory backend
+    
+    # Leaderboard Configuration
+    leaderboard_backend: str = "index"  # "index" (in-memory rank index) or "database" (ranking RPCs in migrations/)
+    leaderboard_index_refresh_seconds: int = 60  # How often the in-memory rank index reads users changed since its last refresh
+    leaderboard_index_full_sync_seconds: int = 3600  # How often it re-reads every user instead (drops deleted users)
+    leaderboard_index_delta_limit: int = 5000  # Changed users one refresh reads; past this it re-reads every user
+    leaderboard_cache_ttl_seconds: float = 5.0  # Freshness of cached leaderboard pages (0 disables the cache)
+    leaderboard_cache_max_stale_seconds: float = 60.0  # How long past the TTL a stale page may be served while refreshing
+    leaderboard_cache_max_entries: int = 256
+    leaderboard_hot_top_n: int = 100  # Pages within the top N are served pre-serialized, kept across snapshots while the top N is unchanged (0 disables)
+    leaderboard_snapshot_interval_seconds: float = 10.0  # Minimum age of a snapshot before a changed board gets a new one
+    leaderboard_snapshot_retain: int = 6  # Snapshots kept addressable by snapshot_id (each holds one reference per user)
+    leaderboard_sketch_k: int = 200  # KLL sketch size for approximate ranks; rank error is about 1.3% of users at k=200
+    leaderboard_sketch_refresh_seconds: int = 300
+    leaderboard_history_interval_seconds: int = 3600  # How often every user's rank is sampled for /my-rank/history (0 disables)
+    leaderboard_history_hourly_hours: int = 48  # Keep every sample this long, then one per day
+    leaderboard_history_daily_days: int = 30  # Keep daily samples this long, then one per week
+    leaderboard_history_weekly_weeks: int = 26
+    leaderboard_history_store: str = "memory"  # "memory" (per worker) or "supabase" (rank_history tables in migrations/, survives restarts; one writing process only)
+    leaderboard_export_chunk_size: int = 5000  # Rows per database read (and per Parquet row group) in /export
+    leaderboard_window_keep_days: int = 14  # Daily score buckets older than this are compacted away
+    leaderboard_events_source: str = "memory"  # "memory" (changes seen by this process's index refresh) or "postgres" (LISTEN/NOTIFY via DATABASE_URL)
+    leaderboard_stream_top_n: int = 10
+    leaderboard_stream_interval_seconds: float = 0.5  # Minimum gap between pushed updates
+    
+    # Direct Postgres connection (optional; used for LISTEN/NOTIFY)
+    database_url: str = os.getenv("DATABASE_URL", "")
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
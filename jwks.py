@@ -0,0 +1,202 @@
+"""
+JSON Web Key Set for asymmetric (RS256/ES256) Supabase tokens
+Keys are fetched once, indexed by kid and kept fresh by a background task,
+so verifying a token on the event loop never waits on the network.
+A token signed with a kid we have not seen wakes the refresher early (at
+most once per min_refresh_interval) instead of fetching inline.
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import re
+import threading
+import time
+
+import httpx
+from config import settings
+from jwt_backends import get_jwt_backend
+from token_cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+# JWT alg -> JWK kty it must be verified with
+ASYMMETRIC_ALGORITHMS = {"RS256": "RSA", "ES256": "EC"}
+DEFAULT_ALGORITHM = {kty: alg for alg, kty in ASYMMETRIC_ALGORITHMS.items()}
+
+
+def parse_jwks(document: Dict[str, Any]) -> Dict[str, Tuple[str, Any]]:
+    """kid -> (alg, key) for every usable signing key in a JWKS document, loaded by the configured JWT backend"""
+    backend = get_jwt_backend()
+    keys = {}
+    for entry in document.get("keys", []):
+        kid, kty = entry.get("kid"), entry.get("kty")
+        algorithm = entry.get("alg") or DEFAULT_ALGORITHM.get(kty)
+        if not kid or ASYMMETRIC_ALGORITHMS.get(algorithm) != kty or entry.get("use", "sig") != "sig":
+            continue
+        try:
+            keys[kid] = (algorithm, backend.load_jwk(entry, algorithm))
+        except Exception as e:
+            logger.warning(f"Skipping JWKS key {kid}: {e}")
+    return keys
+
+
+def max_age(cache_control: Optional[str]) -> Optional[float]:
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return float(match.group(1)) if match else None
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class JWKSCache:
+    """
+    Signing keys from one JWKS URL
+
+    get() only reads memory. Before any key set has loaded (the startup
+    load failed), a miss on the event loop wakes the refresher and returns
+    None, so the token is rejected rather than the loop waiting on the
+    network; only a caller in a worker thread fetches once inline. On a
+    failed refresh the previous keys stay in use.
+    """
+
+    def __init__(self, url: str, refresh_interval: float, min_refresh_interval: float = 30.0,
+                 timeout: float = 5.0, on_keys_removed: Optional[Callable[[], None]] = None):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.on_keys_removed = on_keys_removed
+        self._keys: Dict[str, Tuple[str, Any]] = {}
+        self._loaded_at: Optional[float] = None
+        self._last_attempt: Optional[float] = None
+        self._cold_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._next_refresh = refresh_interval
+        self.stats: Dict[str, int] = {"fetches": 0, "fetch_errors": 0, "unknown_kid": 0, "cold_misses": 0,
+                                      "cold_fetches": 0}
+
+    def get(self, kid: Optional[str]) -> Optional[Tuple[str, Any]]:
+        """(alg, key) for a kid, or None if this key set does not have it"""
+        key = self._keys.get(kid) if kid else None
+        if key is not None:
+            return key
+        if self._loaded_at is None:
+            if _on_event_loop():
+                self.stats["cold_misses"] += 1
+                self.request_refresh()
+                return None
+            with self._cold_lock:
+                if self._loaded_at is None and not self._attempted_recently():
+                    self.stats["cold_fetches"] += 1
+                    self._fetch_sync()
+            return self._keys.get(kid) if kid else None
+        self.stats["unknown_kid"] += 1
+        self.request_refresh()
+        return None
+
+    def request_refresh(self) -> None:
+        """Wake the background refresher, at most once per min_refresh_interval. Thread-safe."""
+        if self._loop is None or self._attempted_recently():
+            return
+        self._last_attempt = time.monotonic()
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _attempted_recently(self) -> bool:
+        return self._last_attempt is not None and time.monotonic() - self._last_attempt < self.min_refresh_interval
+
+    def _apply(self, response: httpx.Response) -> None:
+        response.raise_for_status()
+        keys = parse_jwks(response.json())
+        removed = set(self._keys) - set(keys)
+        self._keys = keys
+        self._loaded_at = time.monotonic()
+        self.stats["fetches"] += 1
+        age = max_age(response.headers.get("cache-control"))
+        self._next_refresh = max(self.min_refresh_interval, min(self.refresh_interval, age or self.refresh_interval))
+        if removed:
+            logger.info(f"JWKS keys retired: {sorted(removed)}")
+            if self.on_keys_removed:
+                self.on_keys_removed()
+
+    def _fetch_sync(self) -> None:
+        self._last_attempt = time.monotonic()
+        try:
+            self._apply(httpx.get(self.url, timeout=self.timeout))
+        except Exception as e:
+            self.stats["fetch_errors"] += 1
+            logger.error(f"JWKS fetch failed: {e}")
+
+    async def refresh(self) -> None:
+        self._last_attempt = time.monotonic()
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                self._apply(await client.get(self.url))
+        except Exception as e:
+            self.stats["fetch_errors"] += 1
+            logger.error(f"JWKS fetch failed: {e}")
+
+    async def start(self) -> None:
+        """Load the key set, then keep refreshing it in the background"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._loop = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # Retry soon while no key set has loaded yet
+                delay = self._next_refresh if self._loaded_at is not None else self.min_refresh_interval
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.refresh()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "kids": sorted(self._keys),
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+            "next_refresh_seconds": self._next_refresh,
+        }
+
+
+def jwks_url() -> str:
+    if settings.auth_jwks_url:
+        return settings.auth_jwks_url
+    if settings.supabase_url:
+        return settings.supabase_url.rstrip("/") + "/auth/v1/.well-known/jwks.json"
+    return ""
+
+
+_jwks: Optional[JWKSCache] = None
+_jwks_lock = threading.Lock()
+
+
+def get_jwks() -> Optional[JWKSCache]:
+    """The process-wide key set, or None if no JWKS URL is configured"""
+    global _jwks
+    if _jwks is None and jwks_url():
+        with _jwks_lock:
+            if _jwks is None:
+                # Tokens verified with a retired key must not outlive it in the claims cache
+                _jwks = JWKSCache(jwks_url(), settings.auth_jwks_refresh_seconds, on_keys_removed=token_cache.clear)
+    return _jwks
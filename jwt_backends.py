@@ -0,0 +1,161 @@
+"""
+JWT decoding backends
+Token verification goes through a small interface so the library doing the
+work can be swapped through settings.auth_jwt_backend. Every backend checks
+the signature, exp and nbf itself; the claims contract on top of that (aud,
+iat, sub, jti) is applied here, so all backends accept and reject the same tokens.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+import logging
+import threading
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidToken(Exception):
+    """The token is malformed, badly signed, expired or breaks the claims contract"""
+
+
+def check_claims(payload: Dict[str, Any], audience: str) -> Dict[str, Any]:
+    """The claims contract every backend enforces, matching python-jose's checks"""
+    if "aud" in payload:
+        # Like python-jose, a token without aud is accepted; one with aud must name us
+        claims = [payload["aud"]] if isinstance(payload["aud"], str) else payload["aud"]
+        if not isinstance(claims, list) or any(not isinstance(c, str) for c in claims):
+            raise InvalidToken("Invalid claim format in token")
+        if audience not in claims:
+            raise InvalidToken("Invalid audience")
+    if "iat" in payload and (isinstance(payload["iat"], bool) or not isinstance(payload["iat"], (int, float))):
+        raise InvalidToken("Issued At claim (iat) must be an integer")
+    for claim in ("sub", "jti"):
+        if claim in payload and not isinstance(payload[claim], str):
+            raise InvalidToken(f"Claim {claim} must be a string")
+    return payload
+
+
+class JWTBackend(ABC):
+    """Header parsing, JWK loading and verified decoding for one JWT library"""
+
+    name = ""
+
+    @abstractmethod
+    def get_unverified_header(self, token: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_jwk(self, entry: Dict[str, Any], algorithm: str) -> Any:
+        """A verification key for decode() from one JWKS entry"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _decode(self, token: str, key: Any, algorithm: str) -> Dict[str, Any]:
+        """Claims of a token whose signature, exp and nbf check out"""
+        raise NotImplementedError
+
+    def decode(self, token: str, key: Any, algorithm: str, audience: str) -> Dict[str, Any]:
+        return check_claims(self._decode(token, key, algorithm), audience)
+
+
+class JoseBackend(JWTBackend):
+    """python-jose (the default)"""
+
+    name = "jose"
+
+    def __init__(self):
+        from jose import JWTError, jwk, jwt
+        self._jwt, self._jwk, self._error = jwt, jwk, JWTError
+
+    def get_unverified_header(self, token: str) -> Dict[str, Any]:
+        try:
+            return self._jwt.get_unverified_header(token)
+        except self._error as e:
+            raise InvalidToken(str(e)) from e
+
+    def load_jwk(self, entry: Dict[str, Any], algorithm: str) -> Any:
+        return self._jwk.construct(entry, algorithm)
+
+    def _decode(self, token: str, key: Any, algorithm: str) -> Dict[str, Any]:
+        try:
+            return self._jwt.decode(token, key, algorithms=[algorithm],
+                                    options={"verify_aud": False, "verify_iat": False, "verify_sub": False,
+                                             "verify_jti": False})
+        except self._error as e:
+            raise InvalidToken(str(e)) from e
+
+
+class PyJWTBackend(JWTBackend):
+    """PyJWT (optional dependency; verifies with cryptography key objects directly)"""
+
+    name = "pyjwt"
+
+    def __init__(self):
+        import jwt
+        self._jwt = jwt
+
+    def get_unverified_header(self, token: str) -> Dict[str, Any]:
+        try:
+            return self._jwt.get_unverified_header(token)
+        except self._jwt.PyJWTError as e:
+            raise InvalidToken(str(e)) from e
+
+    def load_jwk(self, entry: Dict[str, Any], algorithm: str) -> Any:
+        return self._jwt.PyJWK(entry, algorithm).key
+
+    def _decode(self, token: str, key: Any, algorithm: str) -> Dict[str, Any]:
+        try:
+            # PyJWT also rejects an iat in the future; python-jose does not, so neither do we
+            return self._jwt.decode(token, key, algorithms=[algorithm],
+                                    options={"verify_aud": False, "verify_iat": False})
+        except self._jwt.PyJWTError as e:
+            raise InvalidToken(str(e)) from e
+
+
+JWT_BACKENDS = {backend.name: backend for backend in (JoseBackend, PyJWTBackend)}
+
+
+def available_backends() -> Dict[str, JWTBackend]:
+    """Every backend whose library is installed"""
+    backends = {}
+    for name in JWT_BACKENDS:
+        try:
+            backend = _load(name)
+        except ImportError:
+            continue
+        if backend.name == name:  # not a python-jose fallback
+            backends[name] = backend
+    return backends
+
+
+_backends: Dict[str, JWTBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def _load(name: str) -> JWTBackend:
+    backend = _backends.get(name)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None:
+                backend = _backends[name] = JWT_BACKENDS[name]()
+    return backend
+
+
+def get_jwt_backend(name: Optional[str] = None) -> JWTBackend:
+    """
+    The backend named in settings (or by name), falling back to python-jose
+    if it is unknown or its library is not installed
+    """
+    name = name or settings.auth_jwt_backend
+    backend = _backends.get(name)
+    if backend is not None:
+        return backend
+    try:
+        return _load(name)
+    except (KeyError, ImportError) as e:
+        logger.warning(f"JWT backend {name!r} unavailable ({e!r}); using python-jose")
+        backend = _backends[name] = _load(JoseBackend.name)
+        return backend
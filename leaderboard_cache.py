@@ -0,0 +1,184 @@
+"""
+TTL + stale-while-revalidate cache for leaderboard responses
+Entries hold the serialized JSON body and its ETag, so cache hits and
+conditional requests skip both the database and JSON encoding
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import Response
+from starlette.concurrency import run_in_threadpool
+from singleflight import SingleFlight
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_json(payload: Any) -> bytes:
+    """Encode a payload the same way FastAPI's JSONResponse does"""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    created_at: float = field(default_factory=time.monotonic)
+    refreshing: bool = False
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized responses with a freshness TTL
+
+    Fresh entries are served as-is. Stale entries (older than ttl but younger
+    than max_stale) are still served while a single background refresh runs.
+    Anything older, or missing, is rebuilt inline. With a SingleFlight,
+    concurrent misses and refreshes for the same key share one build.
+    """
+
+    def __init__(self, ttl: float, max_stale: float, max_entries: int, flight: Optional[SingleFlight] = None):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.flight = flight
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._tasks = set()
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "not_modified": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _store(self, key: Hashable, payload: Any) -> CacheEntry:
+        body = serialize_json(payload)
+        entry = CacheEntry(body=body, etag=make_etag(body))
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def _build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        if self.flight is not None:
+            return await self.flight.do(key, build)
+        return await run_in_threadpool(build)
+
+    async def _refresh(self, key: Hashable, build: Callable[[], Any], stale: CacheEntry) -> None:
+        try:
+            payload = await self._build(key, build)
+            self._store(key, payload)
+            self.stats["refreshes"] += 1
+        except Exception as e:
+            self.stats["refresh_errors"] += 1
+            logger.error(f"Background refresh of {key} failed: {e}")
+        finally:
+            stale.refreshing = False
+
+    async def get(self, key: Hashable, build: Callable[[], Any]) -> CacheEntry:
+        """
+        Return the cached entry for key, building it with build() (a blocking
+        callable run in the threadpool) when missing or too stale
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = entry.age()
+            if age <= self.ttl:
+                self.stats["hits"] += 1
+                self._entries.move_to_end(key)
+                return entry
+            if age <= self.ttl + self.max_stale:
+                self.stats["stale_hits"] += 1
+                if not entry.refreshing:
+                    entry.refreshing = True
+                    task = asyncio.create_task(self._refresh(key, build, entry))
+                    # Keep a reference so the task is not garbage collected mid-flight
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                return entry
+
+        self.stats["misses"] += 1
+        return self._store(key, await self._build(key, build))
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and settings for tuning the TTL"""
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_ratio": round((self.stats["hits"] + self.stats["stale_hits"]) / lookups, 4) if lookups else 0.0,
+            "ttl_seconds": self.ttl,
+            "max_stale_seconds": self.max_stale,
+        }
+
+    def respond(self, entry: CacheEntry, if_none_match: Optional[str], max_age: Optional[float] = None) -> Response:
+        """Build a 200 response from an entry, or 304 if the client already has it"""
+        max_age = self.ttl if max_age is None else max_age
+        headers = {"ETag": entry.etag, "Cache-Control": f"max-age={int(max_age)}"}
+        if etag_matches(if_none_match, entry.etag):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+class VersionedCache:
+    """
+    Serialized responses that stay valid for as long as the version they
+    were built from, with no TTL. A request whose version differs from the
+    stored one rebuilds the entry inline.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, CacheEntry]]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "rebuilds": 0}
+
+    def get(self, key: Hashable, version: Hashable, build: Callable[[], Any]) -> CacheEntry:
+        """Return the entry for key built at version, calling build() (cheap, non-blocking) if needed"""
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] == version:
+            self.stats["hits"] += 1
+            self._entries.move_to_end(key)
+            return cached[1]
+
+        self.stats["rebuilds"] += 1
+        body = serialize_json(build())
+        entry = CacheEntry(body=body, etag=make_etag(body))
+        self._entries[key] = (version, entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._entries)}
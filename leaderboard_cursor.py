@@ -0,0 +1,59 @@
+"""
+Opaque keyset cursors for leaderboard pagination
+A cursor names a row by its (score, created_at, id) ordering key and the
+direction to read from it, so paging never depends on an offset
+"""
+
+from fastapi import HTTPException
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import base64
+import json
+
+# Ordering key of a leaderboard row: (score, created_at, id)
+CursorKey = Tuple[int, str, str]
+
+NEXT = "next"
+PREV = "prev"
+
+
+class LeaderboardPage(NamedTuple):
+    """A page of ranked items plus what is needed to build its cursors"""
+
+    items: List[Dict[str, Any]]
+    first_key: Optional[CursorKey]
+    last_key: Optional[CursorKey]
+    has_prev: bool
+    has_next: bool
+
+    def cursors(self) -> Dict[str, Optional[str]]:
+        return {
+            "next_cursor": encode_cursor(NEXT, self.last_key) if self.has_next and self.last_key else None,
+            "prev_cursor": encode_cursor(PREV, self.first_key) if self.has_prev and self.first_key else None,
+        }
+
+
+def row_key(row: Dict[str, Any]) -> CursorKey:
+    """Ordering key for a users row"""
+    return (int(row.get("score") or 0), row.get("created_at") or "", str(row.get("id")))
+
+
+def encode_cursor(direction: str, key: CursorKey) -> str:
+    raw = json.dumps([direction, *key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, CursorKey]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        HTTPException: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, score, created_at, user_id = json.loads(raw)
+        if direction not in (NEXT, PREV):
+            raise ValueError(direction)
+        return direction, (int(score), str(created_at), str(user_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
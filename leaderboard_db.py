@@ -0,0 +1,105 @@
+"""
+Database-side leaderboard queries
+Dense ranks are computed in Postgres by the functions in migrations/ and
+fetched through a single PostgREST RPC per request
+"""
+
+from fastapi import HTTPException
+from typing import Any, Dict, List, Optional
+from database import get_supabase_admin_client
+from leaderboard_cursor import NEXT, CursorKey, LeaderboardPage, row_key
+from score_histogram import top_percent
+
+RANKED_FIELDS = ("id", "username", "avatar", "score", "position")
+
+
+def execute_rpc(function: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Call a Postgres function through PostgREST and return its rows"""
+    supabase = get_supabase_admin_client()
+    resp = supabase.rpc(function, params).execute()
+
+    if not resp:
+        raise HTTPException(status_code=500, detail="Failed to query database")
+
+    if hasattr(resp, 'error') and resp.error:
+        raise HTTPException(status_code=500, detail=str(resp.error))
+
+    return resp.data or []
+
+
+def ranked_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Trim an RPC row down to the leaderboard item shape"""
+    item = {field: row.get(field) for field in RANKED_FIELDS}
+    item["score"] = item["score"] or 0
+    return item
+
+
+def _page_result(rows: List[Dict[str, Any]], has_prev: bool, has_next: bool) -> LeaderboardPage:
+    return LeaderboardPage(
+        items=[ranked_item(row) for row in rows],
+        first_key=row_key(rows[0]) if rows else None,
+        last_key=row_key(rows[-1]) if rows else None,
+        has_prev=has_prev,
+        has_next=has_next,
+    )
+
+
+def fetch_page(offset: int, limit: int) -> LeaderboardPage:
+    """Return ranked users in positions [offset, offset + limit)"""
+    # One extra row tells us whether a next page exists
+    rows = execute_rpc("leaderboard_page", {"p_offset": offset, "p_limit": limit + 1})
+    return _page_result(rows[:limit], has_prev=offset > 0, has_next=len(rows) > limit)
+
+
+def fetch_keyset_page(direction: str, key: CursorKey, limit: int) -> LeaderboardPage:
+    """Return up to limit ranked users after (NEXT) or before (PREV) the cursor key"""
+    score, created_at, user_id = key
+    forward = direction == NEXT
+    rows = execute_rpc("leaderboard_keyset_page", {
+        "p_score": score,
+        "p_created_at": created_at,
+        "p_id": user_id,
+        "p_limit": limit + 1,
+        "p_forward": forward,
+    })
+    more = len(rows) > limit
+    if forward:
+        return _page_result(rows[:limit], has_prev=True, has_next=more)
+    return _page_result(rows[-limit:], has_prev=more, has_next=True)
+
+
+def fetch_around(user_id: str, radius: int) -> Optional[List[Dict[str, Any]]]:
+    """Return the user plus up to radius ranked users above and below, or None if the user does not exist"""
+    rows = execute_rpc("leaderboard_around", {"p_user_id": user_id, "p_radius": radius})
+    return [ranked_item(row) for row in rows] or None
+
+
+def fetch_ranks(user_ids: List[str]) -> List[Dict[str, Any]]:
+    """Return global and in-group ranks for the given users, in leaderboard order"""
+    rows = execute_rpc("leaderboard_ranks", {"p_user_ids": user_ids})
+    return [{**ranked_item(row), "group_position": row.get("group_position")} for row in rows]
+
+
+def fetch_user_rank(user_id: str) -> Optional[Dict[str, Any]]:
+    """Return the ranked entry for a user with users_ahead and percentile, or None if the user does not exist"""
+    rows = execute_rpc("leaderboard_user_rank", {"p_user_id": user_id})
+    if not rows:
+        return None
+    entry = ranked_item(rows[0])
+    entry["users_ahead"] = rows[0].get("users_ahead") or 0
+    entry["percentile"] = top_percent(entry["users_ahead"], rows[0].get("total_users") or 0)
+    return entry
+
+
+def fetch_rank_for_score(score: int) -> Dict[str, Any]:
+    """Return where a user with this score would stand"""
+    rows = execute_rpc("leaderboard_rank_for_score", {"p_score": score})
+    row = rows[0] if rows else {}
+    users_ahead = row.get("users_ahead") or 0
+    return {
+        "score": score,
+        "position": row.get("position") or 1,
+        "ordinal_position": users_ahead + 1,
+        "users_ahead": users_ahead,
+        "percentile": top_percent(users_ahead, row.get("total_users") or 0),
+    }
@@ -0,0 +1,301 @@
+"""
+Live leaderboard updates
+A single hub per process consumes one upstream feed of score changes, applies
+them to the rank index and fans top-N and per-user rank deltas out to every
+Server-Sent Events subscriber. Changes the rank index's own background
+refresh picks up are broadcast too, whatever the feed. With the database
+backend there is no index: the board is read through the ranking RPCs.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from config import settings
+from rank_index import get_rank_index, on_rank_index_change
+from score_windows import apply_score_delta
+from leaderboard_db import ranked_item
+import leaderboard_db
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "leaderboard_score_changes"
+
+
+class ScoreChangeSource(ABC):
+    """
+    Feed of changed users rows ({id, username, avatar, score, created_at},
+    plus previous_score when the source knows it)
+    """
+
+    @abstractmethod
+    def changes(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield changed rows for as long as the feed is up (an async generator in every source)"""
+
+
+class InProcessScoreSource(ScoreChangeSource):
+    """
+    Score changes published from inside this process
+
+    The API itself never writes scores (clients update users through
+    Supabase), so with this source the hub's updates come from the rank
+    index's periodic refresh; publish() is for code that does write scores.
+    """
+
+    def __init__(self):
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def publish(self, row: Dict[str, Any]) -> None:
+        """Queue a changed users row; safe to call from any thread"""
+        if self._loop is None:
+            self._queue.put_nowait(row)
+        else:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, row)
+
+    async def changes(self) -> AsyncIterator[Dict[str, Any]]:
+        self._loop = asyncio.get_running_loop()
+        while True:
+            yield await self._queue.get()
+
+
+class PostgresNotifySource(ScoreChangeSource):
+    """
+    Score changes from Postgres LISTEN/NOTIFY, fed by the trigger in
+    migrations/006_leaderboard_notify.sql. Requires the optional asyncpg package.
+    """
+
+    def __init__(self, dsn: str, channel: str = NOTIFY_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+
+    async def changes(self) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            import asyncpg
+        except ImportError:
+            raise RuntimeError("asyncpg is required for LEADERBOARD_EVENTS_SOURCE=postgres")
+
+        queue: "asyncio.Queue[str]" = asyncio.Queue()
+        conn = await asyncpg.connect(self.dsn)
+        await conn.add_listener(self.channel, lambda _conn, _pid, _channel, payload: queue.put_nowait(payload))
+        try:
+            while True:
+                yield json.loads(await queue.get())
+        finally:
+            await conn.close()
+
+
+def format_sse(event: str, data: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class Subscription:
+    """One connected client; holds encoded SSE messages waiting to be sent"""
+
+    def __init__(self, user_id: Optional[str], queue_size: int):
+        self.user_id = user_id
+        self.position: Optional[int] = None
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=queue_size)
+
+    def push(self, message: bytes) -> None:
+        # A slow client loses its oldest pending update rather than holding up the hub
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class LeaderboardHub:
+    """
+    Shared fan-out of leaderboard changes
+
+    One consumer task reads the upstream source and marks the board dirty;
+    one broadcaster task coalesces bursts into at most one update per
+    interval, encodes the top-N message once and computes each followed
+    user's rank once, however many clients follow them. Reads and writes of
+    the rank index take its lock, so they run in the threadpool.
+    """
+
+    def __init__(self, source: ScoreChangeSource, top_n: int = 10, interval: float = 0.5, queue_size: int = 16):
+        self.source = source
+        self.top_n = top_n
+        self.interval = interval
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscription] = set()
+        self._by_user: Dict[str, Set[Subscription]] = {}
+        self._last_top: Optional[List[Dict[str, Any]]] = None
+        self._dirty = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listening = False
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"changes": 0, "broadcasts": 0}
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._loop = asyncio.get_running_loop()
+            if not self._listening:
+                on_rank_index_change(self.mark_dirty)
+                self._listening = True
+            self._tasks = [
+                asyncio.create_task(self._consume()),
+                asyncio.create_task(self._broadcast()),
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def mark_dirty(self) -> None:
+        """Schedule a broadcast; safe to call from any thread"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dirty.set)
+        except RuntimeError:
+            pass  # the loop has closed
+
+    @staticmethod
+    def _apply_change(row: Dict[str, Any]) -> None:
+        if settings.leaderboard_backend == "database":
+            # Postgres already has the change; only the in-memory windows need it.
+            # With no index the previous score must come from the feed (null for a
+            # new user); without it the windows catch up on their next refresh.
+            if "previous_score" in row:
+                apply_score_delta(row, int(row.get("score") or 0) - int(row["previous_score"] or 0))
+            return
+        index = get_rank_index()
+        previous = index.get(row["id"])
+        index.upsert(row)
+        delta = int(row.get("score") or 0) - (previous["score"] if previous else 0)
+        apply_score_delta(row, delta)
+
+    async def _consume(self) -> None:
+        while True:
+            try:
+                async for row in self.source.changes():
+                    await run_in_threadpool(self._apply_change, row)
+                    self.stats["changes"] += 1
+                    self._dirty.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Leaderboard change feed failed, reconnecting: {e}")
+                await asyncio.sleep(5)
+
+    async def _broadcast(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._dirty.wait(), timeout=settings.leaderboard_index_refresh_seconds)
+            except asyncio.TimeoutError:
+                if not self._subscribers:
+                    continue
+                if settings.leaderboard_backend != "database":
+                    # Nothing else may be reading the index; touch it so its refresh keeps running for subscribers
+                    try:
+                        await run_in_threadpool(get_rank_index)
+                    except Exception as e:
+                        logger.error(f"Leaderboard index refresh check failed: {e}")
+                    continue
+                # No index refresh to report database changes; re-read the board instead
+            self._dirty.clear()
+            try:
+                await self._publish()
+            except Exception as e:
+                logger.error(f"Leaderboard broadcast failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _read_board(self, user_ids: List[str]) -> Tuple[List[Dict[str, Any]], Dict[str, Optional[Dict[str, Any]]]]:
+        """The top-N and the ranked entry of each of user_ids"""
+        if settings.leaderboard_backend == "database":
+            top = leaderboard_db.fetch_page(0, self.top_n).items if self.top_n else []
+            ranked = {entry["id"]: entry for entry in leaderboard_db.fetch_ranks(user_ids)} if user_ids else {}
+            return top, {
+                user_id: ranked_item(ranked[user_id]) if user_id in ranked else None
+                for user_id in user_ids
+            }
+        index = get_rank_index()
+        return index.page(0, self.top_n), {user_id: index.get(user_id) for user_id in user_ids}
+
+    async def _publish(self) -> None:
+        top, entries = await run_in_threadpool(self._read_board, list(self._by_user))
+        if top != self._last_top:
+            self._last_top = top
+            message = format_sse("top", {"items": top})
+            for subscription in self._subscribers:
+                subscription.push(message)
+
+        for user_id, entry in entries.items():
+            subscriptions = self._by_user.get(user_id)
+            if entry is None or not subscriptions:
+                continue
+            message = None
+            for subscription in subscriptions:
+                if subscription.position != entry["position"]:
+                    if message is None:
+                        message = format_sse("rank", entry)
+                    subscription.position = entry["position"]
+                    subscription.push(message)
+        self.stats["broadcasts"] += 1
+
+    async def subscribe(self, user_id: Optional[str] = None) -> Subscription:
+        """Register a client and queue the current top-N (and rank) as its first messages"""
+        self.start()
+        subscription = Subscription(user_id, self.queue_size)
+        top, entries = await run_in_threadpool(self._read_board, [user_id] if user_id else [])
+        subscription.push(format_sse("top", {"items": top}))
+        if user_id:
+            entry = entries[user_id]
+            if entry is not None:
+                subscription.position = entry["position"]
+                subscription.push(format_sse("rank", entry))
+            self._by_user.setdefault(user_id, set()).add(subscription)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+        if subscription.user_id in self._by_user:
+            followers = self._by_user[subscription.user_id]
+            followers.discard(subscription)
+            if not followers:
+                del self._by_user[subscription.user_id]
+
+    async def stream(self, user_id: Optional[str] = None, keepalive: float = 15.0) -> AsyncIterator[bytes]:
+        """SSE byte stream for one client, ending when the client disconnects"""
+        subscription = await self.subscribe(user_id)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+_hub: Optional[LeaderboardHub] = None
+
+
+def get_leaderboard_hub() -> LeaderboardHub:
+    """Return the process-wide hub, wired to the source named in settings"""
+    global _hub
+    if _hub is None:
+        if settings.leaderboard_events_source == "postgres":
+            source: ScoreChangeSource = PostgresNotifySource(settings.database_url)
+        else:
+            source = InProcessScoreSource()
+        _hub = LeaderboardHub(
+            source,
+            top_n=settings.leaderboard_stream_top_n,
+            interval=settings.leaderboard_stream_interval_seconds,
+        )
+    return _hub
@@ -0,0 +1,154 @@
+"""
+Streaming leaderboard export
+Walks the full board in leaderboard order one chunk at a time and encodes
+each chunk as it goes (NDJSON, CSV or Parquet), so memory stays flat however
+many users there are
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import csv
+import io
+import json
+
+from leaderboard_db import execute_rpc
+from leaderboard_snapshots import LeaderboardSnapshot
+
+EXPORT_FIELDS = ("position", "id", "username", "avatar", "score", "created_at")
+
+Chunk = List[Dict[str, Any]]
+
+
+def database_chunks(chunk_size: int) -> Iterator[Chunk]:
+    """
+    Ranked rows straight from Postgres, chunk_size rows per round trip
+
+    Positions are assigned here while walking the board in order. Scores
+    that change mid-export can move a user across a chunk boundary; export
+    from a snapshot (the index backend) when an exact point-in-time copy is
+    needed.
+    """
+    key: Tuple[Optional[int], Optional[str], Optional[str]] = (None, None, None)
+    position, previous = 0, None
+    while True:
+        rows = execute_rpc("leaderboard_export_chunk", {
+            "p_score": key[0],
+            "p_created_at": key[1],
+            "p_id": key[2],
+            "p_limit": chunk_size,
+        })
+        chunk = []
+        for row in rows:
+            score = row.get("score") or 0
+            if score != previous:
+                position += 1
+                previous = score
+            chunk.append({
+                "position": position,
+                "id": row.get("id"),
+                "username": row.get("username"),
+                "avatar": row.get("avatar"),
+                "score": score,
+                "created_at": row.get("created_at"),
+            })
+        if chunk:
+            yield chunk
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+        key = (last.get("score") or 0, last.get("created_at"), str(last.get("id")))
+
+
+def snapshot_chunks(snapshot: LeaderboardSnapshot, chunk_size: int) -> Iterator[Chunk]:
+    """Ranked rows from a frozen snapshot of an in-memory board"""
+    for start in range(0, len(snapshot), chunk_size):
+        yield snapshot.export_rows(start, start + chunk_size)
+
+
+def ndjson_stream(chunks: Iterable[Chunk]) -> Iterator[bytes]:
+    for chunk in chunks:
+        yield "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in chunk).encode("utf-8")
+
+
+def csv_stream(chunks: Iterable[Chunk]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ByteSink:
+    """Minimal writable file object that hands back what was written since the last drain"""
+
+    closed = False
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parquet_stream(chunks: Iterable[Chunk]) -> Iterator[bytes]:
+    """One Parquet row group per chunk. Requires the optional pyarrow package."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("position", pa.int64()),
+        ("id", pa.string()),
+        ("username", pa.string()),
+        ("avatar", pa.string()),
+        ("score", pa.int64()),
+        ("created_at", pa.string()),
+    ])
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in chunks:
+            columns = {field: [row[field] for row in chunk] for field in EXPORT_FIELDS}
+            columns["id"] = [str(value) for value in columns["id"]]
+            columns["created_at"] = [None if value is None else str(value) for value in columns["created_at"]]
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# format -> (media type, file extension, encoder)
+EXPORT_FORMATS: Dict[str, Tuple[str, str, Callable[[Iterable[Chunk]], Iterator[bytes]]]] = {
+    "ndjson": ("application/x-ndjson", "ndjson", ndjson_stream),
+    "csv": ("text/csv", "csv", csv_stream),
+    "parquet": ("application/vnd.apache.parquet", "parquet", parquet_stream),
+}
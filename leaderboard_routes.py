@@ -1,89 +1,203 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
-from typing import List, Optional, Dict, Any
-from database import get_supabase_client, get_supabase_admin_client
-from auth import get_current_user
+from fastapi import APIRouter, HTTPException, Query, Depends, Header
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional, Dict, Any
+from uuid import UUID
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field
+from database import get_supabase_admin_client
+from auth import get_current_admin, get_current_user
+from principal import Principal
+from config import settings
+from rank_index import LEADERBOARD_COLUMNS, DenseRankIndex, current_rank_index, get_rank_index
+from leaderboard_cursor import LeaderboardPage, decode_cursor
+from leaderboard_cache import CacheEntry, ResponseCache, VersionedCache
+from leaderboard_snapshots import LeaderboardSnapshot, SnapshotStore
+from leaderboard_events import get_leaderboard_hub
+from singleflight import SingleFlight
+from score_windows import get_window_index
+from score_histogram import top_percent
+from quantile_sketch import get_score_sketch
+from rank_history import get_rank_history
+from leaderboard_export import EXPORT_FORMATS, database_chunks, parquet_available, snapshot_chunks
+from starlette.concurrency import run_in_threadpool
+import leaderboard_db
 
 router = APIRouter(prefix="/api/leaderboard", tags=["leaderboard"])
 
 
-@router.get("")
-async def get_leaderboard(page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100)):
-    """Return a paginated leaderboard with dense ranks (ties share the same position)."""
-    supabase = get_supabase_admin_client()
+class RankLookupRequest(BaseModel):
+    user_ids: List[UUID] = Field(..., min_length=1, max_length=500)
 
-    offset = (page - 1) * page_size
-    # Fetch page ordered deterministically
-    page_resp = (
-        supabase
-        .table("users")
-        .select("id, username, avatar, score, created_at")
-        .order("score", desc=True)
-        .order("created_at", desc=False)
-        .order("id", desc=False)
-        .range(offset, offset + page_size - 1)
-        .execute()
-    )
+Window = Literal["day", "week", "all"]
 
-    if not page_resp:
-        raise HTTPException(status_code=500, detail="Failed to query database")
-    
-    if hasattr(page_resp, 'error') and page_resp.error:
-        raise HTTPException(status_code=500, detail=str(page_resp.error))
+# Identical concurrent leaderboard reads share one upstream call. Keys start
+# with the endpoint name followed by every parameter that affects the result.
+leaderboard_flight = SingleFlight()
 
-    rows = page_resp.data or []
-    if not rows:
-        return {"items": [], "page": page, "page_size": page_size}
+# Cache of serialized /api/leaderboard pages keyed by ("page", window, page, page_size)
+page_cache = ResponseCache(
+    ttl=settings.leaderboard_cache_ttl_seconds,
+    max_stale=settings.leaderboard_cache_max_stale_seconds,
+    max_entries=settings.leaderboard_cache_max_entries,
+    flight=leaderboard_flight,
+)
 
-    top_score = rows[0].get("score") or 0
+# Frozen copies of the in-memory boards; every index-backed page is served
+# from one so that a client paging with its snapshot_id sees a stable order
+snapshots = SnapshotStore(
+    interval=settings.leaderboard_snapshot_interval_seconds,
+    retain=settings.leaderboard_snapshot_retain,
+    top_n=settings.leaderboard_hot_top_n,
+)
 
-    # Count distinct scores strictly greater than the top score of this page
-    higher_resp = (
-        supabase
-        .table("users")
-        .select("score")
-        .gt("score", top_score)
-        .order("score", desc=True)
-        .limit(100000)
-        .execute()
+# Serialized snapshot pages keyed by (snapshot_id, page, page_size, cursor).
+# A snapshot never changes, so an entry is valid for as long as it is held.
+snapshot_pages = VersionedCache(max_entries=settings.leaderboard_cache_max_entries)
+
+
+def build_leaderboard(page: int, page_size: int, cursor: Optional[str] = None, window: str = "all") -> Dict[str, Any]:
+    """Build a leaderboard response body from the configured ranking backend"""
+    if window == "all" and settings.leaderboard_backend == "database":
+        direction, key = decode_cursor(cursor) if cursor else (None, None)
+        if cursor:
+            result = leaderboard_db.fetch_keyset_page(direction, key, page_size)
+        else:
+            result = leaderboard_db.fetch_page(offset=(page - 1) * page_size, limit=page_size)
+        return leaderboard_body(result, page, page_size, cursor, window)
+
+    # Windowed boards are always ranked in memory from the daily score buckets
+    index = get_window_index(window) if window != "all" else get_rank_index()
+    return snapshot_body(snapshots.current(window, index), page, page_size, cursor)
+
+
+def snapshot_body(snapshot: LeaderboardSnapshot, page: int, page_size: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Build a leaderboard response body from a snapshot"""
+    if cursor:
+        direction, key = decode_cursor(cursor)
+        result = snapshot.keyset_page(direction, key, page_size)
+    else:
+        result = snapshot.offset_page((page - 1) * page_size, page_size)
+    return leaderboard_body(result, page, page_size, cursor, snapshot.window, snapshot.snapshot_id)
+
+
+def leaderboard_body(result: LeaderboardPage, page: int, page_size: int, cursor: Optional[str] = None,
+                     window: str = "all", snapshot_id: Optional[str] = None) -> Dict[str, Any]:
+    response = {
+        "items": result.items,
+        "page_size": page_size,
+        "window": window,
+        "snapshot_id": snapshot_id,
+        **result.cursors(),
+    }
+    if not cursor:
+        response["page"] = page
+    return response
+
+
+def snapshot_page(snapshot: LeaderboardSnapshot, page: int, page_size: int, cursor: Optional[str] = None) -> CacheEntry:
+    return snapshot_pages.get(
+        (snapshot.snapshot_id, page, page_size, cursor),
+        snapshot.snapshot_id,
+        lambda: snapshot_body(snapshot, page, page_size, cursor),
     )
 
-    if not higher_resp:
-        raise HTTPException(status_code=500, detail="Failed to query database")
-    
-    if hasattr(higher_resp, 'error') and higher_resp.error:
-        raise HTTPException(status_code=500, detail=str(higher_resp.error))
 
-    distinct_higher = {r.get("score") for r in (higher_resp.data or [])}
-    base_rank = len(distinct_higher) + 1
+@router.get("")
+async def get_leaderboard(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor/prev_cursor from a previous response; takes precedence over page"),
+    window: Window = Query("all", description="Rank by points earned today, this week or all time"),
+    snapshot_id: Optional[str] = Query(None, description="snapshot_id from a previous response, to keep paging the same frozen board"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Return a paginated leaderboard with dense ranks (ties share the same position).
 
-    # Dense rank within the page
-    unique_scores_desc = sorted({(r.get("score") or 0) for r in rows}, reverse=True)
-    score_to_offset = {score: idx for idx, score in enumerate(unique_scores_desc)}
+    Responses from the in-memory boards carry a snapshot_id. Passing it back
+    serves later pages from the same frozen ordering (410 once it has
+    expired); those pages never change and are cacheable for the snapshot's
+    lifetime. The database backend has no snapshots and returns null.
+    """
+    if snapshot_id:
+        if window == "all" and settings.leaderboard_backend == "database":
+            raise HTTPException(status_code=400, detail="Snapshots are not available with the database backend")
+        snapshot = snapshots.get(snapshot_id, window)
+        return page_cache.respond(snapshot_page(snapshot, page, page_size, cursor), if_none_match, max_age=snapshots.lifetime)
 
-    items = [
-        {
-            "id": r.get("id"),
-            "username": r.get("username"),
-            "avatar": r.get("avatar"),
-            "score": r.get("score") or 0,
-            "position": base_rank + score_to_offset.get(r.get("score") or 0, 0),
-        }
-        for r in rows
-    ]
+    if not cursor and window == "all" and settings.leaderboard_backend != "database" \
+            and page * page_size <= settings.leaderboard_hot_top_n:
+        # Hot path: top pages are served as stored bytes from the oldest
+        # snapshot whose top rows match the current one
+        index = current_rank_index()
+        snapshot = snapshots.peek(window, index) if index is not None else None
+        if snapshot is not None:
+            return page_cache.respond(snapshot_page(snapshot.top, page, page_size), if_none_match)
 
-    return {"items": items, "page": page, "page_size": page_size}
+    if cursor or not page_cache.enabled:
+        return await leaderboard_flight.do(
+            ("page", window, page, page_size, cursor),
+            lambda: build_leaderboard(page, page_size, cursor, window),
+        )
 
+    entry = await page_cache.get(("page", window, page, page_size), lambda: build_leaderboard(page, page_size, window=window))
+    return page_cache.respond(entry, if_none_match)
 
-@router.get("/my-rank")
-async def get_my_rank(current_user: Dict[str, Any] = Depends(get_current_user)):
-    """Return dense rank for the current authenticated user."""
-    supabase = get_supabase_admin_client()
-    user_id = current_user["id"]
 
+@router.get("/cache-stats")
+async def get_cache_stats(current_user: Principal = Depends(get_current_admin)):
+    """Return hit/miss counters for the leaderboard page cache, snapshot pages and snapshots."""
+    return {**page_cache.snapshot(), "snapshot_pages": snapshot_pages.snapshot(), "snapshots": snapshots.snapshot()}
+
+
+@router.get("/flight-stats")
+async def get_flight_stats(current_user: Principal = Depends(get_current_admin)):
+    """Return how many leaderboard reads ran upstream and how many joined one already in flight."""
+    return leaderboard_flight.snapshot()
+
+
+@router.get("/export")
+async def export_leaderboard(
+    format: Literal["ndjson", "csv", "parquet"] = Query("ndjson"),
+    current_user: Principal = Depends(get_current_admin),
+):
+    """
+    Stream the full all-time board with dense positions (admin only).
+
+    The index backend exports one frozen snapshot; the database backend
+    reads LEADERBOARD_EXPORT_CHUNK_SIZE rows per round trip. Either way rows
+    are encoded chunk by chunk as the response is sent.
+    """
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires the pyarrow package")
+
+    chunk_size = settings.leaderboard_export_chunk_size
+    if settings.leaderboard_backend == "database":
+        chunks = database_chunks(chunk_size)
+    else:
+        snapshot = await run_in_threadpool(lambda: snapshots.current("all", get_rank_index()))
+        chunks = snapshot_chunks(snapshot, chunk_size)
+
+    media_type, extension, encode = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        encode(chunks),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="leaderboard.{extension}"'},
+    )
+
+
+def fetch_user_row(user_id: str) -> Dict[str, Any]:
+    """
+    Fetch one users row
+
+    Raises:
+        HTTPException: 404 if the user does not exist
+    """
+    supabase = get_supabase_admin_client()
     user_resp = (
         supabase
         .table("users")
-        .select("id, username, avatar, score, created_at")
+        .select(LEADERBOARD_COLUMNS)
         .eq("id", user_id)
         .maybe_single()
         .execute()
@@ -91,40 +205,238 @@ async def get_my_rank(current_user: Dict[str, Any] = Depends(get_current_user)):
 
     if not user_resp:
         raise HTTPException(status_code=500, detail="Failed to query database")
-    
+
     if hasattr(user_resp, 'error') and user_resp.error:
         raise HTTPException(status_code=500, detail=str(user_resp.error))
     if not user_resp.data:
         raise HTTPException(status_code=404, detail="User not found")
 
-    user_row = user_resp.data
-    score = user_row.get("score") or 0
+    return user_resp.data
+
+
+def ensure_indexed(index: DenseRankIndex, user_id: str) -> None:
+    """
+    Add a user created since the last index sync by fetching their row once
+
+    Raises:
+        HTTPException: 404 if the user does not exist
+    """
+    if user_id not in index:
+        index.upsert(fetch_user_row(user_id))
+
 
-    higher_resp = (
+def index_missing_users(index: DenseRankIndex, user_ids: List[str]) -> None:
+    """Add any of user_ids created since the last index sync with one bulk fetch"""
+    missing = [user_id for user_id in user_ids if user_id not in index]
+    if not missing:
+        return
+
+    supabase = get_supabase_admin_client()
+    users_resp = (
         supabase
         .table("users")
-        .select("score")
-        .gt("score", score)
-        .order("score", desc=True)
-        .limit(100000)
+        .select(LEADERBOARD_COLUMNS)
+        .in_("id", missing)
         .execute()
     )
 
-    if not higher_resp:
+    if not users_resp:
         raise HTTPException(status_code=500, detail="Failed to query database")
-    
-    if hasattr(higher_resp, 'error') and higher_resp.error:
-        raise HTTPException(status_code=500, detail=str(higher_resp.error))
 
-    distinct_higher = {r.get("score") for r in (higher_resp.data or [])}
-    position = len(distinct_higher) + 1
+    if hasattr(users_resp, 'error') and users_resp.error:
+        raise HTTPException(status_code=500, detail=str(users_resp.error))
+
+    for row in users_resp.data or []:
+        index.upsert(row)
+
+
+@router.get("/stream")
+async def stream_leaderboard(user_id: Optional[UUID] = Query(None, description="Also push rank changes for this user")):
+    """Server-Sent Events stream of top-N changes and, optionally, one user's rank changes."""
+    hub = get_leaderboard_hub()
+    return StreamingResponse(
+        hub.stream(str(user_id) if user_id else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
+
+def build_approximate_rank(user_id: str) -> Dict[str, Any]:
+    """Estimated all-time standing of one user from the score sketch"""
+    if settings.leaderboard_backend == "database":
+        row = fetch_user_row(user_id)
+    else:
+        index = get_rank_index()
+        ensure_indexed(index, user_id)
+        row = index.get(user_id)
     return {
-        "id": user_row.get("id"),
-        "username": user_row.get("username"),
-        "avatar": user_row.get("avatar"),
-        "score": score,
-        "position": position,
+        "id": row.get("id"),
+        "username": row.get("username"),
+        "avatar": row.get("avatar"),
+        **get_score_sketch().estimate(int(row.get("score") or 0)),
     }
 
 
+def build_my_rank(user_id: str, window: str = "all", approximate: bool = False) -> Dict[str, Any]:
+    """Dense rank, users ahead and top-percent standing for one user"""
+    if approximate and window == "all":
+        return build_approximate_rank(user_id)
+
+    if window != "all":
+        index = get_window_index(window)
+        entry = index.standing(user_id)
+        if entry is None:
+            # No points in this window yet: rank behind everyone who has some
+            row = fetch_user_row(user_id)
+            standing = index.rank_for_score(0)
+            entry = {
+                "id": row.get("id"),
+                "username": row.get("username"),
+                "avatar": row.get("avatar"),
+                "score": 0,
+                "position": standing["position"],
+                "users_ahead": standing["users_ahead"],
+                "percentile": top_percent(standing["users_ahead"], len(index) + 1),
+            }
+        return {**entry, "window": window}
+
+    if settings.leaderboard_backend == "database":
+        entry = leaderboard_db.fetch_user_rank(user_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return entry
+
+    index = get_rank_index()
+    ensure_indexed(index, user_id)
+    return index.standing(user_id)
+
+
+@router.get("/my-rank")
+async def get_my_rank(
+    window: Window = Query("all", description="Rank by points earned today, this week or all time"),
+    approximate: bool = Query(False, description="Estimate the all-time ordinal rank from a quantile sketch"),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    Return dense rank, users ahead and top-percent standing for the current authenticated user.
+
+    With approximate=true (all-time board only) the response carries an
+    estimated ordinal_position, users_ahead and percentile plus rank_error,
+    the 99%-confidence error in positions, instead of the exact dense rank.
+    """
+    user_id = current_user.id
+    return await leaderboard_flight.do(
+        ("my-rank", window, approximate, user_id),
+        lambda: build_my_rank(user_id, window, approximate),
+    )
+
+
+def build_around_me(user_id: str, radius: int) -> Dict[str, Any]:
+    """One user with up to radius users above and below, in leaderboard order"""
+    if settings.leaderboard_backend == "database":
+        items = leaderboard_db.fetch_around(user_id, radius)
+        if items is None:
+            raise HTTPException(status_code=404, detail="User not found")
+    else:
+        index = get_rank_index()
+        ensure_indexed(index, user_id)
+        items = index.around(user_id, radius).items
+
+    return {"items": items, "user_id": user_id, "radius": radius}
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Treat naive query datetimes as UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+@router.get("/my-rank/history")
+async def get_my_rank_history(
+    since: Optional[datetime] = Query(None, description="Only points at or after this time (ISO 8601, UTC if no offset)"),
+    until: Optional[datetime] = Query(None, description="Only points at or before this time"),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    Return the current user's all-time dense position over time, oldest first.
+
+    Points are sampled every LEADERBOARD_HISTORY_INTERVAL_SECONDS; older
+    points are thinned to one per day and then one per week.
+    """
+    user_id = current_user.id
+    points = get_rank_history().series(user_id, as_utc(since), as_utc(until))
+    return {"user_id": user_id, "points": points}
+
+
+@router.get("/history-stats")
+async def get_history_stats(current_user: Principal = Depends(get_current_admin)):
+    """Return the rank history's sample count, tracked users and encoded size."""
+    return get_rank_history().footprint()
+
+
+@router.get("/around-me")
+async def get_around_me(
+    radius: int = Query(5, ge=0, le=50),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Return the current user with up to `radius` users above and below, in leaderboard order."""
+    user_id = current_user.id
+    return await leaderboard_flight.do(("around-me", user_id, radius), lambda: build_around_me(user_id, radius))
+
+
+def build_ranks(user_ids: List[str]) -> Dict[str, Any]:
+    """Score, global dense rank and in-group dense rank for each of user_ids"""
+    if settings.leaderboard_backend == "database":
+        items = leaderboard_db.fetch_ranks(user_ids)
+    else:
+        index = get_rank_index()
+        index_missing_users(index, user_ids)
+        items = index.ranks(user_ids)
+
+    found = {item["id"] for item in items}
+    return {"items": items, "missing": [user_id for user_id in user_ids if user_id not in found]}
+
+
+@router.post("/ranks")
+async def get_ranks(
+    lookup: RankLookupRequest,
+    current_user: Principal = Depends(get_current_user),
+):
+    """Return score, global dense rank and dense rank within the group for each requested user."""
+    user_ids = list(dict.fromkeys(str(user_id) for user_id in lookup.user_ids))
+    return await leaderboard_flight.do(("ranks", tuple(user_ids)), lambda: build_ranks(user_ids))
+
+
+def build_search(q: str, limit: int) -> Dict[str, Any]:
+    """Users whose username starts with q, with their all-time dense positions"""
+    return {"items": get_rank_index().search(q, limit), "q": q}
+
+
+@router.get("/search")
+async def search_leaderboard(
+    q: str = Query(..., min_length=1, max_length=50, description="Username prefix (case-insensitive)"),
+    limit: int = Query(20, ge=1, le=50),
+):
+    """Find users by username prefix, returning each match's leaderboard entry in username order."""
+    return await leaderboard_flight.do(("search", q.casefold(), limit), lambda: build_search(q, limit))
+
+
+def build_rank_for_score(score: int, approximate: bool = False) -> Dict[str, Any]:
+    if approximate:
+        return get_score_sketch().estimate(score)
+    if settings.leaderboard_backend == "database":
+        return leaderboard_db.fetch_rank_for_score(score)
+    return get_rank_index().rank_for_score(score)
+
+
+@router.get("/rank-for-score")
+async def get_rank_for_score(
+    score: int = Query(..., ge=0),
+    approximate: bool = Query(False, description="Estimate the ordinal rank from a quantile sketch"),
+):
+    """Return the dense rank, ordinal rank and percentile a given score would have."""
+    return await leaderboard_flight.do(
+        ("rank-for-score", score, approximate),
+        lambda: build_rank_for_score(score, approximate),
+    )
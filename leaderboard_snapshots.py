@@ -0,0 +1,185 @@
+"""
+Immutable, versioned leaderboard snapshots
+A snapshot freezes the ordering and dense positions of a board at one moment
+so a client paging with its snapshot_id never sees rows skipped or repeated
+by concurrent score updates, and every page of it can be cached indefinitely
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import threading
+import time
+import uuid
+
+from fastapi import HTTPException
+from leaderboard_cursor import NEXT, CursorKey, LeaderboardPage
+from rank_index import DenseRankIndex
+
+
+def _rank_key(row: Dict[str, Any]):
+    return (-row["score"], row["created_at"], row["id"])
+
+
+class LeaderboardSnapshot:
+    """
+    One frozen board: the index's row dicts in leaderboard order (shared, never
+    copied or mutated) plus a compact array of their dense positions
+    """
+
+    def __init__(self, window: str, version: int, rows: List[Dict[str, Any]]):
+        self.snapshot_id = uuid.uuid4().hex[:16]
+        self.window = window
+        self.version = version
+        self.created_at = time.monotonic()
+        # The oldest snapshot with the same leading rows; its pages are reused for the top of this one
+        self.top = self
+        self._rows = rows
+        self._positions = array("I")
+        position, previous = 0, None
+        for row in rows:
+            if row["score"] != previous:
+                position += 1
+                previous = row["score"]
+            self._positions.append(position)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    def positions(self) -> Iterator[Tuple[str, int]]:
+        """(user_id, dense position) for every user, in leaderboard order"""
+        for row, position in zip(self._rows, self._positions):
+            yield row["id"], position
+
+    def export_rows(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        """Rows start..stop-1 of the board with their dense positions, for export"""
+        return [
+            {
+                "position": self._positions[i],
+                "id": row["id"],
+                "username": row["username"],
+                "avatar": row["avatar"],
+                "score": row["score"],
+                "created_at": row["created_at"],
+            }
+            for i, row in enumerate(self._rows[start:stop], start)
+        ]
+
+    def _page_result(self, start: int, stop: int) -> LeaderboardPage:
+        start, stop = max(start, 0), min(stop, len(self._rows))
+        rows = self._rows[start:stop]
+        items = [
+            {
+                "id": row["id"],
+                "username": row["username"],
+                "avatar": row["avatar"],
+                "score": row["score"],
+                "position": self._positions[start + i],
+            }
+            for i, row in enumerate(rows)
+        ]
+        return LeaderboardPage(
+            items=items,
+            first_key=(rows[0]["score"], rows[0]["created_at"], rows[0]["id"]) if rows else None,
+            last_key=(rows[-1]["score"], rows[-1]["created_at"], rows[-1]["id"]) if rows else None,
+            has_prev=start > 0,
+            has_next=stop < len(self._rows),
+        )
+
+    def offset_page(self, offset: int, limit: int) -> LeaderboardPage:
+        return self._page_result(offset, offset + limit)
+
+    def keyset_page(self, direction: str, key: CursorKey, limit: int) -> LeaderboardPage:
+        rank_key = (-key[0], key[1], key[2])
+        if direction == NEXT:
+            start = bisect_right(self._rows, rank_key, key=_rank_key)
+            return self._page_result(start, start + limit)
+        stop = bisect_left(self._rows, rank_key, key=_rank_key)
+        return self._page_result(stop - limit, stop)
+
+
+class SnapshotStore:
+    """
+    Current and recent snapshots of each board
+
+    A new snapshot is cut from the live index once the index has changed
+    and the current snapshot is at least interval seconds old; the last
+    retain snapshots stay addressable by id for clients still paging them.
+
+    When a new snapshot's first top_n + 1 rows equal the previous one's, it
+    inherits the previous top snapshot, so pre-serialized top pages (and the
+    snapshot_id they carry) survive cuts caused by changes further down the
+    board. Top snapshots of the current boards are never dropped.
+    """
+
+    def __init__(self, interval: float, retain: int, top_n: int = 0):
+        self.interval = interval
+        self.retain = retain
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._current: Dict[str, LeaderboardSnapshot] = {}
+        self._by_id: "OrderedDict[str, LeaderboardSnapshot]" = OrderedDict()
+        self.stats = {"built": 0, "top_carried": 0, "expired_lookups": 0}
+
+    @property
+    def lifetime(self) -> float:
+        """Roughly how long a snapshot stays addressable under steady change"""
+        return self.interval * self.retain
+
+    def _due(self, window: str, index: DenseRankIndex) -> bool:
+        current = self._current.get(window)
+        return current is None or (current.version != index.version and current.age() >= self.interval)
+
+    def peek(self, window: str, index: DenseRankIndex) -> Optional[LeaderboardSnapshot]:
+        """The current snapshot if no rebuild is due, without ever building one"""
+        if self._due(window, index):
+            return None
+        return self._current[window]
+
+    def current(self, window: str, index: DenseRankIndex) -> LeaderboardSnapshot:
+        """The current snapshot of a board, cutting a new one from index if due"""
+        with self._lock:
+            if self._due(window, index):
+                version, rows = index.ordered_rows()
+                snapshot = LeaderboardSnapshot(window, version, rows)
+                previous = self._current.get(window)
+                # One past top_n so has_next on the last top page matches as well
+                if self.top_n and previous is not None \
+                        and previous._rows[:self.top_n + 1] == rows[:self.top_n + 1]:
+                    snapshot.top = previous.top
+                    self.stats["top_carried"] += 1
+                self._current[window] = snapshot
+                self._by_id[snapshot.snapshot_id] = snapshot
+                # Drop the oldest snapshots that are neither current nor the top of a current one
+                current_ids = {s.snapshot_id for s in self._current.values()}
+                current_ids |= {s.top.snapshot_id for s in self._current.values()}
+                for old_id in [i for i in self._by_id if i not in current_ids][:max(len(self._by_id) - self.retain, 0)]:
+                    del self._by_id[old_id]
+                self.stats["built"] += 1
+            return self._current[window]
+
+    def get(self, snapshot_id: str, window: str) -> LeaderboardSnapshot:
+        """
+        Look up a snapshot by id
+
+        Raises:
+            HTTPException: 410 if the snapshot has expired, 400 if it belongs to another window
+        """
+        snapshot = self._by_id.get(snapshot_id)
+        if snapshot is None:
+            self.stats["expired_lookups"] += 1
+            raise HTTPException(status_code=410, detail="Leaderboard snapshot expired")
+        if snapshot.window != window:
+            raise HTTPException(status_code=400, detail="Snapshot belongs to a different window")
+        return snapshot
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "retained": len(self._by_id),
+            "current": {window: s.snapshot_id for window, s in self._current.items()},
+        }
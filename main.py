@@ -9,6 +9,12 @@ from protected_routes import router as protected_router
 from leaderboard_routes import router as leaderboard_router
 from images_routes import router as images_router
 from asl_routes import router as asl_router
+from leaderboard_events import get_leaderboard_hub
+from rank_history import rank_history_sampler
+from jwks import get_jwks
+from revocation import get_revocation_list
+from rate_limit import close_rate_limiter
+from auth import AuthMiddleware
 import logging
 
 # Set up logging
@@ -31,6 +37,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Verify bearer tokens once per request; routes read the result from request.state
+app.add_middleware(AuthMiddleware, skip_paths=settings.auth_skip_paths)
+
 # Include routes with error handling
 try:
     app.include_router(protected_router)
@@ -42,6 +51,30 @@ except Exception as e:
     logger.error(f"Error loading routes: {e}")
     raise
 
+@app.on_event("startup")
+async def start_rank_history_sampler():
+    rank_history_sampler.start()
+
+@app.on_event("startup")
+async def start_jwks_refresh():
+    jwks = get_jwks()
+    if jwks is not None:
+        await jwks.start()
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    await get_revocation_list().start()
+
+@app.on_event("shutdown")
+async def shutdown_leaderboard_hub():
+    await get_leaderboard_hub().stop()
+    await rank_history_sampler.stop()
+    jwks = get_jwks()
+    if jwks is not None:
+        await jwks.stop()
+    await get_revocation_list().stop()
+    await close_rate_limiter()
+
 # Health check endpoint
 @app.get("/")
 async def root():
@@ -0,0 +1,286 @@
+"""
+Database migrations for the leaderboard schema
+
+Applies migrations/NNN_name.sql in version order and records each one in a
+schema_migrations table with a checksum of the file, so a database always
+knows which version of the users schema and leaderboard functions it has.
+A database that was set up by hand from migrations/ adopts the runner with
+"baseline": it records every migration up to a version as applied without
+running it.
+
+A file whose first line is "-- migrate:no-transaction" runs outside a
+transaction (needed for CREATE INDEX CONCURRENTLY) and must hold a single
+statement. Everything else runs in one transaction per file.
+
+check-plans EXPLAINs every query shape the API sends to Postgres with
+sequential scans disabled and fails if any plan still reads a whole table:
+a sequential scan, or an index scan with no Index Cond to bound it (what
+the planner falls back to when sequential scans are off), unless a LIMIT
+directly above it stops the scan early and no Filter discards rows on the way.
+
+Requires the optional asyncpg package.
+
+Usage (from the repository root, with DATABASE_URL set or --dsn):
+    python migrate.py            # apply pending migrations
+    python migrate.py status
+    python migrate.py baseline 008   # mark 000..008 applied
+    python migrate.py check-plans
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+
+from config import settings
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+NO_TRANSACTION = "-- migrate:no-transaction"
+
+SCHEMA_MIGRATIONS = """
+create table if not exists public.schema_migrations (
+    version text primary key,
+    name text not null,
+    checksum text not null,
+    applied_at timestamptz not null default now()
+)
+"""
+
+# Held for the whole run so two deploys never apply the same migration twice
+LOCK_KEY = 3040_0001
+
+# Every query the API sends to Postgres: the RPC bodies from migrations/
+# (Postgres inlines these SQL functions, so EXPLAIN sees the real plan) and
+# the PostgREST table reads in rank_index and leaderboard_routes.
+# {id}, {score} and {created_at} are filled in with a real user's values.
+QUERY_SHAPES: Dict[str, str] = {
+    "leaderboard_page": "select * from public.leaderboard_page(0, 50)",
+    "leaderboard_page (deep)": "select * from public.leaderboard_page(100000, 50)",
+    "leaderboard_keyset_page (next)": "select * from public.leaderboard_keyset_page({score}, {created_at}, {id}, 50, true)",
+    "leaderboard_keyset_page (prev)": "select * from public.leaderboard_keyset_page({score}, {created_at}, {id}, 50, false)",
+    "leaderboard_user_rank": "select * from public.leaderboard_user_rank({id})",
+    "leaderboard_rank_for_score": "select * from public.leaderboard_rank_for_score({score})",
+    "leaderboard_around": "select * from public.leaderboard_around({id}, 5)",
+    "leaderboard_ranks": "select * from public.leaderboard_ranks(array[{id}]::uuid[])",
+    "leaderboard_window_scores": "select * from public.leaderboard_window_scores(current_date - 6)",
+    "leaderboard_export_chunk (first)": "select * from public.leaderboard_export_chunk(null, null, null, 5000)",
+    "leaderboard_export_chunk (next)": "select * from public.leaderboard_export_chunk({score}, {created_at}, {id}, 5000)",
+    "users by id": "select id, username, avatar, score, created_at from public.users where id = {id}",
+    "users by ids": "select id, username, avatar, score, created_at from public.users where id = any(array[{id}]::uuid[])",
+    "users sync chunk": "select id, username, avatar, score, created_at from public.users where id > {id} order by id limit 1000",
+    "users changed since": (
+        "select id, username, avatar, score, created_at, updated_at from public.users "
+        "where updated_at >= now() - interval '1 minute' order by updated_at limit 5000"
+    ),
+    "revoked tokens sync": "select token_id, expires_at from public.revoked_tokens where expires_at > now()",
+    "revoked tokens prune": "delete from public.revoked_tokens where expires_at < now()",
+}
+
+
+@dataclass
+class Migration:
+    version: str
+    name: str
+    path: Path
+
+    @property
+    def sql(self) -> str:
+        return self.path.read_text(encoding="utf-8")
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.startswith(NO_TRANSACTION)
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    """migrations/NNN_name.sql files in version order"""
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        version, _, name = path.stem.partition("_")
+        if not version.isdigit():
+            raise ValueError(f"Migration file name must start with a version number: {path.name}")
+        migrations.append(Migration(version=version, name=name, path=path))
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError("Duplicate migration versions in migrations/")
+    return migrations
+
+
+async def connect(dsn: str):
+    try:
+        import asyncpg
+    except ImportError:
+        raise RuntimeError("asyncpg is required to run migrations")
+    if not dsn:
+        raise RuntimeError("DATABASE_URL is not set")
+    return await asyncpg.connect(dsn)
+
+
+async def applied_migrations(conn) -> Dict[str, str]:
+    """version -> checksum of every migration already applied"""
+    await conn.execute(SCHEMA_MIGRATIONS)
+    rows = await conn.fetch("select version, checksum from public.schema_migrations")
+    return {row["version"]: row["checksum"] for row in rows}
+
+
+async def migrate(dsn: str) -> List[str]:
+    """
+    Apply every pending migration, returning the versions applied
+
+    Raises:
+        RuntimeError: if an applied migration's file has changed since
+    """
+    conn = await connect(dsn)
+    try:
+        await conn.execute("select pg_advisory_lock($1)", LOCK_KEY)
+        applied = await applied_migrations(conn)
+        done = []
+        for migration in load_migrations():
+            if migration.version in applied:
+                if applied[migration.version] != migration.checksum:
+                    raise RuntimeError(
+                        f"Migration {migration.path.name} was changed after it was applied; "
+                        "add a new migration instead"
+                    )
+                continue
+            record = ("insert into public.schema_migrations (version, name, checksum) values ($1, $2, $3)",
+                      migration.version, migration.name, migration.checksum)
+            if migration.transactional:
+                async with conn.transaction():
+                    await conn.execute(migration.sql)
+                    await conn.execute(*record)
+            else:
+                await conn.execute(migration.sql)
+                await conn.execute(*record)
+            print(f"Applied {migration.path.name}")
+            done.append(migration.version)
+        return done
+    finally:
+        await conn.close()
+
+
+async def baseline(dsn: str, version: str) -> List[str]:
+    """Record every migration up to and including version as applied, without running it"""
+    conn = await connect(dsn)
+    try:
+        await conn.execute("select pg_advisory_lock($1)", LOCK_KEY)
+        applied = await applied_migrations(conn)
+        done = []
+        for migration in load_migrations():
+            if int(migration.version) > int(version) or migration.version in applied:
+                continue
+            await conn.execute(
+                "insert into public.schema_migrations (version, name, checksum) values ($1, $2, $3)",
+                migration.version, migration.name, migration.checksum,
+            )
+            done.append(migration.version)
+        return done
+    finally:
+        await conn.close()
+
+
+async def status(dsn: str) -> List[Tuple[str, str]]:
+    """(file name, "applied" | "pending" | "changed") for every migration"""
+    conn = await connect(dsn)
+    try:
+        applied = await applied_migrations(conn)
+    finally:
+        await conn.close()
+    result = []
+    for migration in load_migrations():
+        checksum = applied.get(migration.version)
+        state = "pending" if checksum is None else "applied" if checksum == migration.checksum else "changed"
+        result.append((migration.path.name, state))
+    return result
+
+
+# Nodes that hand rows through one at a time, so a LIMIT above them still bounds the scan below
+PASS_THROUGH_NODES = {"Limit", "Subquery Scan", "Result", "Append"}
+INDEX_SCAN_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+def plan_problems(plan: Dict[str, Any], limited: bool = False) -> List[str]:
+    """
+    Whole-table reads, and leaderboard functions Postgres did not inline,
+    anywhere in a plan. limited is whether a LIMIT bounds this node's output.
+    """
+    problems = []
+    node_type = plan.get("Node Type")
+    if node_type == "Seq Scan":
+        problems.append(f"Seq Scan on {plan.get('Relation Name')}")
+    elif node_type in INDEX_SCAN_NODES and "Index Cond" not in plan:
+        bounded = limited and node_type != "Bitmap Index Scan" and "Filter" not in plan
+        if not bounded:
+            problems.append(f"{node_type} of all of {plan.get('Index Name')}")
+    elif node_type == "Function Scan" and str(plan.get("Function Name", "")).startswith("leaderboard_"):
+        problems.append(f"{plan['Function Name']} was not inlined")
+    if node_type == "Limit":
+        limited = True
+    elif node_type not in PASS_THROUGH_NODES:
+        limited = False
+    for child in plan.get("Plans", []):
+        problems.extend(plan_problems(child, limited))
+    return problems
+
+
+async def check_plans(dsn: str) -> Dict[str, List[str]]:
+    """Query shape -> plan problems (empty when the shape is fully index-backed)"""
+    conn = await connect(dsn)
+    try:
+        sample = await conn.fetchrow(
+            "select id::text, score, created_at::text from public.users "
+            "order by score desc, created_at asc, id asc limit 1"
+        )
+        values = {
+            "id": f"'{sample['id'] if sample else '00000000-0000-0000-0000-000000000000'}'::uuid",
+            "score": sample["score"] if sample else 0,
+            "created_at": f"'{sample['created_at'] if sample else 'epoch'}'::timestamptz",
+        }
+        results = {}
+        async with conn.transaction():
+            await conn.execute("set local enable_seqscan = off")
+            for shape, query in QUERY_SHAPES.items():
+                explained = await conn.fetchval(f"explain (format json) {query.format(**values)}")
+                plan = (json.loads(explained) if isinstance(explained, str) else explained)[0]["Plan"]
+                results[shape] = plan_problems(plan)
+        return results
+    finally:
+        await conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", default="up", choices=["up", "status", "baseline", "check-plans"])
+    parser.add_argument("version", nargs="?", help="Last migration version already applied (baseline only)")
+    parser.add_argument("--dsn", default=settings.database_url, help="Postgres connection string (default: DATABASE_URL)")
+    args = parser.parse_args()
+
+    if args.command == "up":
+        applied = asyncio.run(migrate(args.dsn))
+        print(f"{len(applied)} migration(s) applied")
+    elif args.command == "baseline":
+        if not args.version:
+            parser.error("baseline needs the last version already applied, e.g. 008")
+        recorded = asyncio.run(baseline(args.dsn, args.version))
+        print(f"{len(recorded)} migration(s) recorded as applied")
+    elif args.command == "status":
+        for name, state in asyncio.run(status(args.dsn)):
+            print(f"{state:8} {name}")
+    else:
+        results = asyncio.run(check_plans(args.dsn))
+        for shape, problems in results.items():
+            print(f"{'FAIL' if problems else 'ok':4} {shape}" + (f": {', '.join(problems)}" if problems else ""))
+        if any(results.values()):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
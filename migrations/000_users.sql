@@ -0,0 +1,10 @@
+-- Baseline schema for the users table read by the leaderboard.
+-- On Supabase the table already exists; this keeps a plain Postgres stand-in in sync.
+
+create table if not exists public.users (
+    id uuid primary key,
+    username text,
+    avatar text,
+    score integer not null default 0,
+    created_at timestamptz not null default now()
+);
@@ -0,0 +1,59 @@
+-- Database-side dense ranking for /api/leaderboard and /api/leaderboard/my-rank.
+-- Both functions are exposed through PostgREST as RPCs so each endpoint makes one call.
+
+-- One page of the board in (score desc, created_at asc, id asc) order.
+-- Positions are the count of distinct higher scores plus DENSE_RANK() within the page.
+create or replace function public.leaderboard_page(p_offset integer, p_limit integer)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz,
+    "position" integer
+)
+language sql
+stable
+as $$
+    with page as (
+        select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+        from public.users u
+        order by u.score desc, u.created_at asc, u.id asc
+        offset greatest(p_offset, 0)
+        limit greatest(p_limit, 0)
+    ),
+    base as (
+        select count(distinct h.score)::integer as higher
+        from public.users h
+        where h.score > (select max(p.score) from page p)
+    )
+    select p.id, p.username, p.avatar, p.score, p.created_at,
+           (base.higher + dense_rank() over (order by p.score desc))::integer
+    from page p
+    cross join base
+    order by p.score desc, p.created_at asc, p.id asc;
+$$;
+
+-- A single user's dense rank: one more than the number of distinct higher scores.
+create or replace function public.leaderboard_user_rank(p_user_id uuid)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz,
+    "position" integer
+)
+language sql
+stable
+as $$
+    select u.id, u.username, u.avatar, coalesce(u.score, 0), u.created_at,
+           (
+               select count(distinct h.score)::integer + 1
+               from public.users h
+               where h.score > coalesce(u.score, 0)
+           )
+    from public.users u
+    where u.id = p_user_id;
+$$;
+
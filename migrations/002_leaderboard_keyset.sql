@@ -0,0 +1,63 @@
+-- Keyset (cursor) paging for /api/leaderboard.
+-- Reads up to p_limit rows after (p_forward) or before the row keyed by
+-- (p_score, p_created_at, p_id) in (score desc, created_at asc, id asc) order,
+-- so deep pages cost the same as the first one.
+
+create or replace function public.leaderboard_keyset_page(
+    p_score integer,
+    p_created_at timestamptz,
+    p_id uuid,
+    p_limit integer,
+    p_forward boolean default true
+)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz,
+    "position" integer
+)
+language sql
+stable
+as $$
+    with page as (
+        (
+            select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+            from public.users u
+            where p_forward
+              and u.score <= p_score
+              and (
+                  u.score < p_score
+                  or u.created_at > p_created_at
+                  or (u.created_at = p_created_at and u.id > p_id)
+              )
+            order by u.score desc, u.created_at asc, u.id asc
+            limit greatest(p_limit, 0)
+        )
+        union all
+        (
+            select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+            from public.users u
+            where not p_forward
+              and u.score >= p_score
+              and (
+                  u.score > p_score
+                  or u.created_at < p_created_at
+                  or (u.created_at = p_created_at and u.id < p_id)
+              )
+            order by u.score asc, u.created_at desc, u.id desc
+            limit greatest(p_limit, 0)
+        )
+    ),
+    base as (
+        select count(distinct h.score)::integer as higher
+        from public.users h
+        where h.score > (select max(p.score) from page p)
+    )
+    select p.id, p.username, p.avatar, p.score, p.created_at,
+           (base.higher + dense_rank() over (order by p.score desc))::integer
+    from page p
+    cross join base
+    order by p.score desc, p.created_at asc, p.id asc;
+$$;
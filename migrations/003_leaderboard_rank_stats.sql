@@ -0,0 +1,46 @@
+-- users_ahead and total_users for /api/leaderboard/my-rank, and standings for
+-- arbitrary scores, each answered in the same single RPC as the rank.
+
+drop function if exists public.leaderboard_user_rank(uuid);
+
+create function public.leaderboard_user_rank(p_user_id uuid)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz,
+    "position" integer,
+    users_ahead integer,
+    total_users integer
+)
+language sql
+stable
+as $$
+    select u.id, u.username, u.avatar, coalesce(u.score, 0), u.created_at,
+           s.higher_scores + 1, s.users_ahead, s.total_users
+    from public.users u
+    cross join lateral (
+        select count(distinct h.score) filter (where h.score > coalesce(u.score, 0))::integer as higher_scores,
+               count(*) filter (where h.score > coalesce(u.score, 0))::integer as users_ahead,
+               count(*)::integer as total_users
+        from public.users h
+    ) s
+    where u.id = p_user_id;
+$$;
+
+-- Where a user with p_score would stand, whether or not anyone has that score.
+create or replace function public.leaderboard_rank_for_score(p_score integer)
+returns table (
+    "position" integer,
+    users_ahead integer,
+    total_users integer
+)
+language sql
+stable
+as $$
+    select count(distinct h.score) filter (where h.score > p_score)::integer + 1,
+           count(*) filter (where h.score > p_score)::integer,
+           count(*)::integer
+    from public.users h;
+$$;
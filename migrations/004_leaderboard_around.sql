@@ -0,0 +1,65 @@
+-- The caller plus up to p_radius users above and below them, for
+-- /api/leaderboard/around-me. Uses the same ordering and dense positions as
+-- leaderboard_page; returns no rows if the user does not exist.
+
+create or replace function public.leaderboard_around(p_user_id uuid, p_radius integer)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz,
+    "position" integer
+)
+language sql
+stable
+as $$
+    with me as (
+        select u.id, coalesce(u.score, 0) as score, u.created_at
+        from public.users u
+        where u.id = p_user_id
+    ),
+    win as (
+        (
+            select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+            from public.users u, me
+            where u.score >= me.score
+              and (
+                  u.score > me.score
+                  or u.created_at < me.created_at
+                  or (u.created_at = me.created_at and u.id < me.id)
+              )
+            order by u.score asc, u.created_at desc, u.id desc
+            limit greatest(p_radius, 0)
+        )
+        union all
+        (
+            select u.id, u.username, u.avatar, coalesce(u.score, 0), u.created_at
+            from public.users u
+            join me on me.id = u.id
+        )
+        union all
+        (
+            select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+            from public.users u, me
+            where u.score <= me.score
+              and (
+                  u.score < me.score
+                  or u.created_at > me.created_at
+                  or (u.created_at = me.created_at and u.id > me.id)
+              )
+            order by u.score desc, u.created_at asc, u.id asc
+            limit greatest(p_radius, 0)
+        )
+    ),
+    base as (
+        select count(distinct h.score)::integer as higher
+        from public.users h
+        where h.score > (select max(w.score) from win w)
+    )
+    select w.id, w.username, w.avatar, w.score, w.created_at,
+           (base.higher + dense_rank() over (order by w.score desc))::integer
+    from win w
+    cross join base
+    order by w.score desc, w.created_at asc, w.id asc;
+$$;
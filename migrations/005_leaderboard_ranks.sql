@@ -0,0 +1,32 @@
+-- Global and in-group dense ranks for a set of users, for
+-- POST /api/leaderboard/ranks. One pass over distinct scores ranks them all.
+
+create or replace function public.leaderboard_ranks(p_user_ids uuid[])
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz,
+    "position" integer,
+    group_position integer
+)
+language sql
+stable
+as $$
+    with distinct_scores as (
+        select distinct coalesce(h.score, 0) as score
+        from public.users h
+    ),
+    global_ranks as (
+        select d.score, dense_rank() over (order by d.score desc)::integer as "position"
+        from distinct_scores d
+    )
+    select u.id, u.username, u.avatar, coalesce(u.score, 0), u.created_at,
+           g."position",
+           (dense_rank() over (order by coalesce(u.score, 0) desc))::integer
+    from public.users u
+    join global_ranks g on g.score = coalesce(u.score, 0)
+    where u.id = any(p_user_ids)
+    order by u.score desc, u.created_at asc, u.id asc;
+$$;
@@ -0,0 +1,28 @@
+-- Publish every score change on the leaderboard_score_changes channel so the
+-- API's live leaderboard hub (LEADERBOARD_EVENTS_SOURCE=postgres) can LISTEN.
+
+create or replace function public.notify_leaderboard_score_change()
+returns trigger
+language plpgsql
+as $$
+begin
+    perform pg_notify(
+        'leaderboard_score_changes',
+        json_build_object(
+            'id', new.id,
+            'username', new.username,
+            'avatar', new.avatar,
+            'score', coalesce(new.score, 0),
+            'created_at', new.created_at
+        )::text
+    );
+    return new;
+end;
+$$;
+
+drop trigger if exists users_leaderboard_notify on public.users;
+
+create trigger users_leaderboard_notify
+after insert or update of score, username, avatar on public.users
+for each row
+execute function public.notify_leaderboard_score_change();
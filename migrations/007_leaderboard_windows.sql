@@ -0,0 +1,78 @@
+-- Daily score buckets for the day/week leaderboards.
+-- A trigger on users adds each score change to the current UTC day's bucket,
+-- so windowed totals are a sum over at most seven small buckets per user.
+
+create table if not exists public.user_score_buckets (
+    user_id uuid not null references public.users (id) on delete cascade,
+    bucket_day date not null,
+    points integer not null default 0,
+    primary key (user_id, bucket_day)
+);
+
+create index if not exists user_score_buckets_day_idx on public.user_score_buckets (bucket_day);
+
+create or replace function public.bucket_leaderboard_score_change()
+returns trigger
+language plpgsql
+as $$
+declare
+    delta integer;
+begin
+    if tg_op = 'INSERT' then
+        delta := coalesce(new.score, 0);
+    else
+        delta := coalesce(new.score, 0) - coalesce(old.score, 0);
+    end if;
+
+    if delta <> 0 then
+        insert into public.user_score_buckets (user_id, bucket_day, points)
+        values (new.id, (now() at time zone 'utc')::date, delta)
+        on conflict (user_id, bucket_day)
+        do update set points = public.user_score_buckets.points + excluded.points;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists users_score_buckets on public.users;
+
+create trigger users_score_buckets
+after insert or update of score on public.users
+for each row
+execute function public.bucket_leaderboard_score_change();
+
+-- Per-user totals since p_since, shaped like users rows, for loading a windowed board.
+create or replace function public.leaderboard_window_scores(p_since date)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz
+)
+language sql
+stable
+as $$
+    select u.id, u.username, u.avatar, t.points, u.created_at
+    from (
+        select b.user_id, sum(b.points)::integer as points
+        from public.user_score_buckets b
+        where b.bucket_day >= p_since
+        group by b.user_id
+    ) t
+    join public.users u on u.id = t.user_id
+    where t.points > 0;
+$$;
+
+-- Drop buckets that no window can reach any more.
+create or replace function public.compact_score_buckets(p_keep_days integer)
+returns integer
+language sql
+as $$
+    with deleted as (
+        delete from public.user_score_buckets
+        where bucket_day < (now() at time zone 'utc')::date - p_keep_days
+        returning 1
+    )
+    select count(*)::integer from deleted;
+$$;
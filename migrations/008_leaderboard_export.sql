@@ -0,0 +1,33 @@
+-- Ordered export reads for /api/leaderboard/export. Returns up to p_limit
+-- users after the row keyed by (p_score, p_created_at, p_id), or from the
+-- top when p_id is null, in (score desc, created_at asc, id asc) order.
+-- No positions: the exporter walks the whole board in order and assigns
+-- dense positions as it goes, so no chunk has to count the rows above it.
+
+create or replace function public.leaderboard_export_chunk(
+    p_score integer,
+    p_created_at timestamptz,
+    p_id uuid,
+    p_limit integer
+)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz
+)
+language sql
+stable
+as $$
+    select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+    from public.users u
+    where p_id is null
+       or u.score < p_score
+       or (
+           u.score = p_score
+           and (u.created_at > p_created_at or (u.created_at = p_created_at and u.id > p_id))
+       )
+    order by u.score desc, u.created_at asc, u.id asc
+    limit greatest(p_limit, 0);
+$$;
@@ -0,0 +1,8 @@
+-- migrate:no-transaction
+-- Index the leaderboard ordering so every ranking RPC reads users in
+-- (score desc, created_at asc, id asc) order instead of sorting the table.
+-- Its leading score column also serves the "score > x" counts behind dense
+-- ranks. Built concurrently so applying it does not block score writes.
+
+create index concurrently if not exists users_leaderboard_order_idx
+    on public.users (score desc, created_at asc, id asc);
@@ -0,0 +1,17 @@
+-- Revoked access tokens, by jti or Supabase session id, read by every
+-- worker's revocation list (revocation.py, AUTH_REVOCATION_SOURCE=supabase).
+-- Rows past expires_at can no longer match a valid token and are deleted
+-- by the sync that finds them.
+
+create table if not exists public.revoked_tokens (
+    token_id text primary key,
+    kind text not null check (kind in ('jti', 'session')),
+    user_id uuid,
+    expires_at timestamptz not null,
+    revoked_at timestamptz not null default now()
+);
+
+create index if not exists revoked_tokens_expires_at_idx on public.revoked_tokens (expires_at);
+
+-- Only the service role (which bypasses RLS) may read or write the list
+alter table public.revoked_tokens enable row level security;
@@ -0,0 +1,23 @@
+-- Stamp every users row with the time it last changed, so each worker's rank
+-- index (rank_index.py) can re-read only the rows changed since its last
+-- refresh instead of the whole table.
+
+alter table public.users
+    add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.touch_users_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists users_touch_updated_at on public.users;
+
+create trigger users_touch_updated_at
+before update on public.users
+for each row
+execute function public.touch_users_updated_at();
@@ -0,0 +1,5 @@
+-- migrate:no-transaction
+-- Serve the rank index's "changed since" reads (011_users_updated_at.sql)
+-- from an index. Built concurrently so applying it does not block score writes.
+
+create index concurrently if not exists users_updated_at_idx on public.users (updated_at);
@@ -0,0 +1,120 @@
+-- Keep the number of users in a one-row counter, maintained by statement
+-- triggers on insert, delete and truncate, so /my-rank no longer counts the
+-- whole users table on every call. leaderboard_user_rank and
+-- leaderboard_rank_for_score now only count users with a higher score, a
+-- range of the score index (009_leaderboard_indexes.sql).
+
+create table if not exists public.leaderboard_user_count (
+    singleton boolean primary key default true check (singleton),
+    total_users bigint not null
+);
+
+alter table public.leaderboard_user_count enable row level security;
+
+drop policy if exists "leaderboard_user_count is readable" on public.leaderboard_user_count;
+
+create policy "leaderboard_user_count is readable" on public.leaderboard_user_count
+for select using (true);
+
+create or replace function public.count_users_inserted()
+returns trigger
+language plpgsql
+as $$
+begin
+    update public.leaderboard_user_count set total_users = total_users + (select count(*) from inserted);
+    return null;
+end;
+$$;
+
+create or replace function public.count_users_deleted()
+returns trigger
+language plpgsql
+as $$
+begin
+    update public.leaderboard_user_count set total_users = total_users - (select count(*) from deleted);
+    return null;
+end;
+$$;
+
+create or replace function public.count_users_truncated()
+returns trigger
+language plpgsql
+as $$
+begin
+    update public.leaderboard_user_count set total_users = 0;
+    return null;
+end;
+$$;
+
+drop trigger if exists users_count_inserted on public.users;
+drop trigger if exists users_count_deleted on public.users;
+drop trigger if exists users_count_truncated on public.users;
+
+create trigger users_count_inserted
+after insert on public.users
+referencing new table as inserted
+for each statement
+execute function public.count_users_inserted();
+
+create trigger users_count_deleted
+after delete on public.users
+referencing old table as deleted
+for each statement
+execute function public.count_users_deleted();
+
+create trigger users_count_truncated
+after truncate on public.users
+for each statement
+execute function public.count_users_truncated();
+
+-- Counted after the triggers exist: creating them locks out writes to users
+-- until this migration commits, so no insert or delete is missed or counted twice.
+insert into public.leaderboard_user_count (singleton, total_users)
+select true, count(*) from public.users
+on conflict (singleton) do update set total_users = excluded.total_users;
+
+create or replace function public.leaderboard_user_rank(p_user_id uuid)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz,
+    "position" integer,
+    users_ahead integer,
+    total_users integer
+)
+language sql
+stable
+as $$
+    select u.id, u.username, u.avatar, coalesce(u.score, 0), u.created_at,
+           s.higher_scores + 1, s.users_ahead,
+           greatest((select c.total_users from public.leaderboard_user_count c where c.singleton), s.users_ahead + 1)::integer
+    from public.users u
+    cross join lateral (
+        select count(distinct h.score)::integer as higher_scores,
+               count(*)::integer as users_ahead
+        from public.users h
+        where h.score > coalesce(u.score, 0)
+    ) s
+    where u.id = p_user_id;
+$$;
+
+create or replace function public.leaderboard_rank_for_score(p_score integer)
+returns table (
+    "position" integer,
+    users_ahead integer,
+    total_users integer
+)
+language sql
+stable
+as $$
+    select s.higher_scores + 1, s.users_ahead,
+           greatest((select c.total_users from public.leaderboard_user_count c where c.singleton), s.users_ahead)::integer
+    from (
+        select count(distinct h.score)::integer as higher_scores,
+               count(*)::integer as users_ahead
+        from public.users h
+        where h.score > p_score
+    ) s;
+$$;
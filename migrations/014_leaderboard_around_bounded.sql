@@ -0,0 +1,67 @@
+-- leaderboard_around read the users above and below the caller by walking
+-- the ordering index from the top and joining each row against the caller,
+-- so a low-ranked user cost a scan of everyone above them. The caller's key
+-- is now read through scalar subqueries, which the planner passes to the
+-- index as bounds, so each side reads only p_radius rows.
+
+create or replace function public.leaderboard_around(p_user_id uuid, p_radius integer)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz,
+    "position" integer
+)
+language sql
+stable
+as $$
+    with me as (
+        select u.id, coalesce(u.score, 0) as score, u.created_at
+        from public.users u
+        where u.id = p_user_id
+    ),
+    win as (
+        (
+            select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+            from public.users u
+            where u.score >= (select m.score from me m)
+              and (
+                  u.score > (select m.score from me m)
+                  or u.created_at < (select m.created_at from me m)
+                  or (u.created_at = (select m.created_at from me m) and u.id < p_user_id)
+              )
+            order by u.score asc, u.created_at desc, u.id desc
+            limit greatest(p_radius, 0)
+        )
+        union all
+        (
+            select u.id, u.username, u.avatar, coalesce(u.score, 0), u.created_at
+            from public.users u
+            where u.id = p_user_id
+        )
+        union all
+        (
+            select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+            from public.users u
+            where u.score <= (select m.score from me m)
+              and (
+                  u.score < (select m.score from me m)
+                  or u.created_at > (select m.created_at from me m)
+                  or (u.created_at = (select m.created_at from me m) and u.id > p_user_id)
+              )
+            order by u.score desc, u.created_at asc, u.id asc
+            limit greatest(p_radius, 0)
+        )
+    ),
+    base as (
+        select count(distinct h.score)::integer as higher
+        from public.users h
+        where h.score > (select max(w.score) from win w)
+    )
+    select w.id, w.username, w.avatar, w.score, w.created_at,
+           (base.higher + dense_rank() over (order by w.score desc))::integer
+    from win w
+    cross join base
+    order by w.score desc, w.created_at asc, w.id asc;
+$$;
@@ -0,0 +1,38 @@
+-- leaderboard_ranks ranked every distinct score in the table to look up a
+-- handful of users. Only scores at or above the lowest requested user's
+-- score can affect their ranks, so only that range of the score index is
+-- read now.
+
+create or replace function public.leaderboard_ranks(p_user_ids uuid[])
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz,
+    "position" integer,
+    group_position integer
+)
+language sql
+stable
+as $$
+    with members as (
+        select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+        from public.users u
+        where u.id = any(p_user_ids)
+    ),
+    global_ranks as (
+        select d.score, dense_rank() over (order by d.score desc)::integer as "position"
+        from (
+            select distinct h.score
+            from public.users h
+            where h.score >= (select min(m.score) from members m)
+        ) d
+    )
+    select m.id, m.username, m.avatar, m.score, m.created_at,
+           g."position",
+           (dense_rank() over (order by m.score desc))::integer
+    from members m
+    join global_ranks g on g.score = m.score
+    order by m.score desc, m.created_at asc, m.id asc;
+$$;
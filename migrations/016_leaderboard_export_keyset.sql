@@ -0,0 +1,44 @@
+-- leaderboard_export_chunk's "after this row" condition was an OR that no
+-- index can bound, so every chunk re-read the board from the top and the
+-- whole export cost O(n^2). The first chunk and the following ones are now
+-- separate branches, and the following ones bound the score index with
+-- score <= p_score, as leaderboard_keyset_page does.
+
+create or replace function public.leaderboard_export_chunk(
+    p_score integer,
+    p_created_at timestamptz,
+    p_id uuid,
+    p_limit integer
+)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz
+)
+language sql
+stable
+as $$
+    (
+        select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+        from public.users u
+        where p_id is null
+        order by u.score desc, u.created_at asc, u.id asc
+        limit greatest(p_limit, 0)
+    )
+    union all
+    (
+        select u.id, u.username, u.avatar, coalesce(u.score, 0) as score, u.created_at
+        from public.users u
+        where p_id is not null
+          and u.score <= p_score
+          and (
+              u.score < p_score
+              or u.created_at > p_created_at
+              or (u.created_at = p_created_at and u.id > p_id)
+          )
+        order by u.score desc, u.created_at asc, u.id asc
+        limit greatest(p_limit, 0)
+    );
+$$;
@@ -0,0 +1,19 @@
+-- Rank history for /api/leaderboard/my-rank/history (rank_history.py), kept
+-- across restarts. Each sample is one row of rank_history_samples; each
+-- user's positions are one bytea of zigzag varint deltas against those
+-- samples, rewritten when their position changes and after compaction.
+
+create table if not exists public.rank_history_samples (
+    seq integer primary key,
+    sampled_at timestamptz not null
+);
+
+create table if not exists public.rank_history (
+    user_id uuid primary key,
+    series bytea not null
+);
+
+-- Only the service role (which bypasses RLS) reads or writes history;
+-- users get theirs through the API
+alter table public.rank_history_samples enable row level security;
+alter table public.rank_history enable row level security;
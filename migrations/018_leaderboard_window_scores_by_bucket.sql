@@ -0,0 +1,34 @@
+-- leaderboard_window_scores hash-joined the window's totals against users,
+-- and once most users had a bucket in the window the planner built that
+-- hash from a read of all of users. Each user row is now fetched through
+-- a lateral lookup by primary key (OFFSET 0 keeps the planner from
+-- flattening it back into a plain join), so the function reads the
+-- window's buckets through user_score_buckets_day_idx and one users_pkey
+-- probe per user with points in the window, however many that is.
+
+create or replace function public.leaderboard_window_scores(p_since date)
+returns table (
+    id uuid,
+    username text,
+    avatar text,
+    score integer,
+    created_at timestamptz
+)
+language sql
+stable
+as $$
+    select u.id, u.username, u.avatar, t.points, u.created_at
+    from (
+        select b.user_id, sum(b.points)::integer as points
+        from public.user_score_buckets b
+        where b.bucket_day >= p_since
+        group by b.user_id
+    ) t
+    cross join lateral (
+        select users.id, users.username, users.avatar, users.created_at
+        from public.users
+        where users.id = t.user_id
+        offset 0
+    ) u
+    where t.points > 0;
+$$;
@@ -0,0 +1,24 @@
+-- Carry the score a user had before the change in each notification, so a
+-- listener with no copy of the board (LEADERBOARD_BACKEND=database) can
+-- still roll the change into the day and week windows. It is null for new
+-- users.
+
+create or replace function public.notify_leaderboard_score_change()
+returns trigger
+language plpgsql
+as $$
+begin
+    perform pg_notify(
+        'leaderboard_score_changes',
+        json_build_object(
+            'id', new.id,
+            'username', new.username,
+            'avatar', new.avatar,
+            'score', coalesce(new.score, 0),
+            'created_at', new.created_at,
+            'previous_score', case when tg_op = 'UPDATE' then coalesce(old.score, 0) end
+        )::text
+    );
+    return new;
+end;
+$$;
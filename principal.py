@@ -0,0 +1,88 @@
+"""
+The authenticated caller
+One immutable Principal is built per verified token and shared by every
+request that presents it (the verified-token cache hands back the same
+object), so authenticating a request allocates nothing once the token is
+cached.
+"""
+
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple
+
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+
+class Principal:
+    """
+    A verified Supabase user
+
+    Holds only what routes use: the identity claims and references to the
+    decoded metadata objects (the rest of the token payload is dropped).
+    Metadata is wrapped in a read-only view on first access instead of
+    being copied up front; nested values inside it must not be mutated.
+    """
+
+    __slots__ = ("id", "email", "session_id", "jti", "created_at", "updated_at", "_user_metadata", "_app_metadata")
+
+    def __init__(self, claims: Dict[str, Any]):
+        set_ = object.__setattr__
+        set_(self, "id", claims["sub"])
+        set_(self, "email", claims.get("email"))
+        set_(self, "session_id", claims.get("session_id"))
+        set_(self, "jti", claims.get("jti"))
+        set_(self, "created_at", claims.get("iat"))  # Issued at
+        set_(self, "updated_at", claims.get("exp"))  # Expires at
+        set_(self, "_user_metadata", claims.get("user_metadata"))
+        set_(self, "_app_metadata", claims.get("app_metadata"))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("Principal is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("Principal is immutable")
+
+    def _metadata(self, slot: str) -> Mapping[str, Any]:
+        value = getattr(self, slot)
+        if isinstance(value, MappingProxyType):
+            return value
+        view = MappingProxyType(value) if isinstance(value, dict) else _EMPTY
+        object.__setattr__(self, slot, view)
+        return view
+
+    @property
+    def user_metadata(self) -> Mapping[str, Any]:
+        return self._metadata("_user_metadata")
+
+    @property
+    def app_metadata(self) -> Mapping[str, Any]:
+        return self._metadata("_app_metadata")
+
+    @property
+    def is_admin(self) -> bool:
+        # app_metadata is only writable with the service role; users can edit their own user_metadata
+        return self.app_metadata.get("role") == "admin"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The old user dict shape, for JSON responses"""
+        return {
+            "id": self.id,
+            "email": self.email,
+            "user_metadata": dict(self.user_metadata),
+            "app_metadata": dict(self.app_metadata),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def _identity(self) -> Tuple[Any, ...]:
+        # One token's identity claims; equal principals always hash alike
+        return (self.id, self.email, self.session_id, self.jti, self.created_at, self.updated_at)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Principal) and self._identity() == other._identity()
+
+    def __hash__(self) -> int:
+        return hash(self._identity())
+
+    def __repr__(self) -> str:
+        return f"Principal(id={self.id}, email={self.email})"
+
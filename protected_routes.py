@@ -3,8 +3,14 @@ Example protected routes demonstrating authentication usage
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Dict, Any, List
-from auth import get_current_user, get_current_user_optional, User
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+import time
+from auth import get_current_admin, get_current_user, get_current_user_optional, token_cache
+from config import settings
+from principal import Principal
+from jwks import get_jwks
+from revocation import get_revocation_list
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api", tags=["protected"])
@@ -17,6 +23,12 @@ class UserProfile(BaseModel):
     learning_goals: str
     created_at: str
 
+class RevocationRequest(BaseModel):
+    session_id: Optional[str] = None
+    jti: Optional[str] = None
+    user_id: Optional[str] = None
+    expires_at: Optional[float] = None  # Seconds since the epoch; defaults to now + AUTH_REVOCATION_TTL_SECONDS
+
 class LearningProgress(BaseModel):
     user_id: str
     module: str
@@ -26,65 +38,63 @@ class LearningProgress(BaseModel):
 
 # Example protected endpoint - requires authentication
 @router.get("/profile", response_model=UserProfile)
-async def get_user_profile(current_user: Dict[str, Any] = Depends(get_current_user)):
+async def get_user_profile(current_user: Principal = Depends(get_current_user)):
     """
     Get current user's profile - requires authentication
     """
     # In a real app, you'd fetch this from your database
     return UserProfile(
-        id=current_user["id"],
-        email=current_user["email"],
-        full_name=current_user.get("user_metadata", {}).get("full_name", ""),
-        learning_goals=current_user.get("user_metadata", {}).get("learning_goals", ""),
-        created_at=current_user.get("created_at", "")
+        id=current_user.id,
+        email=current_user.email,
+        full_name=current_user.user_metadata.get("full_name", ""),
+        learning_goals=current_user.user_metadata.get("learning_goals", ""),
+        created_at=current_user.created_at or ""
     )
 
-# Example protected endpoint with user object
+# Example protected endpoint with the principal's metadata
 @router.get("/my-data")
-async def get_my_data(current_user: Dict[str, Any] = Depends(get_current_user)):
+async def get_my_data(current_user: Principal = Depends(get_current_user)):
     """
     Get user-specific data - requires authentication
     """
-    user = User(current_user)
-    
     return {
-        "message": f"Hello {user.email}!",
-        "user_id": user.id,
+        "message": f"Hello {current_user.email}!",
+        "user_id": current_user.id,
         "is_authenticated": True,
-        "user_metadata": user.user_metadata
+        "user_metadata": dict(current_user.user_metadata)
     }
 
 # Example protected endpoint for learning progress
 @router.post("/progress", response_model=LearningProgress)
 async def save_learning_progress(
     progress_data: LearningProgress,
-    current_user: Dict[str, Any] = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Save learning progress - requires authentication
     """
     # Ensure the progress belongs to the authenticated user
-    if progress_data.user_id != current_user["id"]:
+    if progress_data.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Cannot save progress for another user"
         )
     
     # In a real app, you'd save this to your database
-    print(f"Saving progress for user {current_user['id']}: {progress_data}")
+    print(f"Saving progress for user {current_user.id}: {progress_data}")
     
     return progress_data
 
 # Example endpoint with optional authentication
 @router.get("/public-data")
-async def get_public_data(current_user: Dict[str, Any] = Depends(get_current_user_optional)):
+async def get_public_data(current_user: Principal = Depends(get_current_user_optional)):
     """
     Get public data - authentication optional
     """
     if current_user:
         return {
             "message": "Hello authenticated user!",
-            "user_id": current_user["id"],
+            "user_id": current_user.id,
             "is_authenticated": True
         }
     else:
@@ -95,31 +105,84 @@ async def get_public_data(current_user: Dict[str, Any] = Depends(get_current_use
 
 # Example admin-only endpoint
 @router.get("/admin/stats")
-async def get_admin_stats(current_user: Dict[str, Any] = Depends(get_current_user)):
+async def get_admin_stats(current_user: Principal = Depends(get_current_admin)):
     """
     Admin-only endpoint - requires authentication and admin role
     """
-    # Check if user has admin role (you'd implement this based on your user roles)
-    user_metadata = current_user.get("user_metadata", {})
-    if not user_metadata.get("is_admin", False):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Admin access required"
-        )
-    
     return {
         "message": "Admin statistics",
         "total_users": 1000,  # Example data
         "active_sessions": 50
     }
 
+# Verified-token cache hit ratio and memory use
+@router.get("/admin/auth-cache-stats")
+async def get_auth_cache_stats(current_user: Principal = Depends(get_current_admin)):
+    """
+    Admin-only endpoint - verified-token cache and JWKS statistics
+    """
+    jwks = get_jwks()
+    return {
+        **token_cache.snapshot(),
+        "jwks": jwks.snapshot() if jwks else None,
+        "revocations": get_revocation_list().snapshot(),
+    }
+
+async def revoke_token_id(token_id: str, kind: str, user_id: Optional[str], expires_at: float) -> None:
+    """Deny every token carrying this session id or jti until expires_at"""
+    try:
+        await run_in_threadpool(get_revocation_list().revoke, token_id, kind, user_id, expires_at)
+    except Exception as e:
+        print(f"Revocation failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Could not record the revocation"
+        )
+
+# Sign out: the presented token, and every other token of its session, stop working at once
+@router.post("/sign-out")
+async def sign_out(current_user: Principal = Depends(get_current_user)):
+    """
+    Revoke the current session - requires authentication
+    """
+    if current_user.session_id:
+        # Later tokens refreshed from the same session carry later exps
+        kind, token_id = "session", current_user.session_id
+        expires_at = time.time() + settings.auth_revocation_ttl_seconds
+    elif current_user.jti:
+        kind, token_id = "jti", current_user.jti
+        expires_at = current_user.updated_at or time.time() + settings.auth_revocation_ttl_seconds
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token has no session id or jti to revoke"
+        )
+    await revoke_token_id(token_id, kind, current_user.id, expires_at)
+    return {"revoked": kind, "expires_at": expires_at}
+
+# Revoke a leaked token (by jti) or a whole session before it expires
+@router.post("/admin/revocations")
+async def revoke(request: RevocationRequest, current_user: Principal = Depends(get_current_admin)):
+    """
+    Admin-only endpoint - add a session id or jti to the revocation list
+    """
+    if bool(request.session_id) == bool(request.jti):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Give exactly one of session_id or jti"
+        )
+    kind, token_id = ("session", request.session_id) if request.session_id else ("jti", request.jti)
+    expires_at = request.expires_at or time.time() + settings.auth_revocation_ttl_seconds
+    await revoke_token_id(token_id, kind, request.user_id, expires_at)
+    return {"revoked": kind, "token_id": token_id, "expires_at": expires_at}
+
 # Example endpoint that uses user ID for database operations
 @router.get("/my-learning-history")
-async def get_learning_history(current_user: Dict[str, Any] = Depends(get_current_user)):
+async def get_learning_history(current_user: Principal = Depends(get_current_user)):
     """
     Get user's learning history - requires authentication
     """
-    user_id = current_user["id"]
+    user_id = current_user.id
     
     # In a real app, you'd query your database with the user_id
     # Example: SELECT * FROM learning_sessions WHERE user_id = ?
@@ -0,0 +1,236 @@
+"""
+KLL quantile sketch of leaderboard scores
+Estimates how many users score above any value in O(log k) time from a
+summary of a few thousand numbers, whatever the user count. Sketches built
+by different worker processes merge into one with the same error guarantee.
+"""
+
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+import math
+import random
+import threading
+import time
+
+from config import settings
+from database import get_supabase_admin_client
+from rank_index import fetch_leaderboard_rows, get_rank_index
+from score_histogram import top_percent
+
+logger = logging.getLogger(__name__)
+
+
+class KLLSketch:
+    """
+    KLL sketch (Karnin, Lang and Liberty) over a stream of numbers
+
+    Level h holds items that each stand for 2**h inputs. When a level
+    reaches its capacity it is sorted and every other item (from a random
+    offset) is promoted to the level above, halving its size. Capacities
+    shrink geometrically towards the lower levels, so the sketch holds
+    O(k) items in total.
+    """
+
+    _C = 2.0 / 3.0
+    _MIN_CAPACITY = 2
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self._levels: List[List[float]] = [[]]
+        self._size = 0
+        self._max = self._max_size()
+        self._random = random.Random(seed)
+        self._cdf: Optional[Tuple[List[float], List[int]]] = None
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._levels) - level - 1
+        return max(int(math.ceil(self.k * self._C ** depth)), self._MIN_CAPACITY)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(h) for h in range(len(self._levels)))
+
+    def update(self, value: float) -> None:
+        self._levels[0].append(value)
+        self._size += 1
+        self.n += 1
+        self._cdf = None
+        if self._size >= self._max:
+            self._compress()
+
+    def extend(self, values: Iterable[float]) -> None:
+        # Same as update() per value, invalidating the cached CDF once at the end
+        for value in values:
+            self._levels[0].append(value)
+            self._size += 1
+            self.n += 1
+            if self._size >= self._max:
+                self._compress()
+        self._cdf = None
+
+    def _compress(self) -> None:
+        # Compact the lowest level over capacity; that always frees enough room
+        while self._size >= self._max:
+            for h, items in enumerate(self._levels):
+                if len(items) >= self._capacity(h):
+                    if h + 1 == len(self._levels):
+                        self._levels.append([])
+                        self._max = self._max_size()
+                    items.sort()
+                    # An odd item out stays behind so the promoted half has exact weight
+                    keep = [items.pop()] if len(items) % 2 else []
+                    promoted = items[self._random.randint(0, 1)::2]
+                    self._levels[h + 1].extend(promoted)
+                    self._levels[h] = keep
+                    self._size -= len(items) - len(promoted)
+                    break
+        self._cdf = None
+
+    def merge(self, other: "KLLSketch") -> None:
+        """Fold another sketch (e.g. from another worker) into this one"""
+        while len(self._levels) < len(other._levels):
+            self._levels.append([])
+        for h, items in enumerate(other._levels):
+            self._levels[h].extend(items)
+        self.n += other.n
+        self._size = sum(len(items) for items in self._levels)
+        self.k = min(self.k, other.k)
+        self._max = self._max_size()
+        self._compress()
+
+    def _weighted(self) -> Tuple[List[float], List[int]]:
+        # Sorted retained items with cumulative weights, rebuilt after writes
+        if self._cdf is None:
+            pairs = sorted((value, 1 << h) for h, items in enumerate(self._levels) for value in items)
+            self._cdf = ([value for value, _ in pairs], list(accumulate(weight for _, weight in pairs)))
+        return self._cdf
+
+    def rank(self, value: float) -> int:
+        """Estimated number of inputs less than or equal to value"""
+        values, cumulative = self._weighted()
+        i = bisect_right(values, value)
+        return cumulative[i - 1] if i else 0
+
+    def count_above(self, value: float) -> int:
+        """Estimated number of inputs strictly greater than value"""
+        return max(self.n - self.rank(value), 0)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated value at normalized rank q in [0, 1]"""
+        values, cumulative = self._weighted()
+        if not values:
+            return None
+        target = q * self.n
+        i = bisect_right(cumulative, target)
+        return values[min(i, len(values) - 1)]
+
+    def normalized_error(self) -> float:
+        """
+        Rank error as a fraction of n at 99% confidence, from the empirical
+        fit the Apache DataSketches KLL implementation publishes for its k
+        """
+        return 2.296 / self.k ** 0.9723
+
+    def rank_error(self) -> int:
+        """Rank error in users at 99% confidence"""
+        return int(math.ceil(self.normalized_error() * self.n))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly form for shipping a sketch to another process"""
+        return {"k": self.k, "n": self.n, "levels": [list(items) for items in self._levels]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KLLSketch":
+        sketch = cls(k=data["k"])
+        sketch.n = data["n"]
+        sketch._levels = [list(items) for items in data["levels"]] or [[]]
+        sketch._size = sum(len(items) for items in sketch._levels)
+        sketch._max = sketch._max_size()
+        return sketch
+
+
+class ScoreSketch:
+    """A KLL sketch of every user's score, rebuilt from the source of truth on an interval"""
+
+    def __init__(self, sketch: KLLSketch):
+        self.sketch = sketch
+        self.built_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.built_at
+
+    def estimate(self, score: int) -> Dict[str, Any]:
+        """Estimated standing of a score; positions are ordinal (ties are not collapsed)"""
+        users_ahead = self.sketch.count_above(score)
+        return {
+            "score": int(score or 0),
+            "ordinal_position": users_ahead + 1,
+            "users_ahead": users_ahead,
+            "percentile": top_percent(users_ahead, self.sketch.n),
+            "rank_error": self.sketch.rank_error(),
+            "approximate": True,
+        }
+
+
+_sketch: Optional[ScoreSketch] = None
+_sketch_lock = threading.Lock()
+# Held by the one background rebuild in flight
+_rebuild_lock = threading.Lock()
+_retry_at = 0.0
+
+
+def build_score_sketch(scores: Iterable[int]) -> KLLSketch:
+    sketch = KLLSketch(k=settings.leaderboard_sketch_k)
+    sketch.extend(scores)
+    return sketch
+
+
+def read_scores() -> Iterable[int]:
+    """Every user's score, from the rank index or a chunked read of the users table"""
+    if settings.leaderboard_backend == "database":
+        rows = fetch_leaderboard_rows(get_supabase_admin_client(), columns="id, score")
+        return (int(row.get("score") or 0) for row in rows)
+    return get_rank_index().scores()
+
+
+def _build() -> ScoreSketch:
+    sketch = ScoreSketch(build_score_sketch(read_scores()))
+    logger.info(f"Score sketch built over {sketch.sketch.n} users")
+    return sketch
+
+
+def _rebuild_in_background() -> None:
+    global _sketch, _retry_at
+    try:
+        _sketch = _build()
+    except Exception as e:
+        _retry_at = time.monotonic() + settings.leaderboard_sketch_refresh_seconds
+        logger.error(f"Score sketch rebuild failed: {e}")
+    finally:
+        _rebuild_lock.release()
+
+
+def get_score_sketch() -> ScoreSketch:
+    """
+    Return the process-wide score sketch, building it on first use
+
+    Once the sketch is older than the sketch refresh interval, one
+    background thread rebuilds it; callers keep reading the previous sketch
+    meanwhile, so only the very first call waits on the scan.
+    """
+    global _sketch
+    sketch = _sketch
+    if sketch is None:
+        with _sketch_lock:
+            if _sketch is None:
+                _sketch = _build()
+            return _sketch
+    if (sketch.age() > settings.leaderboard_sketch_refresh_seconds and time.monotonic() >= _retry_at
+            and _rebuild_lock.acquire(blocking=False)):
+        threading.Thread(target=_rebuild_in_background, name="score-sketch-rebuild", daemon=True).start()
+    return sketch
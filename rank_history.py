@@ -0,0 +1,416 @@
+"""
+Per-user rank history
+Samples every user's all-time dense position on an interval, from whichever
+leaderboard backend is configured, and keeps each user's series as one
+bytearray of zigzag varint deltas against a timeline shared by all users.
+Older samples are downsampled to one per day and then one per week, so the
+footprint is bounded by the retention settings rather than by uptime.
+
+With LEADERBOARD_HISTORY_STORE=supabase the timeline and series are also
+kept in Postgres (migrations/017), loaded at startup and written after each
+sample, so history survives restarts. Every sampler numbers its own samples,
+so only one process may write: run the store on a single worker, and leave
+the others on the default in-memory history.
+"""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import threading
+
+from starlette.concurrency import run_in_threadpool
+from config import settings
+from leaderboard_export import database_chunks
+from leaderboard_snapshots import LeaderboardSnapshot
+from rank_index import get_rank_index
+
+logger = logging.getLogger(__name__)
+
+
+def encode_varint(value: int) -> bytes:
+    """Zigzag-encode a signed int, then write it as a LEB128 varint"""
+    value = (value << 1) ^ (value >> 63)
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data: bytes, count: Optional[int] = None) -> List[int]:
+    """Decode up to count zigzag varints written by encode_varint"""
+    values: List[int] = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append((value >> 1) ^ -(value & 1))
+        if count is not None and len(values) == count:
+            break
+        value = shift = 0
+    return values
+
+
+def encode_series(start: int, positions: Iterable[int]) -> bytearray:
+    """A user's series: the first sample sequence number, then position deltas"""
+    data = bytearray(encode_varint(start))
+    previous = 0
+    for position in positions:
+        data += encode_varint(position - previous)
+        previous = position
+    return data
+
+
+def decode_series(data: bytes, count: Optional[int] = None) -> Tuple[int, List[int]]:
+    """Inverse of encode_series: (start sequence number, absolute positions)"""
+    values = decode_varints(data, None if count is None else count + 1)
+    positions, total = [], 0
+    for delta in values[1:]:
+        total += delta
+        positions.append(total)
+    return values[0], positions
+
+
+class RankHistory:
+    """
+    Rank series for every user
+
+    Sample sequence numbers only ever grow. A user's series covers the
+    timeline from their first sample onward; a user missing from a sample
+    (for example briefly deleted) repeats their previous position.
+
+    There is one writer (the sampler). It appends to series in place before
+    extending the timeline, and compaction swaps in a new (timeline, series)
+    pair, so readers take no lock: they read the pair once and decode only
+    as many values as the timeline they saw.
+
+    persist() writes new samples and the series of users whose position
+    changed; a stored series that stops short of the timeline means the user
+    held their last position since, and load() pads it back out.
+    """
+
+    def __init__(self, hourly_hours: int = 48, daily_days: int = 30, weekly_weeks: int = 26):
+        self.hourly = timedelta(hours=hourly_hours)
+        self.daily = timedelta(days=daily_days)
+        self.weekly = timedelta(weeks=weekly_weeks)
+        self._write_lock = threading.Lock()
+        self._state: Tuple[List[Tuple[int, datetime, str]], Dict[str, bytearray]] = ([], {})
+        self._last: Dict[str, int] = {}
+        self._next_seq = 0
+        self._compacted_on: Optional[date] = None
+        # Not yet written by persist()
+        self._unsaved_samples: List[Tuple[int, datetime]] = []
+        self._unsaved_users: Set[str] = set()
+        self._dropped_samples: Set[int] = set()
+        self._dropped_users: Set[str] = set()
+
+    def record(self, positions: Iterable[Tuple[str, int]], at: Optional[datetime] = None) -> None:
+        """Append one sample of (user_id, position) pairs taken at time at"""
+        at = at or datetime.now(timezone.utc)
+        with self._write_lock:
+            timeline, series = self._state
+            seq = self._next_seq
+            seen = set()
+            for user_id, position in positions:
+                seen.add(user_id)
+                data = series.get(user_id)
+                if data is None:
+                    series[user_id] = encode_series(seq, [position])
+                    self._unsaved_users.add(user_id)
+                else:
+                    data += encode_varint(position - self._last[user_id])
+                    if position != self._last[user_id]:
+                        self._unsaved_users.add(user_id)
+                self._last[user_id] = position
+            for user_id, data in series.items():
+                if user_id not in seen:
+                    data += b"\x00"  # zero delta: unchanged
+            timeline.append((seq, at, at.isoformat()))
+            self._unsaved_samples.append((seq, at))
+            self._next_seq += 1
+            if self._compacted_on != at.date():
+                self._compact(at)
+                self._compacted_on = at.date()
+
+    def _keep(self, timeline: List[Tuple[int, datetime, str]], now: datetime) -> List[bool]:
+        # Everything inside the hourly window, then the first sample of each
+        # UTC day, then the first of each ISO week, then nothing
+        keep, seen_days, seen_weeks = [], set(), set()
+        for _, at, _ in timeline:
+            age = now - at
+            day, week = at.date(), at.isocalendar()[:2]
+            if age <= self.hourly:
+                keep.append(True)
+            elif age <= self.hourly + self.daily:
+                keep.append(day not in seen_days)
+            elif age <= self.hourly + self.daily + self.weekly:
+                keep.append(week not in seen_weeks)
+            else:
+                keep.append(False)
+            seen_days.add(day)
+            seen_weeks.add(week)
+        return keep
+
+    def _compact(self, now: datetime) -> None:
+        timeline, series = self._state
+        keep = self._keep(timeline, now)
+        if all(keep):
+            return
+        # Sequence number of the first kept sample at or after each timeline index
+        next_kept: List[Optional[int]] = [None] * (len(timeline) + 1)
+        for i in range(len(timeline) - 1, -1, -1):
+            next_kept[i] = timeline[i][0] if keep[i] else next_kept[i + 1]
+
+        index_of = {sample[0]: i for i, sample in enumerate(timeline)}
+        compacted: Dict[str, bytearray] = {}
+        for user_id, data in series.items():
+            start, positions = decode_series(data)
+            offset = index_of[start]
+            kept = [position for i, position in enumerate(positions) if keep[offset + i]]
+            if kept:
+                compacted[user_id] = encode_series(next_kept[offset], kept)
+            else:
+                del self._last[user_id]
+                self._dropped_users.add(user_id)
+        dropped = {sample[0] for sample, kept in zip(timeline, keep) if not kept}
+        self._dropped_samples |= dropped
+        self._unsaved_samples = [sample for sample in self._unsaved_samples if sample[0] not in dropped]
+        # Every series now starts from a different sample, so all of them are rewritten
+        self._unsaved_users = set(compacted)
+        self._dropped_users -= self._unsaved_users
+        self._state = ([sample for sample, kept in zip(timeline, keep) if kept], compacted)
+        logger.info(f"Rank history compacted to {len(self._state[0])} samples")
+
+    def series(self, user_id: str, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """A user's (at, position) points within [since, until], oldest first"""
+        timeline, series = self._state
+        timeline = list(timeline)
+        data = series.get(user_id)
+        if data is None:
+            return []
+        start = decode_varints(bytes(data[:10]), 1)[0]
+        samples = [(at, iso) for seq, at, iso in timeline if seq >= start]
+        _, positions = decode_series(bytes(data), len(samples))
+        return [
+            {"at": iso, "position": position}
+            for (at, iso), position in zip(samples, positions)
+            if (since is None or at >= since) and (until is None or at <= until)
+        ]
+
+    def last_sampled_at(self) -> Optional[datetime]:
+        timeline = self._state[0]
+        return timeline[-1][1] if timeline else None
+
+    def load(self, store: "RankHistoryStore") -> None:
+        """Replace the history with the store's copy. Blocks."""
+        samples, stored = store.load()
+        samples.sort()
+        seqs = [seq for seq, _ in samples]
+        known = set(seqs)
+        series: Dict[str, bytearray] = {}
+        last: Dict[str, int] = {}
+        unsaved: Set[str] = set()
+        for user_id, data in stored.items():
+            start, positions = decode_series(data)
+            if start not in known or not positions:
+                continue
+            covered = len(seqs) - bisect_left(seqs, start)
+            if len(positions) > covered:
+                # Written before a compaction whose rewrite never landed; drop the samples it lost
+                positions = positions[:covered]
+                data = encode_series(start, positions)
+                unsaved.add(user_id)
+            series[user_id] = bytearray(data) + b"\x00" * (covered - len(positions))
+            last[user_id] = positions[-1]
+        with self._write_lock:
+            self._state = ([(seq, at, at.isoformat()) for seq, at in samples], series)
+            self._last = last
+            self._next_seq = seqs[-1] + 1 if seqs else 0
+            self._compacted_on = None
+            self._unsaved_samples, self._unsaved_users = [], unsaved
+            self._dropped_samples, self._dropped_users = set(), set()
+        logger.info(f"Rank history loaded: {len(samples)} samples, {len(series)} users")
+
+    def persist(self, store: "RankHistoryStore") -> None:
+        """Write everything recorded or compacted since the last save. Blocks; called by the one writer."""
+        with self._write_lock:
+            series = self._state[1]
+            samples = list(self._unsaved_samples)
+            changed = {user_id: bytes(series[user_id]) for user_id in self._unsaved_users if user_id in series}
+            dropped_samples, dropped_users = sorted(self._dropped_samples), sorted(self._dropped_users)
+        store.save(samples, changed, dropped_samples, dropped_users)
+        with self._write_lock:
+            self._unsaved_samples, self._unsaved_users = [], set()
+            self._dropped_samples, self._dropped_users = set(), set()
+
+    def footprint(self) -> Dict[str, Any]:
+        """Sample count, tracked users and encoded bytes, for capacity planning"""
+        with self._write_lock:
+            timeline, series = self._state
+            encoded = sum(len(data) for data in series.values())
+            return {
+                "samples": len(timeline),
+                "users": len(series),
+                "encoded_bytes": encoded,
+                "bytes_per_user": round(encoded / len(series), 2) if series else 0.0,
+            }
+
+
+class RankHistoryStore(ABC):
+    """Rank history kept across restarts. Methods block; call from a threadpool."""
+
+    @abstractmethod
+    def load(self) -> Tuple[List[Tuple[int, datetime]], Dict[str, bytes]]:
+        """Every (seq, sampled_at) sample, and user id -> encoded series"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, samples: List[Tuple[int, datetime]], series: Dict[str, bytes],
+             dropped_samples: List[int], dropped_users: List[str]) -> None:
+        """Add samples, write series (whole, replacing any stored) and delete what compaction dropped"""
+        raise NotImplementedError
+
+
+class SupabaseRankHistoryStore(RankHistoryStore):
+    """The rank_history tables (migrations/017_rank_history.sql), read and written with the service role"""
+
+    samples_table = "rank_history_samples"
+    series_table = "rank_history"
+
+    def __init__(self, chunk_size: int = 1000):
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _client():
+        from database import get_supabase_admin_client
+        return get_supabase_admin_client()
+
+    def load(self) -> Tuple[List[Tuple[int, datetime]], Dict[str, bytes]]:
+        supabase = self._client()
+        rows = supabase.table(self.samples_table).select("seq, sampled_at").execute().data or []
+        samples = [(row["seq"], datetime.fromisoformat(row["sampled_at"])) for row in rows]
+        series: Dict[str, bytes] = {}
+        last_id = None
+        while True:
+            query = supabase.table(self.series_table).select("user_id, series").order("user_id", desc=False)
+            if last_id is not None:
+                query = query.gt("user_id", last_id)
+            batch = query.limit(self.chunk_size).execute().data or []
+            for row in batch:
+                # PostgREST returns bytea in hex format, e.g. "\\x0a02"
+                series[str(row["user_id"])] = bytes.fromhex(row["series"][2:])
+            if len(batch) < self.chunk_size:
+                return samples, series
+            last_id = batch[-1]["user_id"]
+
+    def save(self, samples: List[Tuple[int, datetime]], series: Dict[str, bytes],
+             dropped_samples: List[int], dropped_users: List[str]) -> None:
+        supabase = self._client()
+        # Samples first: a series never refers to a sample that was not written
+        if samples:
+            supabase.table(self.samples_table).upsert(
+                [{"seq": seq, "sampled_at": at.isoformat()} for seq, at in samples]
+            ).execute()
+        rows = [{"user_id": user_id, "series": "\\x" + data.hex()} for user_id, data in series.items()]
+        for start in range(0, len(rows), self.chunk_size):
+            supabase.table(self.series_table).upsert(rows[start:start + self.chunk_size]).execute()
+        for start in range(0, len(dropped_users), self.chunk_size):
+            supabase.table(self.series_table).delete().in_("user_id", dropped_users[start:start + self.chunk_size]).execute()
+        if dropped_samples:
+            supabase.table(self.samples_table).delete().in_("seq", dropped_samples).execute()
+
+
+_history = RankHistory(
+    hourly_hours=settings.leaderboard_history_hourly_hours,
+    daily_days=settings.leaderboard_history_daily_days,
+    weekly_weeks=settings.leaderboard_history_weekly_weeks,
+)
+
+
+def get_rank_history() -> RankHistory:
+    return _history
+
+
+def current_positions() -> List[Tuple[str, int]]:
+    """Every user's all-time dense position, from the configured leaderboard backend"""
+    if settings.leaderboard_backend == "database":
+        return [
+            (str(row["id"]), row["position"])
+            for chunk in database_chunks(settings.leaderboard_export_chunk_size)
+            for row in chunk
+        ]
+    version, rows = get_rank_index().ordered_rows()
+    return list(LeaderboardSnapshot("all", version, rows).positions())
+
+
+def sample_rank_history() -> None:
+    """Record every user's current all-time dense position"""
+    _history.record(current_positions())
+
+
+class RankHistorySampler:
+    """
+    Background task that samples rank history every interval seconds
+
+    With a store, history is loaded from it before the first sample (which
+    waits out the rest of the interval since the last stored one) and saved
+    after each sample. Nothing is saved until a load has succeeded, so a
+    failed load cannot overwrite the stored history.
+    """
+
+    def __init__(self, interval: float, store: Optional[RankHistoryStore] = None):
+        self.interval = interval
+        self.store = store
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _load(self) -> None:
+        if self.store is None or self._loaded:
+            return
+        try:
+            _history.load(self.store)
+            self._loaded = True
+        except Exception as e:
+            logger.error(f"Rank history load failed: {e}")
+
+    def _sample(self) -> None:
+        self._load()
+        sample_rank_history()
+        if self._loaded:
+            _history.persist(self.store)
+
+    async def _run(self) -> None:
+        await run_in_threadpool(self._load)
+        last = _history.last_sampled_at()
+        if last is not None:
+            wait = self.interval - (datetime.now(timezone.utc) - last).total_seconds()
+            await asyncio.sleep(min(max(wait, 0), self.interval))
+        while True:
+            try:
+                await run_in_threadpool(self._sample)
+            except Exception as e:
+                logger.error(f"Rank history sample failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+rank_history_sampler = RankHistorySampler(
+    settings.leaderboard_history_interval_seconds,
+    SupabaseRankHistoryStore() if settings.leaderboard_history_store == "supabase" else None,
+)
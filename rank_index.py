@@ -0,0 +1,552 @@
+"""
+In-memory dense-rank index for the leaderboard
+Keeps every user ordered by (score desc, created_at asc, id asc) so ranks and
+pages can be answered without querying Supabase on every request
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import itertools
+import logging
+import threading
+import time
+
+from fastapi import HTTPException
+from config import settings
+from database import get_supabase_admin_client
+from leaderboard_cursor import NEXT, CursorKey, LeaderboardPage
+from score_histogram import ScoreHistogram
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_COLUMNS = "id, username, avatar, score, created_at"
+
+# Sort key for a user: (-score, created_at, id) matches the leaderboard ordering
+RankKey = Tuple[int, str, str]
+
+# Sort key for username search: (casefolded username, id)
+NameKey = Tuple[str, str]
+
+SortKey = Tuple[Any, ...]
+
+# Index versions are unique across every index in the process, so a reloaded
+# index never repeats a version an older one already handed out
+_versions = itertools.count(1)
+
+
+class _SortedKeyList:
+    """Bucketed sorted list of tuples supporting O(log n) search and positional slicing"""
+
+    _BUCKET_SIZE = 512
+
+    def __init__(self, keys: Iterable[SortKey] = ()):
+        ordered = sorted(keys)
+        size = self._BUCKET_SIZE
+        self._buckets: List[List[SortKey]] = [ordered[i:i + size] for i in range(0, len(ordered), size)]
+        self._maxes: List[SortKey] = [bucket[-1] for bucket in self._buckets]
+        self._offsets: Optional[List[int]] = None
+        self._len = len(ordered)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[SortKey]:
+        for bucket in self._buckets:
+            yield from bucket
+
+    def to_list(self) -> List[SortKey]:
+        """Every key in order, copied at C speed"""
+        return list(itertools.chain.from_iterable(self._buckets))
+
+    def _bucket_offsets(self) -> List[int]:
+        # Cumulative bucket lengths, rebuilt lazily after writes
+        if self._offsets is None:
+            offsets, total = [], 0
+            for bucket in self._buckets:
+                offsets.append(total)
+                total += len(bucket)
+            self._offsets = offsets
+        return self._offsets
+
+    def add(self, key: SortKey) -> None:
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+        else:
+            i = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+            bucket = self._buckets[i]
+            insort(bucket, key)
+            self._maxes[i] = bucket[-1]
+            if len(bucket) > 2 * self._BUCKET_SIZE:
+                half = len(bucket) // 2
+                self._buckets[i:i + 1] = [bucket[:half], bucket[half:]]
+                self._maxes[i:i + 1] = [bucket[half - 1], bucket[-1]]
+        self._len += 1
+        self._offsets = None
+
+    def remove(self, key: SortKey) -> None:
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            raise KeyError(key)
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, key)
+        if j == len(bucket) or bucket[j] != key:
+            raise KeyError(key)
+        del bucket[j]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+        self._len -= 1
+        self._offsets = None
+
+    def bisect_left(self, key: SortKey) -> int:
+        """Number of keys strictly less than key"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return self._len
+        return self._bucket_offsets()[i] + bisect_left(self._buckets[i], key)
+
+    def bisect_right(self, key: SortKey) -> int:
+        """Number of keys less than or equal to key"""
+        i = bisect_right(self._maxes, key)
+        if i == len(self._buckets):
+            return self._len
+        return self._bucket_offsets()[i] + bisect_right(self._buckets[i], key)
+
+    def slice(self, start: int, stop: int) -> List[SortKey]:
+        """Return keys in positions [start, stop)"""
+        stop = min(stop, self._len)
+        if start >= stop:
+            return []
+        offsets = self._bucket_offsets()
+        i = bisect_right(offsets, start) - 1
+        j = start - offsets[i]
+        result: List[SortKey] = []
+        while len(result) < stop - start:
+            bucket = self._buckets[i]
+            result.extend(bucket[j:j + (stop - start - len(result))])
+            i, j = i + 1, 0
+        return result
+
+
+class DenseRankIndex:
+    """
+    Dense-rank index over the users table
+
+    Scores are counted in a Fenwick-tree histogram, and users are kept in a
+    bucketed sorted list of rank keys. Dense rank, users ahead and percentile
+    of a score are histogram prefix sums; a page is a positional slice of the
+    user ordering.
+
+    version changes on every write, so anything derived from the index
+    (snapshots) can tell whether it is still current.
+
+    A searchable index also keeps users sorted by casefolded username for
+    prefix search, updated on the same writes, so a rename is picked up as
+    soon as the row is upserted.
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, Any]] = (), searchable: bool = False):
+        self._lock = threading.RLock()
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._keys = _SortedKeyList()
+        self._names: Optional[_SortedKeyList] = _SortedKeyList() if searchable else None
+        self._histogram = ScoreHistogram()
+        self.version = next(_versions)
+        self.loaded_at = 0.0
+        self.load(rows)
+
+    @staticmethod
+    def _normalize(row: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": str(row.get("id")),
+            "username": row.get("username"),
+            "avatar": row.get("avatar"),
+            "score": int(row.get("score") or 0),
+            "created_at": row.get("created_at") or "",
+        }
+
+    @staticmethod
+    def _key(row: Dict[str, Any]) -> RankKey:
+        return (-row["score"], row["created_at"], row["id"])
+
+    @staticmethod
+    def _name_key(row: Dict[str, Any]) -> Optional[NameKey]:
+        username = row["username"]
+        if not username:
+            return None
+        folded = username.casefold()
+        # Share the row's string when folding changes nothing (the usual case)
+        return (username if folded == username else folded, row["id"])
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, user_id: object) -> bool:
+        return str(user_id) in self._rows
+
+    def age(self) -> float:
+        """Seconds since the index was last loaded from the database"""
+        return time.monotonic() - self.loaded_at
+
+    def load(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Replace the index contents with the given rows"""
+        normalized = {r["id"]: r for r in (self._normalize(row) for row in rows)}
+        histogram = ScoreHistogram(row["score"] for row in normalized.values())
+        keys = _SortedKeyList(self._key(row) for row in normalized.values())
+        names = None
+        if self._names is not None:
+            names = _SortedKeyList(key for key in map(self._name_key, normalized.values()) if key)
+        with self._lock:
+            self._rows = normalized
+            self._keys = keys
+            self._names = names
+            self._histogram = histogram
+            self.version = next(_versions)
+            self.loaded_at = time.monotonic()
+
+    def sync(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Bring the index in line with a fresh set of every row, touching only
+        users that were added, changed or removed
+
+        The rows are compared against a copy of the index, so the lock is
+        only held while the differences are applied.
+
+        Returns:
+            Number of users whose entry changed
+        """
+        with self._lock:
+            current = self._rows.copy()
+        changed, seen = [], set()
+        for row in rows:
+            row = self._normalize(row)
+            seen.add(row["id"])
+            if current.get(row["id"]) != row:
+                changed.append(row)
+        return self.apply_changes(changed, [user_id for user_id in current if user_id not in seen])
+
+    def apply_changes(self, rows: Iterable[Dict[str, Any]], removed: Iterable[str] = ()) -> int:
+        """
+        Upsert rows and remove users by id in one write, marking the index as
+        freshly loaded
+
+        Returns:
+            Number of users whose entry changed
+        """
+        rows = [self._normalize(row) for row in rows]
+        changed = 0
+        with self._lock:
+            for row in rows:
+                if self._rows.get(row["id"]) != row:
+                    self._upsert(row)
+                    changed += 1
+            for user_id in removed:
+                if str(user_id) in self._rows:
+                    self._remove(str(user_id))
+                    changed += 1
+            self.loaded_at = time.monotonic()
+        return changed
+
+    def upsert(self, row: Dict[str, Any]) -> None:
+        """Insert a user or move them to their new position"""
+        row = self._normalize(row)
+        with self._lock:
+            if self._rows.get(row["id"]) != row:
+                self._upsert(row)
+
+    def remove(self, user_id: str) -> None:
+        with self._lock:
+            self._remove(str(user_id))
+
+    def _upsert(self, row: Dict[str, Any]) -> None:
+        if row["id"] in self._rows:
+            self._remove(row["id"])
+        self._rows[row["id"]] = row
+        self._keys.add(self._key(row))
+        if self._names is not None and self._name_key(row):
+            self._names.add(self._name_key(row))
+        self._histogram.add(row["score"])
+        self.version = next(_versions)
+
+    def _remove(self, user_id: str) -> None:
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return
+        self._keys.remove(self._key(row))
+        if self._names is not None and self._name_key(row):
+            self._names.remove(self._name_key(row))
+        self._histogram.add(row["score"], -1)
+        self.version = next(_versions)
+
+    def dense_rank(self, score: int) -> int:
+        """Dense rank a user with this score has (or would have)"""
+        with self._lock:
+            return self._histogram.dense_rank(score)
+
+    def rank_for_score(self, score: int) -> Dict[str, Any]:
+        """Where a user with this score would stand, whether or not anyone has it"""
+        with self._lock:
+            return {
+                "score": int(score or 0),
+                "position": self._histogram.dense_rank(score),
+                "ordinal_position": self._histogram.ordinal_rank(score),
+                "users_ahead": self._histogram.users_ahead(score),
+                "percentile": self._histogram.percentile(score),
+            }
+
+    def _ranked(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "username": row["username"],
+            "avatar": row["avatar"],
+            "score": row["score"],
+            "position": self._histogram.dense_rank(row["score"]),
+        }
+
+    def page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """Return ranked users in positions [offset, offset + limit)"""
+        with self._lock:
+            return [self._ranked(self._rows[key[2]]) for key in self._keys.slice(offset, offset + limit)]
+
+    def _page_result(self, start: int, stop: int) -> LeaderboardPage:
+        keys = self._keys.slice(max(start, 0), stop)
+        return LeaderboardPage(
+            items=[self._ranked(self._rows[key[2]]) for key in keys],
+            first_key=(-keys[0][0], keys[0][1], keys[0][2]) if keys else None,
+            last_key=(-keys[-1][0], keys[-1][1], keys[-1][2]) if keys else None,
+            has_prev=start > 0,
+            has_next=stop < len(self._keys),
+        )
+
+    def offset_page(self, offset: int, limit: int) -> LeaderboardPage:
+        """Page at a fixed offset, with the keys needed to continue by cursor"""
+        with self._lock:
+            return self._page_result(offset, offset + limit)
+
+    def keyset_page(self, direction: str, key: CursorKey, limit: int) -> LeaderboardPage:
+        """
+        Page of up to limit users directly after (NEXT) or before (PREV) the
+        cursor key, which need not belong to a user still in the index
+        """
+        rank_key = (-key[0], key[1], key[2])
+        with self._lock:
+            if direction == NEXT:
+                start = self._keys.bisect_right(rank_key)
+                return self._page_result(start, start + limit)
+            stop = self._keys.bisect_left(rank_key)
+            return self._page_result(max(stop - limit, 0), stop)
+
+    def around(self, user_id: str, radius: int) -> Optional[LeaderboardPage]:
+        """The user plus up to radius users directly above and below them, or None if unknown"""
+        with self._lock:
+            row = self._rows.get(str(user_id))
+            if not row:
+                return None
+            at = self._keys.bisect_left(self._key(row))
+            return self._page_result(max(at - radius, 0), at + radius + 1)
+
+    def search(self, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        """Ranked entries for up to limit users whose username starts with prefix (case-insensitive), by username"""
+        if self._names is None:
+            raise ValueError("Index was built without username search")
+        folded = prefix.casefold()
+        with self._lock:
+            start = self._names.bisect_left((folded, ""))
+            entries = []
+            for name, user_id in self._names.slice(start, start + limit):
+                if not name.startswith(folded):
+                    break
+                entries.append(self._ranked(self._rows[user_id]))
+            return entries
+
+    def ordered_rows(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """The current version and every row in leaderboard order"""
+        with self._lock:
+            version, keys, rows = self.version, self._keys.to_list(), self._rows.copy()
+        return version, [rows[key[2]] for key in keys]
+
+    def scores(self) -> List[int]:
+        """Every indexed user's score"""
+        with self._lock:
+            rows = list(self._rows.values())
+        return [row["score"] for row in rows]
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the ranked entry for a user, or None if unknown"""
+        with self._lock:
+            row = self._rows.get(str(user_id))
+            return self._ranked(row) if row else None
+
+    def ranks(self, user_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        Ranked entries for the known users among user_ids, in leaderboard
+        order, each with its dense group_position within that set
+        """
+        with self._lock:
+            rows = [self._rows[uid] for uid in {str(u) for u in user_ids} if uid in self._rows]
+            rows.sort(key=self._key)
+            entries, group_position, previous = [], 0, None
+            for row in rows:
+                if row["score"] != previous:
+                    group_position += 1
+                    previous = row["score"]
+                entries.append({**self._ranked(row), "group_position": group_position})
+            return entries
+
+    def standing(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Ranked entry for a user plus users_ahead and percentile"""
+        with self._lock:
+            row = self._rows.get(str(user_id))
+            if not row:
+                return None
+            entry = self._ranked(row)
+            entry["users_ahead"] = self._histogram.users_ahead(row["score"])
+            entry["percentile"] = self._histogram.percentile(row["score"])
+            return entry
+
+
+_index: Optional[DenseRankIndex] = None
+_index_lock = threading.Lock()
+# Held by the one background refresh in flight
+_refresh_lock = threading.Lock()
+# Newest updated_at the index has read; the next refresh reads rows changed since
+_watermark: Optional[datetime] = None
+_full_sync_at = 0.0
+_retry_at = 0.0
+# Called from the refresh thread after a background refresh changes any user
+_change_listeners: List[Callable[[], None]] = []
+
+# Refreshes re-read rows changed shortly before the watermark as well, so a
+# write committed after a newer one was read (or stamped by a database clock
+# behind ours) is not missed. Re-applying an unchanged row is a no-op.
+DELTA_OVERLAP = timedelta(seconds=60)
+
+
+def fetch_leaderboard_rows(supabase, chunk_size: int = 1000, columns: str = LEADERBOARD_COLUMNS) -> List[Dict[str, Any]]:
+    """Read every user row (columns must include id) in keyset-paginated chunks ordered by id"""
+    rows: List[Dict[str, Any]] = []
+    last_id = None
+    while True:
+        query = supabase.table("users").select(columns).order("id", desc=False)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        resp = query.limit(chunk_size).execute()
+
+        if not resp:
+            raise HTTPException(status_code=500, detail="Failed to query database")
+
+        if hasattr(resp, 'error') and resp.error:
+            raise HTTPException(status_code=500, detail=str(resp.error))
+
+        batch = resp.data or []
+        rows.extend(batch)
+        if len(batch) < chunk_size:
+            return rows
+        last_id = batch[-1]["id"]
+
+
+def fetch_changed_rows(supabase, since: datetime, limit: int) -> List[Dict[str, Any]]:
+    """Up to limit user rows, with updated_at, changed at or after since (migrations/011_users_updated_at.sql)"""
+    resp = (
+        supabase.table("users")
+        .select(f"{LEADERBOARD_COLUMNS}, updated_at")
+        .gte("updated_at", since.isoformat())
+        .order("updated_at", desc=False)
+        .limit(limit)
+        .execute()
+    )
+    if not resp:
+        raise HTTPException(status_code=500, detail="Failed to query database")
+    if hasattr(resp, 'error') and resp.error:
+        raise HTTPException(status_code=500, detail=str(resp.error))
+    return resp.data or []
+
+
+def _timestamp(value: Any) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def refresh_rank_index(index: DenseRankIndex) -> int:
+    """
+    Bring the index up to date with the database, returning the number of
+    users whose entry changed. Blocks.
+
+    Reads only the rows changed since the last refresh, except every
+    leaderboard_index_full_sync_seconds (which is also how deleted users
+    leave the index), when more rows changed than one read takes, or when
+    the users table has no updated_at column yet.
+    """
+    global _watermark, _full_sync_at
+    supabase = get_supabase_admin_client()
+    started = datetime.now(timezone.utc)
+    limit = settings.leaderboard_index_delta_limit
+    if _watermark is not None and time.monotonic() - _full_sync_at < settings.leaderboard_index_full_sync_seconds:
+        try:
+            rows: Optional[List[Dict[str, Any]]] = fetch_changed_rows(supabase, _watermark - DELTA_OVERLAP, limit)
+        except Exception as e:
+            logger.warning(f"Leaderboard rank index delta read failed, reading every user instead: {e}")
+            rows = None
+        if rows is not None and len(rows) < limit:
+            changed = index.apply_changes(rows)
+            if rows:
+                _watermark = max(_watermark, max(_timestamp(row["updated_at"]) for row in rows))
+            return changed
+    changed = index.sync(fetch_leaderboard_rows(supabase))
+    _watermark, _full_sync_at = started, time.monotonic()
+    return changed
+
+
+def on_rank_index_change(listener: Callable[[], None]) -> None:
+    """Call listener (from the refresh thread) whenever a background refresh changes the index"""
+    _change_listeners.append(listener)
+
+
+def _refresh_in_background(index: DenseRankIndex) -> None:
+    global _retry_at
+    try:
+        changed = refresh_rank_index(index)
+        logger.info(f"Leaderboard rank index refreshed, {changed} users changed")
+        if changed:
+            for listener in _change_listeners:
+                listener()
+    except Exception as e:
+        _retry_at = time.monotonic() + settings.leaderboard_index_refresh_seconds
+        logger.error(f"Leaderboard rank index refresh failed: {e}")
+    finally:
+        _refresh_lock.release()
+
+
+def get_rank_index() -> DenseRankIndex:
+    """
+    Return the process-wide rank index, loading it on first use
+
+    Once the index is older than the refresh interval, one background
+    thread refreshes it; callers keep reading the current contents meanwhile
+    and never wait on the database after the first load.
+    """
+    global _index, _watermark, _full_sync_at
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                started = datetime.now(timezone.utc)
+                _index = DenseRankIndex(fetch_leaderboard_rows(get_supabase_admin_client()), searchable=True)
+                _watermark, _full_sync_at = started, time.monotonic()
+                logger.info(f"Leaderboard rank index loaded with {len(_index)} users")
+            return _index
+    if (index.age() > settings.leaderboard_index_refresh_seconds and time.monotonic() >= _retry_at
+            and _refresh_lock.acquire(blocking=False)):
+        threading.Thread(target=_refresh_in_background, args=(index,), name="rank-index-refresh", daemon=True).start()
+    return index
+
+
+def current_rank_index() -> Optional[DenseRankIndex]:
+    """The rank index if it is loaded and fresh, without ever querying the database"""
+    index = _index
+    if index is None or index.age() > settings.leaderboard_index_refresh_seconds:
+        return None
+    return index
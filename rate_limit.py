@@ -0,0 +1,219 @@
+"""
+Rate limiting
+Token buckets per route and caller: a bucket holds up to N requests and
+refills at N per period, so a client can burst N at once and then sustain N
+per period. Callers are keyed by user id when the request carries a valid
+token (AuthMiddleware's result) and by client IP otherwise. Buckets live in
+this worker's memory, or in Redis (any server speaking the Redis protocol)
+so every worker shares them.
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import logging
+import math
+import re
+import threading
+import time
+
+from fastapi import HTTPException, Request, status
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(spec: str) -> Tuple[int, float]:
+    """Parse "10/minute" into (bucket capacity 10, refill of 10/60 tokens per second)"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(second|minute|hour|day)s?\s*", spec)
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"Invalid rate limit {spec!r}; expected e.g. '10/minute'")
+    capacity = int(match.group(1))
+    return capacity, capacity / PERIODS[match.group(2)]
+
+
+class RateLimiter(ABC):
+    """Token buckets keyed by string"""
+
+    @abstractmethod
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> Tuple[bool, float]:
+        """Take one token: (allowed, seconds until a token is available if not)"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Buckets in this worker's memory; the least recently used are dropped past max_keys"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> [tokens, monotonic time of last update]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(capacity), now]
+                if len(self._buckets) > self.max_keys:
+                    # A dropped bucket comes back full, so evicting only ever errs towards allowing
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_second)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0.0
+            return False, (1 - bucket[0]) / refill_per_second
+
+
+# Refill and take in one step on the server, timed by the server's clock so
+# workers with skewed clocks agree. Returns {allowed, retry_after} with
+# retry_after as a string, since Lua numbers come back truncated to integers.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+if allowed == 1 then
+    return {1, '0'}
+end
+return {0, tostring((1 - tokens) / rate)}
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Buckets shared by every worker in Redis (optional redis package)
+
+    A bucket is a hash that expires once it would have refilled. If Redis
+    cannot be reached, requests are allowed rather than failing the route.
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:", timeout: float = 0.5, max_connections: int = 20):
+        import redis.asyncio as redis
+        from redis.exceptions import NoScriptError
+        self.prefix = prefix
+        # A burst of requests queues for a few connections instead of opening one each
+        pool = redis.BlockingConnectionPool.from_url(
+            url, max_connections=max_connections, timeout=timeout,
+            socket_timeout=timeout, socket_connect_timeout=timeout,
+        )
+        self._client = redis.Redis(connection_pool=pool)
+        self._no_script = NoScriptError
+        self._sha: Optional[str] = None
+
+    async def _run_script(self, key: str, capacity: int, refill_per_second: float) -> List[bytes]:
+        # Loaded before the first EVALSHA rather than after a NOSCRIPT miss, and again if the server restarts
+        for attempt in range(2):
+            if self._sha is None:
+                self._sha = await self._client.script_load(TOKEN_BUCKET_LUA)
+            try:
+                return await self._client.evalsha(self._sha, 1, key, capacity, refill_per_second)
+            except self._no_script:
+                self._sha = None
+                if attempt:
+                    raise
+
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> Tuple[bool, float]:
+        try:
+            allowed, retry_after = await self._run_script(self.prefix + key, capacity, refill_per_second)
+        except Exception as e:
+            self._sha = None  # reload the script with the next check, in case it was lost with the connection
+            logger.error(f"Rate limit check failed, allowing request: {e}")
+            return True, 0.0
+        return bool(allowed), float(retry_after)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+        await self._client.connection_pool.disconnect()
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """The process-wide limiter for settings.rate_limit_backend (memory if redis is not installed)"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if settings.rate_limit_backend == "redis":
+                    try:
+                        _limiter = RedisRateLimiter(settings.rate_limit_redis_url)
+                    except ImportError:
+                        logger.warning("redis package not installed; rate limiting per worker instead")
+                if _limiter is None:
+                    _limiter = MemoryRateLimiter(settings.rate_limit_max_keys)
+    return _limiter
+
+
+async def close_rate_limiter() -> None:
+    global _limiter
+    if _limiter is not None:
+        await _limiter.close()
+        _limiter = None
+
+
+def client_key(request: Request) -> str:
+    """user:<id> for a request with a valid token, else ip:<address>"""
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return f"user:{user.id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class RateLimit:
+    """
+    Dependency enforcing settings.rate_limits[name]
+
+    Only routes that declare Depends(RateLimit(name)) are limited: a
+    RATE_LIMITS entry sets the limit for that name, and a new entry does
+    nothing until a route uses its name. A route whose name has no entry is
+    not limited. Over the limit, the request is rejected with 429 and a
+    Retry-After header.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._parsed: Dict[str, Tuple[int, float]] = {}
+        self.limit()  # a malformed setting fails at import, not on the first request
+
+    def limit(self) -> Optional[Tuple[int, float]]:
+        spec = settings.rate_limits.get(self.name)
+        if not spec:
+            return None
+        if spec not in self._parsed:
+            self._parsed[spec] = parse_limit(spec)
+        return self._parsed[spec]
+
+    async def __call__(self, request: Request) -> None:
+        limit = self.limit()
+        if limit is None:
+            return
+        allowed, retry_after = await get_rate_limiter().take(f"{self.name}:{client_key(request)}", *limit)
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
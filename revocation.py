@@ -0,0 +1,190 @@
+"""
+Token revocation
+A denylist of revoked token ids (jti) and Supabase session ids, checked on
+every verification, cached tokens included. Each worker holds the list in
+memory, so the check is one or two dict lookups and never a database round
+trip. The list is re-synced from a shared source in the background;
+revocations made by this worker apply immediately. Entries only live until
+the last token they could match expires, which keeps the list small.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+import asyncio
+import logging
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+from config import settings
+from principal import Principal
+
+logger = logging.getLogger(__name__)
+
+class RevocationSource(ABC):
+    """Shared store of revoked token ids -> expiry (seconds since the epoch). Methods block; call from a threadpool."""
+
+    @abstractmethod
+    def load(self) -> Dict[str, float]:
+        """Every entry that has not expired"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(self, token_id: str, kind: str, user_id: Optional[str], expires_at: float) -> None:
+        raise NotImplementedError
+
+
+class InProcessRevocationSource(RevocationSource):
+    """Revocations kept in this process only (development, or a single worker)"""
+
+    def __init__(self):
+        self._entries: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, float]:
+        now = time.time()
+        with self._lock:
+            self._entries = {token_id: exp for token_id, exp in self._entries.items() if exp > now}
+            return dict(self._entries)
+
+    def add(self, token_id: str, kind: str, user_id: Optional[str], expires_at: float) -> None:
+        with self._lock:
+            self._entries[token_id] = max(expires_at, self._entries.get(token_id, 0.0))
+
+
+class SupabaseRevocationSource(RevocationSource):
+    """The revoked_tokens table (migrations/010_revoked_tokens.sql), read with the service role"""
+
+    table = "revoked_tokens"
+
+    def __init__(self, chunk_size: int = 1000):
+        # At most PostgREST's max-rows (1000 by default), which caps every response
+        self.chunk_size = chunk_size
+
+    def load(self) -> Dict[str, float]:
+        from database import get_supabase_admin_client
+        supabase = get_supabase_admin_client()
+        now = datetime.now(timezone.utc).isoformat()
+        supabase.table(self.table).delete().lt("expires_at", now).execute()
+        entries: Dict[str, float] = {}
+        last_id = None
+        while True:
+            # Keyset-paginated on the primary key, like fetch_leaderboard_rows
+            query = supabase.table(self.table).select("token_id, expires_at").gt("expires_at", now).order("token_id")
+            if last_id is not None:
+                query = query.gt("token_id", last_id)
+            rows = query.limit(self.chunk_size).execute().data or []
+            for row in rows:
+                entries[row["token_id"]] = datetime.fromisoformat(row["expires_at"]).timestamp()
+            if len(rows) < self.chunk_size:
+                return entries
+            last_id = rows[-1]["token_id"]
+
+    def add(self, token_id: str, kind: str, user_id: Optional[str], expires_at: float) -> None:
+        from database import get_supabase_admin_client
+        get_supabase_admin_client().table(self.table).upsert({
+            "token_id": token_id,
+            "kind": kind,
+            "user_id": user_id,
+            "expires_at": datetime.fromtimestamp(expires_at, timezone.utc).isoformat(),
+        }).execute()
+
+
+class RevocationList:
+    """
+    This worker's copy of the denylist
+
+    Verification runs inline on the event loop, so the whole list is kept
+    here rather than confirming lookups against the source.
+    """
+
+    def __init__(self, source: RevocationSource, sync_interval: float):
+        self.source = source
+        self.sync_interval = sync_interval
+        # token id -> expiry; replaced wholesale on sync, added to in place by revoke()
+        self._revoked: Dict[str, float] = {}
+        self._recent: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._synced_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"syncs": 0, "sync_errors": 0, "rejections": 0}
+
+    def is_revoked(self, principal: Principal) -> bool:
+        revoked = self._revoked
+        if not revoked:
+            return False
+        for token_id in (principal.session_id, principal.jti):
+            expires_at = revoked.get(token_id)
+            if expires_at is not None and expires_at > time.time():
+                self.stats["rejections"] += 1
+                return True
+        return False
+
+    def revoke(self, token_id: str, kind: str, user_id: Optional[str], expires_at: float) -> None:
+        """Record a revocation in the shared source, then apply it here at once. Blocks."""
+        self.source.add(token_id, kind, user_id, expires_at)
+        with self._lock:
+            self._recent[token_id] = expires_at
+            self._revoked[token_id] = expires_at
+
+    def sync(self) -> None:
+        """Replace the list with the source's. Blocks."""
+        with self._lock:
+            self._recent = {}
+        try:
+            revoked = self.source.load()
+        except Exception as e:
+            self.stats["sync_errors"] += 1
+            logger.error(f"Revocation list sync failed: {e}")
+            return
+        with self._lock:
+            # Keep revocations made here while the load was in flight
+            revoked.update(self._recent)
+            self._revoked = revoked
+            self._synced_at = time.monotonic()
+            self.stats["syncs"] += 1
+
+    async def start(self) -> None:
+        """Load the list, then keep re-syncing it in the background"""
+        if self._task is not None:
+            return
+        await run_in_threadpool(self.sync)
+        if self.sync_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await run_in_threadpool(self.sync)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "entries": len(self._revoked),
+            "age_seconds": round(time.monotonic() - self._synced_at, 1) if self._synced_at else None,
+        }
+
+
+_revocations: Optional[RevocationList] = None
+_revocations_lock = threading.Lock()
+
+
+def get_revocation_list() -> RevocationList:
+    """The process-wide denylist, synced from the source named in settings"""
+    global _revocations
+    if _revocations is None:
+        with _revocations_lock:
+            if _revocations is None:
+                if settings.auth_revocation_source == "supabase":
+                    source: RevocationSource = SupabaseRevocationSource()
+                else:
+                    source = InProcessRevocationSource()
+                _revocations = RevocationList(source, sync_interval=settings.auth_revocation_sync_seconds)
+    return _revocations
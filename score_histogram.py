@@ -0,0 +1,144 @@
+"""
+Fenwick-tree score histogram
+Answers dense rank, ordinal rank, users ahead and percentile for any score in
+O(log D) time, where D is the number of distinct scores, in memory
+proportional to D however large the scores are
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+
+def top_percent(users_ahead: int, total: int) -> float:
+    """Percentage of users at or above a position, e.g. 3.0 for "top 3%" """
+    if total <= 0:
+        return 0.0
+    return round(100.0 * (users_ahead + 1) / total, 2)
+
+
+class _FenwickTree:
+    """Binary indexed tree of integer counts over slots 0..size-1"""
+
+    def __init__(self, counts: List[int]):
+        self.size = len(counts)
+        self._tree = [0] + list(counts)
+        # Linear-time construction: push each node's sum into its parent
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self._tree[parent] += self._tree[i]
+
+    def add(self, slot: int, delta: int) -> None:
+        i = slot + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, slot: int) -> int:
+        """Sum of counts in slots 0..slot (0 for a slot below 0)"""
+        i = min(slot, self.size - 1) + 1
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class ScoreHistogram:
+    """
+    Histogram of user scores backed by two Fenwick trees over the distinct
+    scores in ascending order: one counting users per score and one marking
+    which scores are present. A score is found in the trees by bisecting the
+    sorted list of scores they were built over.
+
+    A score the trees were not built over goes into a short sorted overflow
+    list, which queries scan; once that fills, the trees are rebuilt over the
+    scores currently held, in linear time.
+    """
+
+    _OVERFLOW = 64
+
+    def __init__(self, scores: Iterable[int] = ()):
+        self._counts: Dict[int, int] = dict(Counter(self._slot(score) for score in scores))
+        self._total = sum(self._counts.values())
+        self._build()
+
+    def _build(self) -> None:
+        self._keys: List[int] = sorted(self._counts)
+        self._overflow: List[int] = []
+        self._users = _FenwickTree([self._counts[score] for score in self._keys])
+        self._distinct = _FenwickTree([1] * len(self._keys))
+
+    @staticmethod
+    def _slot(score: int) -> int:
+        # Scores are never negative; clamp defensively so bad rows cannot break the ordering
+        return max(int(score or 0), 0)
+
+    def __len__(self) -> int:
+        return self._total
+
+    @property
+    def distinct(self) -> int:
+        return len(self._counts)
+
+    def add(self, score: int, delta: int = 1) -> None:
+        """Add delta users at score (negative delta removes them)"""
+        score = self._slot(score)
+        previous = self._counts.get(score, 0)
+        count = previous + delta
+        if count < 0:
+            raise ValueError(f"No users left to remove at score {score}")
+        i = bisect_left(self._keys, score)
+        if i < len(self._keys) and self._keys[i] == score:
+            if count and not previous:
+                self._distinct.add(i, 1)
+            elif not count and previous:
+                self._distinct.add(i, -1)
+            self._users.add(i, delta)
+        else:
+            j = bisect_left(self._overflow, score)
+            if j == len(self._overflow) or self._overflow[j] != score:
+                insort(self._overflow, score)
+        if count:
+            self._counts[score] = count
+        else:
+            self._counts.pop(score, None)
+        self._total += delta
+        if len(self._overflow) > self._OVERFLOW:
+            self._build()
+
+    def _at_or_below(self, score: int) -> Tuple[int, int]:
+        """(users, distinct scores) at or below score"""
+        slot = bisect_right(self._keys, score) - 1
+        users, distinct = self._users.prefix(slot), self._distinct.prefix(slot)
+        for extra in self._overflow[:bisect_right(self._overflow, score)]:
+            count = self._counts.get(extra, 0)
+            users += count
+            distinct += 1 if count else 0
+        return users, distinct
+
+    def move(self, old_score: int, new_score: int) -> None:
+        """Record one user's score changing"""
+        self.add(old_score, -1)
+        self.add(new_score, 1)
+
+    def count(self, score: int) -> int:
+        """Users with exactly this score"""
+        return self._counts.get(self._slot(score), 0)
+
+    def users_ahead(self, score: int) -> int:
+        """Users with a strictly higher score"""
+        return self._total - self._at_or_below(self._slot(score))[0]
+
+    def dense_rank(self, score: int) -> int:
+        """Dense rank of score: one more than the number of distinct higher scores"""
+        return self.distinct - self._at_or_below(self._slot(score))[1] + 1
+
+    def ordinal_rank(self, score: int) -> int:
+        """Competition rank of score: one more than the number of users ahead"""
+        return self.users_ahead(score) + 1
+
+    def percentile(self, score: int) -> float:
+        """Top-percent standing of score among all users"""
+        return top_percent(self.users_ahead(score), self._total)
@@ -0,0 +1,135 @@
+"""
+Time-windowed leaderboards (daily and weekly)
+Each window is a DenseRankIndex over the points users earned since the start
+of the current UTC day or ISO week. Totals are loaded from the daily buckets
+in migrations/007 and then rolled forward in memory from live score deltas.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+import logging
+import threading
+import time
+
+from config import settings
+from leaderboard_db import execute_rpc
+from rank_index import DenseRankIndex
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = ("day", "week", "all")
+
+
+def window_start(window: str, today: Optional[date] = None) -> date:
+    """First day (UTC) of the current window"""
+    today = today or datetime.now(timezone.utc).date()
+    if window == "day":
+        return today
+    if window == "week":
+        return today - timedelta(days=today.weekday())
+    raise ValueError(f"Unknown leaderboard window: {window}")
+
+
+class _Window:
+    def __init__(self, start: date, index: DenseRankIndex):
+        self.start = start
+        self.index = index
+
+
+class WindowedIndexes:
+    """
+    Rank indexes for the day and week windows, reloaded when a window rolls over
+
+    Loads, refreshes and compaction talk to the database without holding
+    _lock, which apply() takes from the live feed; one load or refresh per
+    window runs at a time, under that window's own lock. Only a window's
+    first load (at startup or rollover) runs on the caller's thread; a stale
+    window is re-synced in the background while callers keep reading it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows: Dict[str, _Window] = {}
+        self._loading: Dict[str, threading.Lock] = {window: threading.Lock() for window in WINDOWS}
+        # After a failed refresh, no new attempt for a window until this monotonic time
+        self._retry_at: Dict[str, float] = {window: 0.0 for window in WINDOWS}
+        self._compacted_on: Optional[date] = None
+
+    def _current(self, window: str, start: date) -> Optional[_Window]:
+        with self._lock:
+            current = self._windows.get(window)
+        return current if current is not None and current.start == start else None
+
+    def get(self, window: str) -> DenseRankIndex:
+        """Return the index for a window, (re)loading it on first use, rollover or expiry"""
+        start = window_start(window)
+        current = self._current(window, start)
+        if current is not None:
+            if (current.index.age() > settings.leaderboard_index_refresh_seconds
+                    and time.monotonic() >= self._retry_at[window] and self._loading[window].acquire(False)):
+                threading.Thread(
+                    target=self._refresh_in_background, args=(window, current),
+                    name=f"{window}-window-refresh", daemon=True,
+                ).start()
+            return current.index
+        with self._loading[window]:
+            current = self._current(window, start)
+            if current is None:
+                self._compact()
+                rows = execute_rpc("leaderboard_window_scores", {"p_since": start.isoformat()})
+                current = _Window(start, DenseRankIndex(rows))
+                with self._lock:
+                    self._windows[window] = current
+                logger.info(f"Loaded {window} leaderboard from {start} with {len(current.index)} users")
+            return current.index
+
+    def _refresh_in_background(self, window: str, current: _Window) -> None:
+        # Runs with self._loading[window] held; failures keep the stale index and back off
+        try:
+            changed = current.index.sync(execute_rpc("leaderboard_window_scores", {"p_since": current.start.isoformat()}))
+            logger.info(f"Refreshed {window} leaderboard, {changed} users changed")
+        except Exception as e:
+            self._retry_at[window] = time.monotonic() + settings.leaderboard_index_refresh_seconds
+            logger.error(f"Refresh of the {window} leaderboard failed: {e}")
+        finally:
+            self._loading[window].release()
+
+    def _compact(self) -> None:
+        # Expired buckets are dropped once per day, the first time any window reloads
+        today = datetime.now(timezone.utc).date()
+        if self._compacted_on == today:
+            return
+        try:
+            removed = execute_rpc("compact_score_buckets", {"p_keep_days": settings.leaderboard_window_keep_days})
+            logger.info(f"Compacted score buckets: {removed}")
+            self._compacted_on = today
+        except Exception as e:
+            logger.error(f"Score bucket compaction failed: {e}")
+
+    def apply(self, row: Dict[str, Any], delta: int) -> None:
+        """Add a live score delta for the user in row to every loaded window"""
+        if not delta:
+            return
+        with self._lock:
+            for window, current in list(self._windows.items()):
+                if current.start != window_start(window):
+                    # Rolled over; the next read reloads from the buckets
+                    del self._windows[window]
+                    continue
+                entry = current.index.get(row["id"])
+                points = (entry["score"] if entry else 0) + delta
+                if points > 0:
+                    current.index.upsert({**row, "score": points})
+                else:
+                    current.index.remove(row["id"])
+
+
+_windows = WindowedIndexes()
+
+
+def get_window_index(window: str) -> DenseRankIndex:
+    return _windows.get(window)
+
+
+def apply_score_delta(row: Dict[str, Any], delta: int) -> None:
+    _windows.apply(row, delta)
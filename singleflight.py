@@ -0,0 +1,57 @@
+"""
+Single-flight request coalescing
+Concurrent callers asking for the same key share one in-flight call and its
+result (or exception) instead of each hitting the database
+"""
+
+from typing import Any, Callable, Dict, Hashable, TypeVar
+from starlette.concurrency import run_in_threadpool
+import asyncio
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls
+
+    The first caller for a key starts the blocking function in the threadpool;
+    callers arriving while it runs await the same task. A caller that is
+    cancelled (client disconnect) does not cancel the shared call.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.stats: Dict[str, int] = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def _finished(self, key: Hashable, task: "asyncio.Future[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the exception so it is not reported as unhandled when every caller has gone
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+
+    async def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Run fn() for key, or join the call already running for key"""
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(fn))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self.stats["executions"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def snapshot(self) -> Dict[str, Any]:
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "coalesced_ratio": round(self.stats["coalesced"] / calls, 4) if calls else 0.0,
+        }
@@ -0,0 +1,94 @@
+"""
+Admin-only endpoints through AuthMiddleware and get_current_admin
+
+Admin is granted by app_metadata.role, which only the service role can
+write. A user can put anything in their own user_metadata, so an is_admin
+flag there must be refused.
+"""
+
+from typing import Any, Dict
+import time
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from jose import jwt
+
+import auth
+import leaderboard_routes
+import protected_routes
+from config import settings
+from principal import Principal
+from rank_index import DenseRankIndex
+from token_cache import token_cache
+
+SECRET = "test-jwt-secret-with-at-least-32-bytes"
+
+
+def token(**claims: Any) -> Dict[str, str]:
+    now = int(time.time())
+    payload = {"aud": "authenticated", "sub": str(uuid.uuid4()), "iat": now, "exp": now + 3600,
+               "session_id": str(uuid.uuid4()), **claims}
+    return {"Authorization": f"Bearer {jwt.encode(payload, SECRET, algorithm='HS256')}"}
+
+
+ADMIN = {"app_metadata": {"provider": "email", "role": "admin"}}
+SELF_GRANTED = {"user_metadata": {"is_admin": True}, "app_metadata": {"provider": "email"}}
+PLAIN = {"app_metadata": {"provider": "email"}}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "supabase_jwt_secret", SECRET)
+    token_cache.clear()
+    app = FastAPI()
+    app.include_router(protected_routes.router)
+    app.include_router(leaderboard_routes.router)
+    app.add_middleware(auth.AuthMiddleware, skip_paths=settings.auth_skip_paths)
+    yield TestClient(app)
+    token_cache.clear()
+
+
+@pytest.mark.parametrize("claims", [SELF_GRANTED, PLAIN], ids=["user_metadata.is_admin", "no role"])
+def test_non_admins_are_refused(client, claims):
+    headers = token(**claims)
+    assert client.get("/api/admin/stats", headers=headers).status_code == 403
+    assert client.get("/api/admin/auth-cache-stats", headers=headers).status_code == 403
+    response = client.post("/api/admin/revocations", json={"session_id": str(uuid.uuid4())}, headers=headers)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Admin access required"
+
+
+def test_app_metadata_admin_is_allowed(client):
+    headers = token(**ADMIN)
+    assert client.get("/api/admin/stats", headers=headers).status_code == 200
+    session_id = str(uuid.uuid4())
+    response = client.post("/api/admin/revocations", json={"session_id": session_id}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["token_id"] == session_id
+
+
+def test_admin_role_comes_only_from_app_metadata():
+    base = {"sub": "u"}
+    assert Principal({**base, "app_metadata": {"role": "admin"}}).is_admin
+    assert not Principal({**base, "user_metadata": {"is_admin": True, "role": "admin"}}).is_admin
+    assert not Principal({**base, "app_metadata": {"role": "authenticated"}}).is_admin
+    assert not Principal(base).is_admin
+
+
+@pytest.mark.parametrize("claims", [SELF_GRANTED, PLAIN], ids=["user_metadata.is_admin", "no role"])
+def test_export_refuses_non_admins(client, claims):
+    for export_format in ("csv", "ndjson"):
+        response = client.get(f"/api/leaderboard/export?format={export_format}", headers=token(**claims))
+        assert response.status_code == 403
+        assert response.json()["detail"] == "Admin access required"
+
+
+def test_export_allows_app_metadata_admin(client, monkeypatch):
+    index = DenseRankIndex([{"id": "u1", "username": "ada", "score": 7, "created_at": "2024-01-01T00:00:00+00:00"}])
+    monkeypatch.setattr(settings, "leaderboard_backend", "index")
+    monkeypatch.setattr(leaderboard_routes, "get_rank_index", lambda: index)
+    response = client.get("/api/leaderboard/export?format=csv", headers=token(**ADMIN))
+    assert response.status_code == 200
+    assert response.text.splitlines()[1].startswith("1,u1,ada,")
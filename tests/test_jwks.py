@@ -0,0 +1,286 @@
+"""
+Asymmetric token verification against a local stand-in JWKS endpoint
+
+Tokens go through SupabaseAuth.verify_jwt_token with the process-wide key
+set pointed at an HTTP server on 127.0.0.1 whose document each test edits,
+covering RS256 and ES256 keys, a kid the cache has not seen, key rotation
+and an endpoint that cannot be reached.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from fastapi import HTTPException
+from jose import jwk, jwt
+
+import auth
+import jwks
+from config import settings
+from jwt_backends import available_backends
+from token_cache import token_cache
+
+USER_ID = "5f0c7f4e-8a4e-4c1e-9d0b-3f5c2a1b7e90"
+
+
+class SigningKey:
+    """A private key plus its public JWKS entry"""
+
+    def __init__(self, kid: str, algorithm: str):
+        self.kid, self.algorithm = kid, algorithm
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048) if algorithm == "RS256" \
+            else ec.generate_private_key(ec.SECP256R1())
+        self.private = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode()
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+        self.entry = {**jwk.construct(public_pem, algorithm).to_dict(), "kid": kid, "alg": algorithm, "use": "sig"}
+
+    def sign(self, kid: Optional[str] = None, **claims: Any) -> str:
+        now = int(time.time())
+        payload = {"aud": "authenticated", "sub": USER_ID, "iat": now, "exp": now + 3600, **claims}
+        return jwt.encode(payload, self.private, algorithm=self.algorithm, headers={"kid": kid or self.kid})
+
+
+class JWKSServer:
+    """Serves document as the JWKS and counts the requests for it"""
+
+    def __init__(self):
+        self.document: Dict[str, Any] = {"keys": []}
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = json.dumps(server.document).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/auth/v1/.well-known/jwks.json"
+        threading.Thread(target=self._httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    def publish(self, *keys: SigningKey) -> None:
+        self.document = {"keys": [key.entry for key in keys]}
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture(scope="module")
+def keys() -> Dict[str, SigningKey]:
+    return {kid: SigningKey(kid, algorithm) for kid, algorithm in
+            (("rsa-1", "RS256"), ("rsa-2", "RS256"), ("ec-1", "ES256"))}
+
+
+@pytest.fixture
+def server():
+    jwks_server = JWKSServer()
+    yield jwks_server
+    jwks_server.close()
+
+
+@pytest.fixture
+def use_jwks(monkeypatch):
+    """Install a key set for a URL as the process-wide one, wired like get_jwks()"""
+    monkeypatch.setattr(settings, "auth_token_cache_size", 1000)
+    monkeypatch.setattr(token_cache, "max_entries", 1000)
+    token_cache.clear()
+
+    def install(url: str, **options: Any) -> jwks.JWKSCache:
+        cache = jwks.JWKSCache(url, refresh_interval=600, timeout=1.0, on_keys_removed=token_cache.clear, **options)
+        monkeypatch.setattr(jwks, "_jwks", cache)
+        return cache
+
+    yield install
+    token_cache.clear()
+
+
+def verify(token: str) -> str:
+    return auth.SupabaseAuth.verify_jwt_token(token).id
+
+
+def rejection(token: str) -> str:
+    with pytest.raises(HTTPException) as raised:
+        verify(token)
+    assert raised.value.status_code == 401
+    return raised.value.detail
+
+
+async def wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.parametrize("backend", sorted(available_backends()))
+def test_rs256_and_es256_tokens_verify(keys, server, use_jwks, monkeypatch, backend):
+    monkeypatch.setattr(settings, "auth_jwt_backend", backend)
+    server.publish(keys["rsa-1"], keys["ec-1"])
+
+    async def scenario():
+        cache = use_jwks(server.url)
+        await cache.start()
+        try:
+            assert verify(keys["rsa-1"].sign()) == USER_ID
+            assert verify(keys["ec-1"].sign()) == USER_ID
+            # An RS256 token naming the EC key's kid must not be checked against a key of another type
+            assert rejection(keys["rsa-1"].sign(kid="ec-1")) == "Unknown token signing key"
+            assert rejection(keys["rsa-1"].sign(aud="anon")) == "Invalid or expired token"
+        finally:
+            await cache.stop()
+        assert server.requests == 1
+
+    asyncio.run(scenario())
+
+
+def test_unknown_kid_wakes_the_refresher(keys, server, use_jwks):
+    server.publish(keys["rsa-1"])
+
+    async def scenario():
+        cache = use_jwks(server.url, min_refresh_interval=0.0)
+        await cache.start()
+        try:
+            server.publish(keys["rsa-1"], keys["rsa-2"])
+            token = keys["rsa-2"].sign()
+            # Rejected without waiting on the network; the key arrives with the refresh it triggers
+            assert rejection(token) == "Unknown token signing key"
+            assert cache.stats["unknown_kid"] == 1
+            await wait_for(lambda: cache.stats["fetches"] == 2)
+            assert verify(token) == USER_ID
+            assert server.requests == 2
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
+
+
+def test_unknown_kids_refresh_at_most_once_per_interval(keys, server, use_jwks):
+    server.publish(keys["rsa-1"])
+
+    async def scenario():
+        cache = use_jwks(server.url, min_refresh_interval=60.0)
+        await cache.start()
+        try:
+            for n in range(5):
+                rejection(keys["rsa-2"].sign(kid=f"forged-{n}"))
+            await asyncio.sleep(0.2)
+            assert cache.stats["unknown_kid"] == 5
+            assert server.requests == 1  # the startup load only
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
+
+
+def test_rotation_retires_cached_tokens(keys, server, use_jwks):
+    server.publish(keys["rsa-1"], keys["ec-1"])
+
+    async def scenario():
+        cache = use_jwks(server.url)
+        await cache.start()
+        try:
+            old, kept = keys["rsa-1"].sign(), keys["ec-1"].sign()
+            assert verify(old) == USER_ID
+            assert verify(kept) == USER_ID
+
+            server.publish(keys["rsa-2"], keys["ec-1"])
+            await cache.refresh()
+            assert sorted(cache.snapshot()["kids"]) == ["ec-1", "rsa-2"]
+            # Dropped from the verified-token cache along with the key, not served until its exp
+            assert rejection(old) == "Unknown token signing key"
+            assert verify(kept) == USER_ID
+            assert verify(keys["rsa-2"].sign()) == USER_ID
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failed_refresh_keeps_the_previous_keys(keys, server, use_jwks):
+    server.publish(keys["rsa-1"])
+
+    async def scenario():
+        cache = use_jwks(server.url)
+        await cache.start()
+        try:
+            server.close()
+            await cache.refresh()
+            assert cache.stats["fetch_errors"] == 1
+            assert verify(keys["rsa-1"].sign()) == USER_ID
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
+
+
+def test_unreachable_endpoint_on_the_event_loop(keys, use_jwks):
+    async def scenario():
+        cache = use_jwks(f"http://127.0.0.1:{unused_port()}/jwks.json", min_refresh_interval=60.0)
+        await cache.start()  # the failed load is logged, not raised
+        try:
+            started = time.monotonic()
+            assert rejection(keys["rsa-1"].sign()) == "Unknown token signing key"
+            assert time.monotonic() - started < 0.5
+            assert cache.stats["cold_misses"] == 1
+            assert cache.stats["cold_fetches"] == 0
+            assert cache.snapshot()["age_seconds"] is None
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
+
+
+def test_cold_cache_on_the_event_loop_does_not_fetch_inline(keys, server, use_jwks):
+    server.publish(keys["rsa-1"])
+
+    async def scenario():
+        # Never started, so no key set has loaded and no refresher is running
+        cache = use_jwks(server.url, min_refresh_interval=0.0)
+        assert rejection(keys["rsa-1"].sign()) == "Unknown token signing key"
+        assert cache.stats["cold_misses"] == 1
+        assert cache.stats["cold_fetches"] == 0
+        assert server.requests == 0
+
+    asyncio.run(scenario())
+
+
+def test_unreachable_endpoint_from_a_worker_thread(keys, use_jwks):
+    cache = use_jwks(f"http://127.0.0.1:{unused_port()}/jwks.json", min_refresh_interval=60.0)
+    results: List[str] = []
+
+    def worker():
+        for _ in range(3):
+            results.append(rejection(keys["rsa-1"].sign()))
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert results == ["Unknown token signing key"] * 3
+    # One inline attempt, then no more until min_refresh_interval has passed
+    assert cache.stats["cold_fetches"] == 1
+    assert cache.stats["fetch_errors"] == 1
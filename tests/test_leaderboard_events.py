@@ -0,0 +1,66 @@
+"""
+The live leaderboard hub on the database backend reads the board through the
+ranking RPCs and never loads the in-memory rank index
+"""
+
+import pytest
+
+import leaderboard_events
+from config import settings
+from leaderboard_cursor import LeaderboardPage
+from leaderboard_events import LeaderboardHub, ScoreChangeSource
+
+
+def ranked(user_id: str, score: int, position: int):
+    return {"id": user_id, "username": user_id, "avatar": None, "score": score, "position": position}
+
+
+@pytest.fixture
+def database_backend(monkeypatch):
+    calls = {"deltas": []}
+
+    def no_index():
+        raise AssertionError("the rank index must not be loaded on the database backend")
+
+    def fetch_page(offset, limit):
+        calls["page"] = (offset, limit)
+        return LeaderboardPage(items=[ranked("a", 30, 1), ranked("b", 20, 2)], first_key=None, last_key=None,
+                               has_prev=False, has_next=True)
+
+    def fetch_ranks(user_ids):
+        calls["ranks"] = user_ids
+        return [{**ranked("b", 20, 2), "group_position": 1}]
+
+    monkeypatch.setattr(settings, "leaderboard_backend", "database")
+    monkeypatch.setattr(leaderboard_events, "get_rank_index", no_index)
+    monkeypatch.setattr(leaderboard_events.leaderboard_db, "fetch_page", fetch_page)
+    monkeypatch.setattr(leaderboard_events.leaderboard_db, "fetch_ranks", fetch_ranks)
+    monkeypatch.setattr(leaderboard_events, "apply_score_delta", lambda row, delta: calls["deltas"].append((row["id"], delta)))
+    return calls
+
+
+class NoChanges(ScoreChangeSource):
+    async def changes(self):
+        return
+        yield
+
+
+def test_read_board_uses_the_rpcs(database_backend):
+    hub = LeaderboardHub(NoChanges(), top_n=2)
+    top, entries = hub._read_board(["b", "missing"])
+    assert database_backend["page"] == (0, 2)
+    assert [entry["id"] for entry in top] == ["a", "b"]
+    assert entries == {"b": ranked("b", 20, 2), "missing": None}
+
+
+def test_apply_change_rolls_the_notified_delta_into_the_windows(database_backend):
+    LeaderboardHub._apply_change({"id": "a", "score": 30, "previous_score": 25})
+    LeaderboardHub._apply_change({"id": "new", "score": 5, "previous_score": None})
+    # Without a previous score the delta is unknown; the windows catch up on refresh instead
+    LeaderboardHub._apply_change({"id": "b", "score": 20})
+    assert database_backend["deltas"] == [("a", 5), ("new", 5)]
+
+
+def test_score_change_source_is_abstract():
+    with pytest.raises(TypeError):
+        ScoreChangeSource()
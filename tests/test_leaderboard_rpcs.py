@@ -0,0 +1,255 @@
+"""
+The leaderboard RPCs in migrations/ against the original rank computation
+
+Before the RPCs, the routes ranked users with two PostgREST reads: the page
+(or user) in (score desc, created_at asc, id asc) order, then every score
+above its top score, counted as distinct values for a dense rank. That
+computation is reproduced here with the same two queries, and every RPC must
+return the same users, in the same order, with the same positions. The users
+table is seeded with heavy score ties and shared created_at values so the
+tie-breaks are exercised too.
+
+Needs asyncpg and TEST_DATABASE_URL pointing at a disposable Postgres
+database: its public schema is dropped and rebuilt from migrations/.
+Skipped otherwise.
+"""
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import os
+import random
+import uuid
+
+import pytest
+
+import migrate
+
+asyncpg = pytest.importorskip("asyncpg")
+DSN = os.getenv("TEST_DATABASE_URL", "")
+pytestmark = pytest.mark.skipif(not DSN, reason="TEST_DATABASE_URL is not set")
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+USERS = 300
+FIELDS = ("id", "username", "avatar", "score", "position")
+COLUMNS = "id, username, avatar, score, created_at"
+ORDER = "order by score desc, created_at asc, id asc"
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def seed_rows(count: int) -> List[Tuple[Any, ...]]:
+    """Users with few distinct scores and created_at values, so ties are common"""
+    rng = random.Random(3040)
+    return [
+        (
+            str(uuid.UUID(int=rng.getrandbits(128))),
+            f"user{n}",
+            None,
+            rng.choice([0, 0, 5, 10, 10, 10, 25, 40, 40, 100, 250]),
+            EPOCH + timedelta(seconds=rng.randrange(20)),
+        )
+        for n in range(count)
+    ]
+
+
+class Database:
+    """One asyncpg connection driven from synchronous tests"""
+
+    def __init__(self, dsn: str):
+        self._loop = asyncio.new_event_loop()
+        self._conn = self._loop.run_until_complete(asyncpg.connect(dsn))
+
+    def fetch(self, query: str, *args: Any) -> List[Dict[str, Any]]:
+        rows = self._loop.run_until_complete(self._conn.fetch(query, *args))
+        return [{k: str(v) if isinstance(v, uuid.UUID) else v for k, v in row.items()} for row in rows]
+
+    def execute(self, query: str, *args: Any) -> None:
+        self._loop.run_until_complete(self._conn.execute(query, *args))
+
+    def close(self) -> None:
+        self._loop.run_until_complete(self._conn.close())
+        self._loop.close()
+
+
+@pytest.fixture(scope="module")
+def db():
+    database = Database(DSN)
+    database.execute("drop schema if exists public cascade; create schema public")
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        database.execute(path.read_text(encoding="utf-8"))
+    database.execute(
+        f"insert into public.users ({COLUMNS}) "
+        "select * from unnest($1::uuid[], $2::text[], $3::text[], $4::integer[], $5::timestamptz[])",
+        *(list(column) for column in zip(*seed_rows(USERS))),
+    )
+    yield database
+    database.close()
+
+
+def baseline_page(db: Database, offset: int, limit: int) -> List[Dict[str, Any]]:
+    """The original /api/leaderboard: one read for the page, one for the scores above it"""
+    rows = db.fetch(f"select {COLUMNS} from public.users {ORDER} offset $1 limit $2", offset, limit)
+    if not rows:
+        return []
+    top_score = rows[0]["score"] or 0
+    higher = db.fetch("select score from public.users where score > $1 order by score desc", top_score)
+    base_rank = len({r["score"] for r in higher}) + 1
+    unique_scores_desc = sorted({(r["score"] or 0) for r in rows}, reverse=True)
+    score_to_offset = {score: idx for idx, score in enumerate(unique_scores_desc)}
+    return [
+        {
+            "id": r["id"],
+            "username": r["username"],
+            "avatar": r["avatar"],
+            "score": r["score"] or 0,
+            "position": base_rank + score_to_offset.get(r["score"] or 0, 0),
+        }
+        for r in rows
+    ]
+
+
+def baseline_user_rank(db: Database, user_id: str) -> Optional[Dict[str, Any]]:
+    """The original /my-rank: read the user, then every score above theirs"""
+    found = db.fetch(f"select {COLUMNS} from public.users where id = $1", user_id)
+    if not found:
+        return None
+    user_row = found[0]
+    score = user_row["score"] or 0
+    higher = db.fetch("select score from public.users where score > $1 order by score desc", score)
+    return {
+        "id": user_row["id"],
+        "username": user_row["username"],
+        "avatar": user_row["avatar"],
+        "score": score,
+        "position": len({r["score"] for r in higher}) + 1,
+    }
+
+
+@pytest.fixture(scope="module")
+def board(db) -> List[Dict[str, Any]]:
+    """Every user, ranked by the original computation, in leaderboard order"""
+    return baseline_page(db, 0, USERS)
+
+
+def items(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{field: row[field] for field in FIELDS} for row in rows]
+
+
+def sample_ids(board: List[Dict[str, Any]], count: int) -> List[str]:
+    # The first, last and a spread of users in between
+    return [row["id"] for row in board[::max(len(board) // count, 1)]] + [board[-1]["id"]]
+
+
+@pytest.mark.parametrize("offset", [0, 1, 37, 150, USERS - 10, USERS + 50])
+def test_page_matches_baseline(db, offset):
+    rows = db.fetch("select * from public.leaderboard_page($1, $2)", offset, 25)
+    assert items(rows) == baseline_page(db, offset, 25)
+
+
+def test_user_rank_matches_baseline(db, board):
+    for user_id in sample_ids(board, 40):
+        [row] = db.fetch("select * from public.leaderboard_user_rank($1)", user_id)
+        assert items([row]) == [baseline_user_rank(db, user_id)]
+
+
+def test_user_rank_unknown_user(db):
+    user_id = str(uuid.uuid4())
+    assert db.fetch("select * from public.leaderboard_user_rank($1)", user_id) == []
+    assert baseline_user_rank(db, user_id) is None
+
+
+@pytest.fixture(scope="module")
+def created(db) -> Dict[str, datetime]:
+    return {row["id"]: row["created_at"] for row in db.fetch("select id, created_at from public.users")}
+
+
+def baseline_keyset(board: List[Dict[str, Any]], created: Dict[str, datetime], key: Tuple[int, datetime, str],
+                    limit: int, forward: bool) -> List[Dict[str, Any]]:
+    """Up to limit users of the ranked board directly after (or before) a cursor key"""
+    cursor = (-key[0], key[1], key[2])
+    keyed = [((-entry["score"], created[entry["id"]], entry["id"]), entry) for entry in board]
+    if forward:
+        return [entry for rank_key, entry in keyed if rank_key > cursor][:limit]
+    before = [entry for rank_key, entry in keyed if rank_key < cursor]
+    return before[max(len(before) - limit, 0):]
+
+
+@pytest.mark.parametrize("forward", [True, False])
+def test_keyset_page_matches_baseline(db, board, created, forward):
+    for entry in board[::17] + [board[0], board[-1]]:
+        key = (entry["score"], created[entry["id"]], entry["id"])
+        result = db.fetch("select * from public.leaderboard_keyset_page($1, $2, $3, $4, $5)", *key, 20, forward)
+        assert items(result) == baseline_keyset(board, created, key, 20, forward), entry
+
+
+def test_keyset_page_from_a_removed_users_key(db, board, created):
+    entry = board[len(board) // 2]
+    missing = str(uuid.UUID(int=uuid.UUID(entry["id"]).int ^ 1))
+    assert missing not in created
+    key = (entry["score"], created[entry["id"]], missing)
+    for forward in (True, False):
+        result = db.fetch("select * from public.leaderboard_keyset_page($1, $2, $3, $4, $5)", *key, 20, forward)
+        assert items(result) == baseline_keyset(board, created, key, 20, forward)
+
+
+def test_user_rank_standing_matches_baseline(db, board):
+    for user_id in sample_ids(board, 40):
+        [row] = db.fetch("select * from public.leaderboard_user_rank($1)", user_id)
+        assert row["users_ahead"] == sum(1 for entry in board if entry["score"] > row["score"])
+        assert row["total_users"] == len(board)
+
+
+def test_rank_for_score_matches_baseline(db, board):
+    for score in (0, 3, 10, 40, 99, 100, 250, 1000):  # the route only accepts score >= 0
+        [row] = db.fetch("select * from public.leaderboard_rank_for_score($1)", score)
+        higher = [entry["score"] for entry in board if entry["score"] > score]
+        assert (row["position"], row["users_ahead"], row["total_users"]) == (
+            len(set(higher)) + 1, len(higher), len(board))
+
+
+@pytest.mark.parametrize("radius", [0, 3, 10])
+def test_around_matches_baseline(db, board, radius):
+    at = {entry["id"]: n for n, entry in enumerate(board)}
+    for user_id in sample_ids(board, 25):
+        rows = db.fetch("select * from public.leaderboard_around($1, $2)", user_id, radius)
+        expected = board[max(at[user_id] - radius, 0):at[user_id] + radius + 1]
+        assert items(rows) == items(expected), user_id
+
+
+def test_around_unknown_user(db):
+    assert db.fetch("select * from public.leaderboard_around($1, $2)", str(uuid.uuid4()), 5) == []
+
+
+def test_ranks_matches_baseline(db, board):
+    rng = random.Random(11)
+    ids = [entry["id"] for entry in board]
+    for size in (1, 2, 5, 20, 60):
+        group = rng.sample(ids, size) + [str(uuid.uuid4())]  # unknown ids are left out
+        result = db.fetch("select * from public.leaderboard_ranks($1::uuid[])", group)
+        members = [entry for entry in board if entry["id"] in group]
+        group_scores = sorted({entry["score"] for entry in members}, reverse=True)
+        assert items(result) == items(members)
+        assert [row["group_position"] for row in result] == [
+            group_scores.index(entry["score"]) + 1 for entry in members]
+
+
+def test_user_count_follows_writes(db, board):
+    """total_users comes from a trigger-maintained counter, not a count(*)"""
+    user_id = str(uuid.uuid4())
+    db.execute("insert into public.users (id, username, score) values ($1, 'late', 10)", user_id)
+    try:
+        [row] = db.fetch("select * from public.leaderboard_user_rank($1)", user_id)
+        assert row["total_users"] == len(board) + 1
+    finally:
+        db.execute("delete from public.users where id = $1", user_id)
+    [row] = db.fetch("select * from public.leaderboard_rank_for_score(0)")
+    assert row["total_users"] == len(board)
+
+
+def test_check_plans_passes_on_seeded_data(db):
+    """Every seeded user has a bucket for today, the shape that used to plan a read of all of users"""
+    db.execute("analyze")
+    results = asyncio.run(migrate.check_plans(DSN))
+    assert "leaderboard_window_scores" in results
+    assert {shape: problems for shape, problems in results.items() if problems} == {}
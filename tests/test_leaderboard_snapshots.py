@@ -0,0 +1,30 @@
+"""
+Snapshot cuts keep the top snapshot while the top of the board is unchanged
+"""
+
+from leaderboard_snapshots import SnapshotStore
+from rank_index import DenseRankIndex
+
+
+def user(i: int, score: int):
+    return {"id": f"u{i}", "username": f"user{i}", "score": score, "created_at": f"2024-01-{i + 1:02d}T00:00:00+00:00"}
+
+
+def test_top_snapshot_is_carried_while_the_top_rows_are_unchanged():
+    index = DenseRankIndex([user(i, 100 - i) for i in range(10)])
+    store = SnapshotStore(interval=0, retain=1, top_n=3)
+    first = store.current("all", index)
+    assert first.top is first
+
+    # A change below the first top_n + 1 rows cuts a new snapshot but keeps its top
+    for score in (10, 11, 12):
+        index.upsert(user(9, score))
+        later = store.current("all", index)
+        assert later is not first and later.top is first
+    # Still addressable for clients paging from a carried top page, though retain is 1
+    assert store.get(first.snapshot_id, "all") is first
+
+    index.upsert(user(8, 200))
+    moved = store.current("all", index)
+    assert moved.top is moved
+    assert moved.offset_page(0, 1).items[0]["id"] == "u8"
@@ -0,0 +1,67 @@
+"""
+Score sketch refresh: only the first build runs on the caller's thread
+"""
+
+import threading
+import time
+
+import pytest
+
+import quantile_sketch
+from config import settings
+
+
+@pytest.fixture
+def scores(monkeypatch):
+    """A score source whose reads can be held open, standing in for a full users scan"""
+    source = {"scores": list(range(100)), "release": threading.Event(), "reads": 0}
+    source["release"].set()
+
+    def read_scores():
+        source["reads"] += 1
+        source["release"].wait(5)
+        return list(source["scores"])
+
+    monkeypatch.setattr(quantile_sketch, "read_scores", read_scores)
+    monkeypatch.setattr(quantile_sketch, "_sketch", None)
+    monkeypatch.setattr(quantile_sketch, "_retry_at", 0.0)
+    monkeypatch.setattr(settings, "leaderboard_sketch_refresh_seconds", 0)
+    return source
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_stale_sketch_is_served_while_it_rebuilds(scores):
+    first = quantile_sketch.get_score_sketch()
+    assert first.sketch.n == 100 and scores["reads"] == 1
+
+    scores["scores"] = list(range(250))
+    scores["release"].clear()
+    started = time.monotonic()
+    # Stale at once (refresh interval 0): the previous sketch comes back without waiting on the read
+    assert quantile_sketch.get_score_sketch() is first
+    assert quantile_sketch.get_score_sketch() is first
+    assert time.monotonic() - started < 0.5
+    wait_for(lambda: scores["reads"] == 2)  # one rebuild, however many callers saw it stale
+
+    scores["release"].set()
+    wait_for(lambda: quantile_sketch._sketch is not first)
+    wait_for(lambda: not quantile_sketch._rebuild_lock.locked())
+    assert quantile_sketch._sketch.sketch.n == 250
+
+
+def test_failed_rebuild_keeps_the_previous_sketch(scores, monkeypatch):
+    first = quantile_sketch.get_score_sketch()
+
+    def failing_read():
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(quantile_sketch, "read_scores", failing_read)
+    assert quantile_sketch.get_score_sketch() is first
+    wait_for(lambda: not quantile_sketch._rebuild_lock.locked())
+    assert quantile_sketch._sketch is first
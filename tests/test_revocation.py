@@ -0,0 +1,87 @@
+"""
+SupabaseRevocationSource reads the whole revoked_tokens table, not just the
+first response's worth of rows
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import database
+from revocation import SupabaseRevocationSource
+
+MAX_ROWS = 4  # Stands in for PostgREST's max-rows cap on every response
+
+
+class FakeResponse:
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+        self.error = None
+
+
+class FakeTable:
+    """Just enough of the postgrest query builder, capping every response at MAX_ROWS like PostgREST does"""
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self.filters = []
+        self.deleting = False
+        self.ordered = False
+        self.max_rows = MAX_ROWS
+
+    def select(self, columns: str) -> "FakeTable":
+        return self
+
+    def delete(self) -> "FakeTable":
+        self.deleting = True
+        return self
+
+    def gt(self, column: str, value: str) -> "FakeTable":
+        self.filters.append(lambda row: row[column] > value)
+        return self
+
+    def lt(self, column: str, value: str) -> "FakeTable":
+        self.filters.append(lambda row: row[column] < value)
+        return self
+
+    def order(self, column: str) -> "FakeTable":
+        assert column == "token_id"
+        self.ordered = True
+        return self
+
+    def limit(self, n: int) -> "FakeTable":
+        self.max_rows = min(n, MAX_ROWS)
+        return self
+
+    def execute(self) -> FakeResponse:
+        matched = [row for row in self.rows if all(f(row) for f in self.filters)]
+        if self.deleting:
+            self.rows[:] = [row for row in self.rows if row not in matched]
+            return FakeResponse(matched)
+        if self.ordered:
+            matched.sort(key=lambda row: row["token_id"])
+        return FakeResponse(matched[:self.max_rows])
+
+
+class FakeClient:
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self.queries = 0
+
+    def table(self, name: str) -> FakeTable:
+        assert name == "revoked_tokens"
+        self.queries += 1
+        return FakeTable(self.rows)
+
+
+def test_load_pages_past_the_response_cap(monkeypatch):
+    now = datetime.now(timezone.utc)
+    live = {f"session-{i:02d}": now + timedelta(minutes=i + 1) for i in range(11)}
+    rows = [{"token_id": token_id, "expires_at": expires_at.isoformat()} for token_id, expires_at in live.items()]
+    rows.append({"token_id": "expired", "expires_at": (now - timedelta(minutes=1)).isoformat()})
+    client = FakeClient(rows)
+    monkeypatch.setattr(database, "get_supabase_admin_client", lambda: client)
+
+    entries = SupabaseRevocationSource(chunk_size=MAX_ROWS).load()
+    assert entries == {token_id: expires_at.timestamp() for token_id, expires_at in live.items()}
+    assert client.queries == 1 + 3  # the expired-row delete, then 4 + 4 + 3 rows
+    assert all(row["token_id"] != "expired" for row in client.rows)
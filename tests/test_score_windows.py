@@ -0,0 +1,73 @@
+"""
+Window refresh: a stale window is re-synced in the background, and only the
+first load of a window runs (and can fail) on the caller's thread
+"""
+
+import threading
+import time
+
+import pytest
+
+import score_windows
+from config import settings
+
+
+@pytest.fixture
+def rpc(monkeypatch):
+    """leaderboard_window_scores whose reads can be held open or made to fail"""
+    source = {"rows": [{"id": "u1", "username": "ada", "score": 5}], "release": threading.Event(),
+              "calls": 0, "error": None}
+    source["release"].set()
+
+    def execute_rpc(name, params):
+        if name == "compact_score_buckets":
+            return 0
+        source["calls"] += 1
+        source["release"].wait(5)
+        if source["error"]:
+            raise source["error"]
+        return list(source["rows"])
+
+    monkeypatch.setattr(score_windows, "execute_rpc", execute_rpc)
+    monkeypatch.setattr(score_windows, "_windows", score_windows.WindowedIndexes())
+    monkeypatch.setattr(settings, "leaderboard_index_refresh_seconds", 0)
+    return source
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_stale_window_is_served_while_it_refreshes(rpc):
+    index = score_windows.get_window_index("day")
+    assert len(index) == 1 and rpc["calls"] == 1
+
+    rpc["rows"].append({"id": "u2", "username": "bob", "score": 9})
+    rpc["release"].clear()
+    started = time.monotonic()
+    assert score_windows.get_window_index("day") is index
+    assert score_windows.get_window_index("day") is index
+    assert time.monotonic() - started < 0.5
+    wait_for(lambda: rpc["calls"] == 2)  # one refresh, however many callers saw it stale
+
+    rpc["release"].set()
+    wait_for(lambda: len(index) == 2)
+    assert index.get("u2")["score"] == 9
+
+
+def test_failed_refresh_keeps_the_stale_window(rpc):
+    index = score_windows.get_window_index("week")
+    rpc["error"] = RuntimeError("database unavailable")
+    assert score_windows.get_window_index("week") is index
+    wait_for(lambda: not score_windows._windows._loading["week"].locked())
+    assert score_windows._windows._retry_at["week"] > 0  # backed off
+    assert len(index) == 1
+
+
+def test_first_load_failure_raises(rpc):
+    rpc["error"] = RuntimeError("database unavailable")
+    with pytest.raises(RuntimeError):
+        score_windows.get_window_index("day")
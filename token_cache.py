@@ -0,0 +1,127 @@
+"""
+Verified-token cache
+Holds the Principals of recently verified JWTs, keyed by a keyed hash of the
+token, so a token reused across requests is only verified once. Entries are
+dropped at the token's exp, on LRU eviction, or when invalidated.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import sys
+import threading
+import time
+from types import MappingProxyType
+
+from config import settings
+from principal import Principal
+
+
+def token_digest(token: str, key: bytes) -> bytes:
+    """
+    Cache key for a token
+
+    Keyed with the verification secret, so rotating the secret orphans
+    every cached entry and raw tokens are never held in memory.
+    """
+    return hashlib.blake2b(token.encode("utf-8"), key=key, digest_size=16).digest()
+
+
+def _sizeof(value: Any) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, MappingProxyType):
+        size += _sizeof(dict(value))
+    elif isinstance(value, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_sizeof(v) for v in value)
+    elif hasattr(type(value), "__slots__"):
+        size += sum(_sizeof(getattr(value, slot, None)) for slot in type(value).__slots__)
+    return size
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of verified principals
+
+    get() never returns an entry at or past its exp; callers still apply
+    their own per-request checks (such as revocation) to cached claims.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # digest -> (exp, user id, principal, approximate bytes)
+        self._entries: "OrderedDict[bytes, Tuple[float, str, Principal, int]]" = OrderedDict()
+        self._bytes = 0
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, digest: bytes) -> Optional[Principal]:
+        """The cached principal for a token, or None on a miss or if it has expired"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry[0] <= time.time():
+                self._drop(digest)
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.stats["hits"] += 1
+            return entry[2]
+
+    def put(self, digest: bytes, principal: Principal, exp: Any, user_id: str) -> None:
+        """Cache a principal until exp (seconds since the epoch); tokens without one are not cached"""
+        if not self.enabled or not isinstance(exp, (int, float)) or exp <= time.time():
+            return
+        size = _sizeof(principal) + len(digest) + 64
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+            self._entries[digest] = (exp, user_id, principal, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _drop(self, digest: bytes) -> None:
+        self._bytes -= self._entries.pop(digest)[3]
+
+    def invalidate(self, digest: bytes) -> None:
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+                self.stats["invalidations"] += 1
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every cached token issued to a user (sign-out, ban, role change)"""
+        with self._lock:
+            for digest in [d for d, entry in self._entries.items() if entry[1] == user_id]:
+                self._drop(digest)
+                self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "approx_bytes": self._bytes,
+            }
+
+
+# Principals of recently verified tokens, shared by every auth path
+token_cache = VerifiedTokenCache(settings.auth_token_cache_size)